@@ -3,20 +3,42 @@ FastAPI Learning Platform API
 RESTful API for the AI-powered learning platform
 """
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException, status, Depends, APIRouter, Body
-from users.auth import verify_access_token
-from typing import List, Dict, Any
+from fastapi import FastAPI, HTTPException, status, Depends, APIRouter, Body, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from users.auth import verify_access_token, verify_metrics_token, jwks, token_cache
+from typing import List, Dict, Any, AsyncIterator, Iterator
 from datetime import datetime, timezone
 import logging
+import json
 import os
 
 from learning_platform import LearningPlatform
+from jobs.handlers import build_handlers
+from jobs.job_service import JobService
+from dashboard.change_feed import DashboardFeedProcessor
+from shared.prompts import prompt_versions
+from shared.llm_telemetry import get_llm_telemetry
+from shared.model_routing import get_model_router
+from shared.llm_gateway import get_llm_gateway
+from shared.llm_scheduler import get_llm_scheduler
+from shared.load_shedding import get_concurrency_limiter
+from shared.loop_watchdog import LoopWatchdogMiddleware, get_loop_watchdog
+from shared.idempotency import (
+    IdempotencyMiddleware, IdempotencyConflict, IdempotencyTimeout, IdempotentReplay,
+    get_idempotency_store
+)
+from shared.http_responses import (
+    FastJSONResponse, CompressionMiddleware,
+    if_none_match, etag_matches, not_modified, set_etag
+)
 from shared.models import (
     CreateLessonPlanRequest, LessonPlanResponse,
     LessonResponse,
     StartLessonRequest, ExpandSectionRequest, ExpandedSectionResponse,
     CompleteLessonRequest, CompletionResponse, QuizResponse,
-    StartQuizRequest, QuizSubmissionRequest, QuizResultResponse
+    StartQuizRequest, QuizSubmissionRequest, QuizResultResponse,
+    DashboardResponse,
+    Job, JobResponse
 )
 
 # Setup logging
@@ -31,7 +53,8 @@ logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(l
 app = FastAPI(
     title="Learning Platform API",
     description="AI-powered adaptive learning platform with lesson plans, quizzes, and tutoring",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS configuration
@@ -43,6 +66,10 @@ frontend_url = os.getenv("FRONTEND_URL")
 if frontend_url:
     allowed_origins.append(frontend_url)
 
+# Stores first responses to requests with an Idempotency-Key; innermost so
+# it sees uncompressed bodies
+app.add_middleware(IdempotencyMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -52,6 +79,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for large bodies such as lessons with expanded sections
+app.add_middleware(CompressionMiddleware)
+
+# Logs the blocking stack and route whenever the event loop stalls
+app.add_middleware(LoopWatchdogMiddleware)
+
 api_router = APIRouter(
     prefix="/api",
     dependencies=[Depends(verify_access_token)]
@@ -60,6 +93,88 @@ api_router = APIRouter(
 # Initialize platform
 platform = LearningPlatform()
 
+# Background jobs for long-running generation; JOB_WORKERS=0 when a
+# separate `python -m jobs.worker` process runs them instead
+job_service = JobService(build_handlers(platform))
+job_service.start_workers(int(os.getenv("JOB_WORKERS", "2")))
+
+# Folds plan, progress and quiz attempt changes into per-user dashboard summaries
+dashboard_feed = DashboardFeedProcessor(platform.dashboard)
+dashboard_feed.start()
+
+# ==================== LOAD SHEDDING ====================
+
+async def generation_slot(request: Request) -> AsyncIterator[None]:
+    """
+    Hold one of the adaptive limiter's slots for a generation request.
+
+    Requests over the limit get 503 with Retry-After instead of queueing
+    behind LLM calls that are already slow. The slot is held until the
+    response (including a stream) has been sent. Admission runs on the
+    event loop, ahead of the threadpool the (sync) generation handlers
+    run in, so an exhausted threadpool cannot hide the queue from it.
+    """
+    limiter = get_concurrency_limiter()
+    if not limiter.try_acquire(request.scope["route"].path):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Generation is busy; retry shortly or submit it as a job",
+            headers={"Retry-After": str(limiter.retry_after_seconds)}
+        )
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+# ==================== IDEMPOTENCY ====================
+
+async def idempotency_key(request: Request, claims: Dict[str, Any] = Depends(verify_access_token)) -> None:
+    """
+    Honour an Idempotency-Key header on a generation or submission request.
+
+    The first request with a key runs and its response is stored; retries
+    with the same key and body get that response back (with an
+    Idempotent-Replayed header) instead of running again, and a retry that
+    arrives while the first is still running waits for it. Keys are scoped
+    to the signed-in user and the route. Listed before generation_slot so
+    waiting and replays do not hold a generation slot.
+    """
+    key = request.headers.get("idempotency-key")
+    if not key:
+        return
+    if len(key) > 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Idempotency-Key must be at most 255 characters"
+        )
+
+    subject = claims.get("oid") or claims.get("sub") or "anonymous"
+    try:
+        record = await get_idempotency_store().begin(
+            subject, request.method, request.scope["route"].path, key, await request.body()
+        )
+    except IdempotencyConflict:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    except IdempotencyTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "5"}
+        )
+    if record is not None:
+        # Settled by IdempotencyMiddleware once the response is sent
+        request.state.idempotency = record
+
+
+@app.exception_handler(IdempotentReplay)
+async def replay_idempotent_response(request: Request, exc: IdempotentReplay):
+    return exc.response()
+
+
 # ==================== LESSON PLAN ENDPOINTS ====================
 
 @api_router.post(
@@ -67,9 +182,10 @@ platform = LearningPlatform()
     response_model=LessonPlanResponse,
     status_code=status.HTTP_201_CREATED,
     summary="Create a new lesson plan",
-    description="Generate an AI-powered lesson plan for a given subject and topic"
+    description="Generate an AI-powered lesson plan for a given subject and topic",
+    dependencies=[Depends(idempotency_key), Depends(generation_slot)]
 )
-async def create_lesson_plan(request: CreateLessonPlanRequest):
+def create_lesson_plan(request: CreateLessonPlanRequest):
     """
     Create a new lesson plan using AI.
     
@@ -107,11 +223,19 @@ async def create_lesson_plan(request: CreateLessonPlanRequest):
     "/lesson-plans/{user_id}",
     response_model=List[Dict[str, Any]],
     summary="Get all lesson plans for a user",
-    description="Retrieve all lesson plans associated with a user"
+    description="Retrieve all lesson plans associated with a user. Supports If-None-Match; "
+                "an unchanged list is answered with 304"
 )
-async def get_lesson_plans(user_id: str):
+async def get_lesson_plans(user_id: str, request: Request, response: Response):
     """Get all lesson plans for a user"""
     try:
+        # Versions come from an id/_etag projection, so a 304 never reads plan bodies.
+        # Taken before the full read, the ETag is never newer than the body it labels.
+        etag = platform.lesson_plans.get_user_lesson_plans_etag(user_id)
+        if etag_matches(if_none_match(request), etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+
         plans = platform.lesson_plans.get_user_lesson_plans(user_id)
         return [
             {
@@ -136,28 +260,37 @@ async def get_lesson_plans(user_id: str):
     "/lesson-plans/details/{plan_id}",
     response_model=LessonPlanResponse,
     summary="Get detailed lesson plan",
-    description="Retrieve full details of a specific lesson plan including all subtopics"
+    description="Retrieve full details of a specific lesson plan including all subtopics. "
+                "Supports If-None-Match; an unchanged plan is answered with 304"
 )
-async def get_lesson_plan_details(plan_id: str, user_id: str):
+async def get_lesson_plan_details(plan_id: str, user_id: str, request: Request, response: Response):
     """
     Get detailed information about a specific lesson plan.
     
     Returns the same detailed response as when creating a lesson plan,
-    including all subtopics with their concepts.
+    including all subtopics with their concepts. The ETag is the plan
+    document's Cosmos `_etag`, so revalidation is a conditional point read
+    that Cosmos answers without the body.
     
     Args:
         plan_id: The lesson plan ID
         user_id: The user ID (query parameter for authentication)
     """
     try:
-        # Get the lesson plan
-        plan = platform.lesson_plans.get_lesson_plan(user_id, plan_id)
+        tags = if_none_match(request)
+        # Cosmos takes a single etag; with several, read the plan and compare here
+        plan, etag = platform.lesson_plans.get_lesson_plan_if_changed(
+            user_id, plan_id, tags[0].removeprefix("W/") if len(tags) == 1 and tags[0] != "*" else None
+        )
         
-        if not plan:
+        if etag is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Lesson plan {plan_id} not found"
             )
+        if plan is None or etag_matches(tags, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         
         return LessonPlanResponse(
             lesson_plan_id=plan.id,
@@ -238,6 +371,9 @@ async def mark_subtopic_generated(plan_id: str, subtopic_id: str, payload: Dict[
 )
 async def delete_lesson_plan(plan_id: str, user_id: str):
     try:
+        # Stop any speculative generation for the plan
+        platform.pregeneration.cancel_plan(plan_id)
+
         # 🔥 Delete lessons first
         deleted_lessons = platform.lessons.delete_lessons_for_plan(
             user_id=user_id,
@@ -256,6 +392,9 @@ async def delete_lesson_plan(plan_id: str, user_id: str):
                 detail="Lesson plan not found"
             )
 
+        # Deletes are not in the change feed, so tell the dashboard directly
+        platform.dashboard.forget_plan(user_id, plan_id)
+
         return {
             "ok": True,
             "deletedPlanId": plan_id,
@@ -280,9 +419,10 @@ async def delete_lesson_plan(plan_id: str, user_id: str):
     response_model=LessonResponse,
     status_code=status.HTTP_201_CREATED,
     summary="Start a lesson",
-    description="Generate or retrieve lesson content for a subtopic"
+    description="Generate or retrieve lesson content for a subtopic",
+    dependencies=[Depends(idempotency_key), Depends(generation_slot)]
 )
-async def start_lesson(request: StartLessonRequest):
+def start_lesson(request: StartLessonRequest):
     """
     Start a lesson for a specific subtopic.
     
@@ -324,9 +464,10 @@ async def start_lesson(request: StartLessonRequest):
     "/lessons/expand-section",
     response_model=ExpandedSectionResponse,
     summary="Expand a lesson section",
-    description="Get more detailed content for a specific lesson section"
+    description="Get more detailed content for a specific lesson section",
+    dependencies=[Depends(idempotency_key), Depends(generation_slot)]
 )
-async def expand_section(request: ExpandSectionRequest):
+def expand_section(request: ExpandSectionRequest):
     """
     Expand a lesson section with more detailed content, examples, and explanations.
     """
@@ -354,6 +495,66 @@ async def expand_section(request: ExpandSectionRequest):
         )
 
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@api_router.post(
+    "/lessons/expand-section/stream",
+    summary="Stream a lesson section expansion",
+    description="Stream expanded content for a lesson section as Server-Sent Events",
+    dependencies=[Depends(generation_slot)]
+)
+def stream_expand_section(request: ExpandSectionRequest):
+    """
+    Expand a lesson section, streaming the text as it is generated.
+    
+    Emits `chunk` events with a `delta` field while the expansion is being
+    written, then a single `done` event carrying the full expanded content
+    (which is also persisted to the lesson). Failures after the stream has
+    started are reported as an `error` event. Concurrent requests for the
+    same section share one generation.
+    """
+    try:
+        chunks = platform.stream_expand_lesson_section(
+            user_id=request.user_id,
+            lesson_id=request.lesson_id,
+            section_id=request.section_id
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error expanding section: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to expand section: {str(e)}"
+        )
+
+    def event_stream() -> Iterator[str]:
+        expanded = []
+        try:
+            for chunk in chunks:
+                expanded.append(chunk)
+                yield _sse_event("chunk", {"delta": chunk})
+            yield _sse_event("done", {
+                "section_id": request.section_id,
+                "expanded_content": "".join(expanded)
+            })
+        except Exception as e:
+            logger.error(f"Error streaming section expansion: {e}")
+            yield _sse_event("error", {"detail": f"Failed to expand section: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @api_router.post(
     "/lessons/complete",
     response_model=CompletionResponse,
@@ -398,9 +599,10 @@ async def complete_lesson(request: CompleteLessonRequest):
     response_model=QuizResponse,
     status_code=status.HTTP_201_CREATED,
     summary="Start a quiz",
-    description="Generate a quiz for a completed lesson"
+    description="Generate a quiz for a completed lesson",
+    dependencies=[Depends(idempotency_key), Depends(generation_slot)]
 )
-async def start_quiz(request: StartQuizRequest):
+def start_quiz(request: StartQuizRequest):
     """
     Generate a quiz with questions based on the lesson content.
     
@@ -450,9 +652,10 @@ async def start_quiz(request: StartQuizRequest):
     "/quizzes/submit",
     response_model=QuizResultResponse,
     summary="Submit quiz answers",
-    description="Submit quiz responses and receive AI-graded results"
+    description="Submit quiz responses and receive AI-graded results",
+    dependencies=[Depends(idempotency_key), Depends(generation_slot)]
 )
-async def submit_quiz(request: QuizSubmissionRequest):
+def submit_quiz(request: QuizSubmissionRequest):
     """
     Submit quiz answers and receive immediate AI-powered grading.
     
@@ -492,6 +695,159 @@ async def submit_quiz(request: QuizSubmissionRequest):
         )
 
 
+# ==================== DASHBOARD ENDPOINTS ====================
+
+@api_router.get(
+    "/dashboard",
+    response_model=DashboardResponse,
+    summary="Get the user's dashboard",
+    description="Totals, per-plan completion and recommendations from the user's summary document"
+)
+async def get_dashboard(user_id: str):
+    """
+    Get the dashboard for a user.
+    
+    Served from a summary document the dashboard feed keeps up to date,
+    so this is one point read; the first request for a user builds it.
+    
+    Args:
+        user_id: The user ID (query parameter)
+    """
+    try:
+        return platform.dashboard.get_dashboard(user_id)
+    except Exception as e:
+        logger.error(f"Error retrieving dashboard: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve dashboard: {str(e)}"
+        )
+
+
+# ==================== JOB ENDPOINTS ====================
+
+def _job_response(job: Job, include_result: bool = True) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        result=job.result if include_result else None,
+        error=job.error,
+        created_at=job.createdAt.isoformat() if job.createdAt else None,
+        updated_at=job.updatedAt.isoformat() if job.updatedAt else None
+    )
+
+
+def _submit_job(user_id: str, kind: str, payload: Dict[str, Any]) -> JobResponse:
+    try:
+        return _job_response(job_service.submit(user_id, kind, payload))
+    except Exception as e:
+        logger.error(f"Error submitting {kind} job: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to submit job: {str(e)}"
+        )
+
+
+@api_router.post(
+    "/jobs/lesson-plans",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Queue lesson plan creation",
+    description="Queue lesson plan generation and return a job id to poll",
+    dependencies=[Depends(idempotency_key)]
+)
+async def submit_create_lesson_plan_job(request: CreateLessonPlanRequest):
+    """Background version of POST /api/lesson-plans"""
+    return _submit_job(request.user_id, "create_lesson_plan", request.model_dump())
+
+
+@api_router.post(
+    "/jobs/lessons/start",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Queue lesson start",
+    description="Queue lesson generation and return a job id to poll",
+    dependencies=[Depends(idempotency_key)]
+)
+async def submit_start_lesson_job(request: StartLessonRequest):
+    """Background version of POST /api/lessons/start"""
+    return _submit_job(request.user_id, "start_lesson", request.model_dump())
+
+
+@api_router.post(
+    "/jobs/quizzes/start",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Queue quiz start",
+    description="Queue quiz generation and return a job id to poll",
+    dependencies=[Depends(idempotency_key)]
+)
+async def submit_start_quiz_job(request: StartQuizRequest):
+    """Background version of POST /api/quizzes/start"""
+    return _submit_job(request.user_id, "start_quiz", request.model_dump())
+
+
+@api_router.post(
+    "/jobs/quizzes/submit",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Queue quiz submission",
+    description="Queue quiz grading and return a job id to poll",
+    dependencies=[Depends(idempotency_key)]
+)
+async def submit_quiz_submission_job(request: QuizSubmissionRequest):
+    """Background version of POST /api/quizzes/submit"""
+    return _submit_job(request.user_id, "submit_quiz", request.model_dump())
+
+
+@api_router.get(
+    "/jobs/{job_id}",
+    response_model=JobResponse,
+    summary="Get a job",
+    description="Poll a background job; `result` holds the endpoint response once it has succeeded"
+)
+async def get_job(job_id: str, user_id: str):
+    """
+    Get a background job and, once finished, its result.
+    
+    `result` has the same shape as the synchronous endpoint's response.
+    Failed jobs carry the last error in `error`.
+    """
+    try:
+        job = job_service.get_job(user_id, job_id)
+    except Exception as e:
+        logger.error(f"Error retrieving job: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve job: {str(e)}"
+        )
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return _job_response(job)
+
+
+@api_router.get(
+    "/jobs/{job_id}/status",
+    response_model=JobResponse,
+    summary="Get job status",
+    description="Lightweight status check for a background job, without the result payload"
+)
+async def get_job_status(job_id: str, user_id: str):
+    """Get only the status fields of a background job"""
+    try:
+        job = job_service.get_job(user_id, job_id)
+    except Exception as e:
+        logger.error(f"Error retrieving job status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve job status: {str(e)}"
+        )
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return _job_response(job, include_result=False)
+
+
 # ==================== HEALTH CHECK ====================
 
 @app.get(
@@ -508,6 +864,86 @@ async def health_check():
     }
 
 
+# ==================== METRICS ====================
+
+@app.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    summary="Prometheus metrics",
+    description="LLM call counters, latency/token histograms, scheduler queues, load shedding, auth cache counters and event-loop lag in Prometheus text format"
+)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return (
+        get_llm_telemetry().prometheus()
+        + get_llm_scheduler().prometheus()
+        + get_concurrency_limiter().prometheus()
+        + token_cache.prometheus()
+        + get_loop_watchdog().prometheus()
+    )
+
+
+@app.get(
+    "/metrics/llm",
+    dependencies=[Depends(verify_metrics_token)],
+    summary="LLM usage summary",
+    description="Per-task LLM latency, time to first token and token usage since startup"
+)
+async def llm_metrics():
+    """JSON view of the LLM telemetry, with grading tier, pregeneration and question bank counters"""
+    return {
+        **get_llm_telemetry().snapshot(),
+        "routes": get_model_router().table(),
+        "endpoints": get_llm_gateway().pool.stats(),
+        "resilience": {
+            "circuits": get_llm_gateway().resilience.circuits(),
+            **get_llm_gateway().resilience.stats(),
+        },
+        "scheduler": get_llm_scheduler().stats(),
+        "loadShedding": get_concurrency_limiter().stats(),
+        "gradingTiers": platform.quizzes.tiered_grader.stats(),
+        "pregeneration": platform.pregeneration.stats(),
+        "questionBanks": platform.question_banks.stats(),
+        "idempotency": get_idempotency_store().stats(),
+    }
+
+
+@app.get(
+    "/metrics/auth",
+    dependencies=[Depends(verify_metrics_token)],
+    summary="Auth cache summary",
+    description="Verified-token cache hit rate and signing key refreshes since startup"
+)
+async def auth_metrics():
+    """JSON view of the token cache and JWKS manager"""
+    return {
+        "tokenCache": token_cache.stats(),
+        "jwks": jwks.stats(),
+    }
+
+
+@app.get(
+    "/metrics/loop",
+    dependencies=[Depends(verify_metrics_token)],
+    summary="Event loop stalls",
+    description="Event-loop lag, stalls by route and the stacks of the most recent stalls"
+)
+async def loop_metrics():
+    """JSON view of the event-loop watchdog"""
+    return get_loop_watchdog().stats()
+
+
+@app.get(
+    "/metrics/dashboard",
+    dependencies=[Depends(verify_metrics_token)],
+    summary="Dashboard feed",
+    description="Changes folded into dashboard summaries, errors and how old the newest folded change is"
+)
+async def dashboard_metrics():
+    """JSON view of the dashboard feed processor"""
+    return dashboard_feed.stats()
+
+
 # ==================== ROOT ====================
 
 @app.get("/")
@@ -521,8 +957,11 @@ async def root():
         "endpoints": {
             "lesson_plans": "/api/lesson-plans",
             "lessons": "/api/lessons",
-            "quizzes": "/api/quizzes"
-        }
+            "quizzes": "/api/quizzes",
+            "jobs": "/api/jobs",
+            "metrics": "/metrics"
+        },
+        "prompts": prompt_versions()
     }
 
 app.include_router(api_router)
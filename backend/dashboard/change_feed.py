@@ -0,0 +1,202 @@
+"""
+Dashboard Change Feed
+Keeps dashboard summaries current by delivering changes from the lesson
+plan, progress and quiz attempt containers to the dashboard service
+"""
+import os
+import time
+import uuid
+import queue
+import socket
+import threading
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+from azure.cosmos import exceptions
+
+from dashboard.dashboard_service import DashboardService, SOURCE_CONTAINERS
+from shared.models import FeedCheckpoint, Lease
+from shared.cosmos_client import get_cosmos_service
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardFeedProcessor:
+    """
+    Background thread that folds source changes into dashboard summaries
+
+    DASHBOARD_FEED_BACKEND selects where changes come from:
+
+    - cosmos: the change feed of each source container, from the beginning
+      on first start so existing users are backfilled. The continuation is
+      checkpointed in the Leases container after every page, and a lease
+      renewed on every poll keeps one process reading across API instances
+      and job workers.
+    - local: a stand-in for local testing (and the emulator) that folds this
+      process's own writes, queued from CosmosService write notifications.
+      Every process that writes must run it; there is no backfill, so a
+      summary missing on first read is rebuilt from the source documents.
+    - off: no updates after a summary is first built.
+
+    A failed batch is retried from its checkpoint (cosmos) or dropped with
+    an error logged (local); folds are idempotent, so replays are harmless.
+    """
+
+    CONTAINER = "Leases"
+    PARTITION = "_dashboard-feed"  # partition key shared by the lease and checkpoints
+
+    def __init__(self, dashboard: DashboardService):
+        self.dashboard = dashboard
+        self.cosmos = get_cosmos_service()
+        self.backend = os.getenv("DASHBOARD_FEED_BACKEND", "local").lower()
+        if self.backend not in ("cosmos", "local", "off"):
+            raise ValueError(f"Unknown DASHBOARD_FEED_BACKEND: {self.backend}")
+        self.poll_interval = float(os.getenv("DASHBOARD_FEED_POLL_SECONDS", "2"))
+        self.lease_seconds = int(os.getenv("DASHBOARD_FEED_LEASE_SECONDS", "30"))
+        self.page_size = int(os.getenv("DASHBOARD_FEED_PAGE_SIZE", "100"))
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"documents": 0, "summariesWritten": 0, "errors": 0, "leader": False}
+        self._last_change_ts: Optional[float] = None
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self) -> None:
+        if self.backend == "off" or self._thread is not None:
+            return
+        if self.backend == "local":
+            self.cosmos.subscribe(self._on_write)
+            target = self._run_local
+        else:
+            target = self._run_cosmos
+        self._thread = threading.Thread(target=target, name="dashboard-feed", daemon=True)
+        self._thread.start()
+        logger.info(f"Dashboard feed started ({self.backend} backend)")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _apply(self, docs: List[Dict[str, Any]]) -> None:
+        written = self.dashboard.apply(docs)
+        with self._lock:
+            self._stats["documents"] += len(docs)
+            self._stats["summariesWritten"] += written
+            stamps = [doc["_ts"] for doc in docs if isinstance(doc.get("_ts"), (int, float))]
+            if stamps:
+                self._last_change_ts = max(stamps + [self._last_change_ts or 0])
+
+    def _error(self, message: str) -> None:
+        with self._lock:
+            self._stats["errors"] += 1
+        logger.error(message)
+
+    # ==================== LOCAL STAND-IN ====================
+
+    def _on_write(self, container: str, doc: Dict[str, Any]) -> None:
+        if container in SOURCE_CONTAINERS:
+            self._queue.put(doc)
+
+    def _run_local(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.poll_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.page_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception as e:
+                self._error(f"Dropped {len(batch)} dashboard change(s): {e}")
+
+    # ==================== COSMOS CHANGE FEED ====================
+
+    def _run_cosmos(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._hold_lease():
+                    for container in SOURCE_CONTAINERS:
+                        self._drain(container)
+            except Exception as e:
+                self._error(f"Dashboard change feed poll failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _drain(self, container: str) -> None:
+        checkpoint = self._read_checkpoint(container)
+        for docs, continuation in self.cosmos.read_change_feed(container, checkpoint.continuation, self.page_size):
+            self._apply(docs)
+            checkpoint.continuation = continuation
+            checkpoint.updatedAt = datetime.now(timezone.utc)
+            self.cosmos.upsert_item(self.CONTAINER, checkpoint)
+            if self._stop.is_set():
+                return
+
+    def _read_checkpoint(self, container: str) -> FeedCheckpoint:
+        checkpoint = self.cosmos.get_item(
+            container=self.CONTAINER,
+            item_id=f"dashboard-feed-{container}",
+            partition_key=self.PARTITION,
+            model_class=FeedCheckpoint
+        )
+        return checkpoint or FeedCheckpoint(
+            id=f"dashboard-feed-{container}",
+            userId=self.PARTITION,
+            container=container
+        )
+
+    def _hold_lease(self) -> bool:
+        """Take or renew the reader lease; False while another process holds it"""
+        now = datetime.now(timezone.utc)
+        lease = Lease(
+            id="dashboard-feed",
+            userId=self.PARTITION,
+            key="dashboard-feed",
+            owner=self.owner,
+            expiresAt=now + timedelta(seconds=self.lease_seconds),
+            ttl=self.lease_seconds
+        )
+        current, etag = self.cosmos.get_item_if_changed(
+            container=self.CONTAINER,
+            item_id=lease.id,
+            partition_key=self.PARTITION,
+            model_class=Lease
+        )
+        try:
+            if current is None:
+                self.cosmos.create_item(self.CONTAINER, lease)
+            elif current.owner == self.owner or current.expiresAt <= now:
+                self.cosmos.update_item(self.CONTAINER, lease, etag=etag)
+            else:
+                return self._set_leader(False)
+        except (exceptions.CosmosResourceExistsError, exceptions.CosmosAccessConditionFailedError):
+            # Another process took it between the read and the write
+            return self._set_leader(False)
+        return self._set_leader(True)
+
+    def _set_leader(self, leader: bool) -> bool:
+        with self._lock:
+            if leader != self._stats["leader"]:
+                logger.info(f"Dashboard feed lease {'acquired' if leader else 'held elsewhere'} ({self.owner})")
+            self._stats["leader"] = leader
+        return leader
+
+    # ==================== METRICS ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput counters and how far behind the newest folded change is"""
+        with self._lock:
+            lag = time.time() - self._last_change_ts if self._last_change_ts else None
+            return {
+                "backend": self.backend,
+                **self._stats,
+                "pending": self._queue.qsize(),
+                "lastChangeAgeSeconds": round(lag, 1) if lag is not None else None,
+            }
@@ -0,0 +1,269 @@
+"""
+Dashboard Service
+Per-user dashboard summaries folded from lesson plan, progress and quiz
+attempt documents, so serving the dashboard is a single point read
+"""
+import os
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from azure.cosmos import exceptions
+
+from shared.models import DashboardSummary, DashboardResponse
+from shared.cosmos_client import get_cosmos_service
+
+logger = logging.getLogger(__name__)
+
+# Containers whose changes feed the summaries
+SOURCE_CONTAINERS = ("LessonPlans", "Progress", "QuizAttempts")
+
+
+class DashboardService:
+    """
+    Maintains one summary document per user in the Users container
+
+    `apply` folds changed source documents into their owners' summaries
+    with an etag-checked read-modify-write. Every fold sets fields from the
+    document's latest state rather than incrementing, so a change delivered
+    twice (a feed replayed from its last checkpoint) changes nothing. A
+    user's first change builds the summary from all of their source
+    documents, which also covers users that predate the dashboard.
+    """
+
+    CONTAINER = "Users"
+
+    def __init__(self):
+        self.cosmos = get_cosmos_service()
+        self.max_recommendations = int(os.getenv("DASHBOARD_MAX_RECOMMENDATIONS", "5"))
+        self.review_below = float(os.getenv("DASHBOARD_REVIEW_BELOW_SCORE", "60"))
+
+        self._folds: Dict[str, Callable[[DashboardSummary, Dict[str, Any]], bool]] = {
+            "lessonPlan": self._fold_plan,
+            "progress": self._fold_progress,
+            "quizAttempt": self._fold_attempt,
+        }
+
+    @staticmethod
+    def _summary_id(user_id: str) -> str:
+        return f"dashboard_{user_id}"
+
+    # ==================== READS ====================
+
+    def get_dashboard(self, user_id: str) -> DashboardResponse:
+        """The user's dashboard; a point read once their summary exists"""
+        summary = self.cosmos.get_item(
+            container=self.CONTAINER,
+            item_id=self._summary_id(user_id),
+            partition_key=user_id,
+            model_class=DashboardSummary
+        )
+        if summary is None:
+            summary = self.rebuild(user_id)
+            try:
+                self.cosmos.create_item(self.CONTAINER, summary)
+            except exceptions.CosmosResourceExistsError:
+                pass  # the feed processor stored one meanwhile
+        return self.to_response(summary)
+
+    def to_response(self, summary: DashboardSummary) -> DashboardResponse:
+        return DashboardResponse(
+            user=summary.totals,
+            lesson_plans=[
+                {
+                    "id": plan_id,
+                    "subject": plan["subject"],
+                    "topic": plan["topic"],
+                    "subtopic_count": plan.get("subtopicCount", 0),
+                    "progress": {
+                        "percent_complete": plan.get("percentComplete", 0.0),
+                        "completed_subtopics": plan.get("completedSubtopics", 0),
+                        "average_score": plan.get("averageScore"),
+                        "study_time": plan.get("studyTime", 0),
+                    },
+                }
+                for plan_id, plan in self._visible_plans(summary)
+            ],
+            recommendations=summary.recommendations,
+        )
+
+    # ==================== UPDATES ====================
+
+    def apply(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        Fold changed source documents into their users' summaries
+
+        Documents are grouped by user so a batch costs one read and one
+        write per user. Returns the number of summaries written.
+        """
+        by_user: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for doc in documents:
+            if doc.get("userId") and doc.get("type") in self._folds:
+                by_user[doc["userId"]].append(doc)
+
+        written = 0
+        for user_id, docs in by_user.items():
+            if self._update(user_id, lambda summary, docs=docs: self._fold_all(summary, docs)):
+                written += 1
+        return written
+
+    def forget_plan(self, user_id: str, plan_id: str) -> None:
+        """Hide a deleted plan; deletes never appear in the change feed"""
+        def hide(summary: DashboardSummary) -> bool:
+            summary.plans.setdefault(plan_id, {})["deletedTs"] = time.time()
+            return True
+
+        try:
+            self._update(user_id, hide)
+        except Exception as e:
+            logger.warning(f"Could not remove plan {plan_id} from the dashboard of {user_id}: {e}")
+
+    def rebuild(self, user_id: str) -> DashboardSummary:
+        """Build a summary from every source document of the user (the expensive path)"""
+        summary = DashboardSummary(id=self._summary_id(user_id), userId=user_id)
+        for container in SOURCE_CONTAINERS:
+            docs = self.cosmos.query_items(
+                container=container,
+                query="SELECT * FROM c WHERE c.userId = @userId",
+                partition_key=user_id,
+                parameters=[{"name": "@userId", "value": user_id}]
+            )
+            self._fold_all(summary, docs)
+        self._refresh(summary)
+        logger.info(f"Rebuilt dashboard for {user_id}: {len(summary.plans)} plans, {len(summary.attemptScores)} attempts")
+        return summary
+
+    def _update(self, user_id: str, change: Callable[[DashboardSummary], bool]) -> bool:
+        for _ in range(5):
+            summary, etag = self.cosmos.get_item_if_changed(
+                container=self.CONTAINER,
+                item_id=self._summary_id(user_id),
+                partition_key=user_id,
+                model_class=DashboardSummary
+            )
+            if summary is None:
+                # A rebuild reads the changed documents too; applying the change again is harmless
+                summary = self.rebuild(user_id)
+                change(summary)
+                self._refresh(summary)
+                try:
+                    self.cosmos.create_item(self.CONTAINER, summary)
+                    return True
+                except exceptions.CosmosResourceExistsError:
+                    continue
+
+            if not change(summary):
+                return False
+            self._refresh(summary)
+            try:
+                self.cosmos.update_item(self.CONTAINER, summary, etag=etag)
+                return True
+            except exceptions.CosmosAccessConditionFailedError:
+                # Another process updated the summary since the read; fold again
+                continue
+        logger.warning(f"Gave up updating dashboard for {user_id} after repeated conflicts")
+        return False
+
+    # ==================== FOLDS ====================
+
+    def _fold_all(self, summary: DashboardSummary, docs: Iterable[Dict[str, Any]]) -> bool:
+        """Apply source documents in order; returns whether the summary changed"""
+        changed = False
+        for doc in docs:
+            fold = self._folds.get(doc.get("type"))
+            if fold is not None and fold(summary, doc):
+                changed = True
+        return changed
+
+    @staticmethod
+    def _set(entry: Dict[str, Any], values: Dict[str, Any]) -> bool:
+        changed = any(entry.get(key) != value for key, value in values.items())
+        entry.update(values)
+        return changed
+
+    def _fold_plan(self, summary: DashboardSummary, doc: Dict[str, Any]) -> bool:
+        return self._set(summary.plans.setdefault(doc["id"], {}), {
+            "subject": doc.get("subject"),
+            "topic": doc.get("topic"),
+            "subtopicCount": len(doc.get("structure") or []),
+            "planTs": doc.get("_ts") or time.time(),
+        })
+
+    def _fold_progress(self, summary: DashboardSummary, doc: Dict[str, Any]) -> bool:
+        plan_id = doc.get("lessonPlanId")
+        if not plan_id:
+            return False
+        overall = doc.get("overallProgress") or {}
+
+        # Mean of subtopic quiz averages, weighted by attempts
+        attempts = scored = 0.0
+        for entry in (doc.get("subtopicProgress") or {}).values():
+            count = float(entry.get("quizAttempts") or 0)
+            attempts += count
+            scored += count * float(entry.get("averageScore") or 0.0)
+
+        return self._set(summary.plans.setdefault(plan_id, {}), {
+            "percentComplete": round(float(overall.get("percentComplete") or 0.0), 1),
+            "completedSubtopics": int(overall.get("completedSubtopics") or 0),
+            "studyTime": int(overall.get("totalStudyTime") or 0),
+            "averageScore": round(scored / attempts, 1) if attempts else None,
+        })
+
+    def _fold_attempt(self, summary: DashboardSummary, doc: Dict[str, Any]) -> bool:
+        if doc.get("state") != "completed":
+            return False
+        percentage = round(float((doc.get("score") or {}).get("percentage") or 0.0), 1)
+        if summary.attemptScores.get(doc["id"]) == percentage:
+            return False
+        summary.attemptScores[doc["id"]] = percentage
+        return True
+
+    # ==================== DERIVED FIELDS ====================
+
+    @staticmethod
+    def _visible_plans(summary: DashboardSummary) -> List[Tuple[str, Dict[str, Any]]]:
+        # A plan shows once its own document has arrived (progress can come
+        # first) and unless it was deleted after it was last written
+        visible = [
+            (plan_id, plan) for plan_id, plan in summary.plans.items()
+            if plan.get("subject") and plan.get("planTs", 0) > plan.get("deletedTs", 0)
+        ]
+        return sorted(visible, key=lambda item: (item[1]["subject"], item[1]["topic"] or ""))
+
+    def _refresh(self, summary: DashboardSummary) -> None:
+        """Recompute totals and recommendations from the per-plan entries"""
+        plans = [plan for _, plan in self._visible_plans(summary)]
+        scores = list(summary.attemptScores.values())
+        summary.totals = {
+            "total_study_time": sum(plan.get("studyTime", 0) for plan in plans),
+            "overall_progress": round(sum(plan.get("percentComplete", 0.0) for plan in plans) / len(plans), 1) if plans else 0.0,
+            "average_score": round(sum(scores) / len(scores), 1) if scores else None,
+            "lesson_plan_count": len(plans),
+            "quizzes_completed": len(scores),
+        }
+        summary.recommendations = self._recommend(plans)
+        summary.updatedAt = datetime.now(timezone.utc)
+
+    def _recommend(self, plans: List[Dict[str, Any]]) -> List[str]:
+        if not plans:
+            return ["Create a lesson plan to get started"]
+
+        def name(plan: Dict[str, Any]) -> str:
+            return f"{plan['subject']} - {plan['topic']}"
+
+        in_progress = sorted(
+            (p for p in plans if 0 < p.get("percentComplete", 0.0) < 100),
+            key=lambda p: -p["percentComplete"]
+        )
+        struggling = sorted(
+            (p for p in plans if p.get("averageScore") is not None and p["averageScore"] < self.review_below),
+            key=lambda p: p["averageScore"]
+        )
+        not_started = [p for p in plans if not p.get("percentComplete")]
+
+        recommendations = [f"Continue {name(p)} ({p['percentComplete']:.0f}% complete)" for p in in_progress]
+        recommendations += [f"Review {name(p)} (average score: {p['averageScore']:.0f}%)" for p in struggling]
+        recommendations += [f"Start {name(p)}" for p in not_started]
+        return recommendations[:self.max_recommendations]
@@ -0,0 +1,97 @@
+"""
+Job Handlers
+Map each job kind to the LearningPlatform workflow it runs, returning the
+same payload the synchronous endpoint would
+"""
+import uuid
+from typing import Dict, Any
+
+from learning_platform import LearningPlatform
+from shared.models import (
+    CreateLessonPlanRequest, LessonPlanResponse,
+    StartLessonRequest, LessonResponse,
+    StartQuizRequest, QuizResponse,
+    QuizSubmissionRequest, QuizResultResponse
+)
+from jobs.job_service import JobHandler
+
+
+def build_handlers(platform: LearningPlatform) -> Dict[str, JobHandler]:
+    """Handlers for every job kind, bound to a platform instance"""
+
+    def create_lesson_plan(payload: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+        request = CreateLessonPlanRequest.model_validate(payload)
+        result = platform.create_lesson_plan(
+            user_id=request.user_id,
+            subject=request.subject,
+            topic=request.topic,
+            level=request.level,
+            auto_approve=request.auto_approve
+        )
+        return LessonPlanResponse(
+            lesson_plan_id=result["lessonPlan"].id,
+            subject=result["lessonPlan"].subject,
+            topic=result["lessonPlan"].topic,
+            description=result["lessonPlan"].description,
+            subtopics=result["subtopics"],
+        ).model_dump(mode="json")
+
+    def start_lesson(payload: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+        request = StartLessonRequest.model_validate(payload)
+        result = platform.start_lesson(
+            user_id=request.user_id,
+            lesson_plan_id=request.lesson_plan_id,
+            subtopic_id=request.subtopic_id
+        )
+        return LessonResponse(
+            lesson_id=result["lessonId"],
+            subject=result["subject"],
+            topic=result["topic"],
+            subtopic=result["subtopic"],
+            introduction=result["introduction"],
+            sections=result["sections"],
+            summary=result["summary"],
+            key_terms=result["keyTerms"],
+            status=result["status"]
+        ).model_dump(mode="json")
+
+    def start_quiz(payload: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+        request = StartQuizRequest.model_validate(payload)
+        result = platform.start_quiz(
+            user_id=request.user_id,
+            lesson_id=request.lesson_id,
+            subtopic_id=request.subtopic_id,
+            difficulty=request.difficulty,
+            question_count=request.question_count
+        )
+        return QuizResponse(
+            quiz_id=result["quizId"],
+            questions=result["questions"],
+            total_questions=result["totalQuestions"]
+        ).model_dump(mode="json")
+
+    def submit_quiz(payload: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+        request = QuizSubmissionRequest.model_validate(payload)
+        # Derived from the job, so a rerun finds the attempt instead of grading again
+        result = platform.submit_quiz(
+            user_id=request.user_id,
+            quiz_id=request.quiz_id,
+            responses=request.responses,
+            attempt_id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"job:{job_id}"))
+        )
+        return QuizResultResponse(
+            attempt_id=result["attemptId"],
+            score=result["score"],
+            responses=result["responses"],
+            mastery_level=result["masteryLevel"],
+            next_action=result["nextAction"],
+            trigger_tutor=result["triggerTutor"],
+            weak_concepts=result["weakConcepts"]
+        ).model_dump(mode="json")
+
+    return {
+        "create_lesson_plan": create_lesson_plan,
+        "start_lesson": start_lesson,
+        "start_quiz": start_quiz,
+        "submit_quiz": submit_quiz,
+    }
@@ -0,0 +1,150 @@
+"""
+Job Service
+Queues long-running LLM work and runs it on a pool of background workers
+"""
+import os
+import uuid
+import random
+import socket
+import threading
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, Any, List, Optional
+
+from shared.models import Job
+from jobs.job_store import JobStore, get_job_store
+
+logger = logging.getLogger(__name__)
+
+# Called with the job's payload and id; a retried job gets the same id again
+JobHandler = Callable[[Dict[str, Any], str], Dict[str, Any]]
+
+
+class JobService:
+    """
+    Submits jobs to the store and executes them with a worker pool
+
+    Workers poll the store for runnable jobs, run the handler registered for
+    the job's kind and persist the result. A failed job is re-queued with
+    exponential backoff (plus jitter) until it has used `maxAttempts`, then
+    marked failed with the last error. A heartbeat renews the lease every
+    third of JOB_LEASE_SECONDS while a job runs, so jobs whose worker dies
+    are picked up again soon after without cutting long jobs short. A job can
+    still run twice (a worker stalled past its lease), so handlers must be
+    idempotent for the job id they are given; only the run holding the
+    current claim stores its outcome.
+    """
+
+    def __init__(self, handlers: Dict[str, JobHandler], store: Optional[JobStore] = None):
+        self.handlers = handlers
+        self.store = store or get_job_store()
+
+        self.max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.retry_base = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+        self.retry_max = float(os.getenv("JOB_RETRY_MAX_SECONDS", "60"))
+        self.lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+        self.poll_interval = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._workers: List[threading.Thread] = []
+
+    # ==================== SUBMISSION ====================
+
+    def submit(self, user_id: str, kind: str, payload: Dict[str, Any]) -> Job:
+        """Persist a new job and return it immediately"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        now = datetime.now(timezone.utc)
+        job = self.store.create(Job(
+            id=str(uuid.uuid4()),
+            userId=user_id,
+            kind=kind,
+            payload=payload,
+            maxAttempts=self.max_attempts,
+            runAfter=now,
+            createdAt=now,
+            updatedAt=now
+        ))
+        logger.info(f"Queued {kind} job: {job.id}")
+        self._wake.set()
+        return job
+
+    def get_job(self, user_id: str, job_id: str) -> Optional[Job]:
+        return self.store.get(user_id, job_id)
+
+    # ==================== WORKERS ====================
+
+    def start_workers(self, count: int) -> None:
+        """Start `count` in-process worker threads"""
+        for i in range(count):
+            worker_id = f"{socket.gethostname()}-{os.getpid()}-{i}"
+            thread = threading.Thread(target=self.run_worker, args=(worker_id,), daemon=True)
+            thread.start()
+            self._workers.append(thread)
+        if count:
+            logger.info(f"Started {count} job worker(s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def run_worker(self, worker_id: str) -> None:
+        """Claim and run jobs until stopped"""
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim_next(worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            self._execute(job)
+
+    def _execute(self, job: Job) -> None:
+        logger.info(f"Running {job.kind} job {job.id} (attempt {job.attempts}/{job.maxAttempts})")
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, stop), daemon=True)
+        heartbeat.start()
+        try:
+            job.result = self.handlers[job.kind](job.payload, job.id)
+            job.status = "succeeded"
+            job.error = None
+        except Exception as e:
+            job.error = str(e)
+            # A ValueError means the request itself is bad (e.g. not found); don't retry it
+            if job.attempts < job.maxAttempts and not isinstance(e, ValueError):
+                delay = min(self.retry_max, self.retry_base * (2 ** (job.attempts - 1)))
+                delay *= random.uniform(0.5, 1.0)
+                job.status = "queued"
+                job.runAfter = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                logger.warning(f"Job {job.id} failed, retrying in {delay:.1f}s: {e}")
+            else:
+                job.status = "failed"
+                logger.error(f"Job {job.id} failed: {e}")
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        job.leaseExpiresAt = None
+        job.updatedAt = datetime.now(timezone.utc)
+        try:
+            if not self.store.finish(job):
+                logger.warning(f"Lost the lease on job {job.id}; dropping this run's {job.status} outcome")
+        except Exception as e:
+            logger.error(f"Error saving job {job.id}: {e}")
+
+    def _heartbeat(self, job: Job, stop: threading.Event) -> None:
+        """Renew the job's lease every third of its length until `stop` is set"""
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.store.renew(job, self.lease_seconds):
+                    logger.warning(f"Lost the lease on job {job.id}; another worker may run it too")
+                    return
+            except Exception as e:
+                logger.warning(f"Error renewing lease on job {job.id}: {e}")
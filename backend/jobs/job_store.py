@@ -0,0 +1,282 @@
+"""
+Job Store
+Persistence backends for background jobs: a local SQLite file that needs no
+external services, and a Cosmos DB container for multi-instance deployments
+"""
+import os
+import json
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+from contextlib import closing
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from azure.cosmos import exceptions
+
+from shared.models import Job
+from shared.cosmos_client import get_cosmos_service
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore(ABC):
+    """Interface shared by the job store backends"""
+
+    @abstractmethod
+    def create(self, job: Job) -> Job:
+        ...
+
+    @abstractmethod
+    def get(self, user_id: str, job_id: str) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def finish(self, job: Job) -> bool:
+        """
+        Store the outcome of a run (result, retry or failure)
+
+        Returns False, leaving the job untouched, if it is no longer this
+        claim's, so a worker whose lease lapsed never overwrites the run of
+        the worker that took the job over.
+        """
+
+    @abstractmethod
+    def claim_next(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        """
+        Atomically take the next runnable job
+
+        Runnable means queued with `runAfter` in the past, or running with an
+        expired lease (its worker died). The claimed job is marked running
+        under `worker_id` with a fresh lease.
+        """
+
+    @abstractmethod
+    def renew(self, job: Job, lease_seconds: float) -> bool:
+        """
+        Extend the lease of a job this worker is running
+
+        Returns False, leaving the job untouched, if it is no longer this
+        claim's (its lease lapsed and another worker took it over).
+        """
+
+
+def _same_claim(current: Job, job: Job) -> bool:
+    return current.status == "running" and current.workerId == job.workerId and current.attempts == job.attempts
+
+
+# Relative store paths are resolved against backend/, not the working directory
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LocalJobStore(JobStore):
+    """SQLite-backed store; safe across threads and local processes"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = os.path.join(_BACKEND_DIR, path or os.getenv("JOB_STORE_PATH") or "jobs.db")
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " user_id TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " run_after REAL NOT NULL,"
+                " lease_expires_at REAL,"
+                " doc TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, run_after)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _row(job: Job):
+        run_after = (job.runAfter or job.createdAt or datetime.now(timezone.utc)).timestamp()
+        lease = job.leaseExpiresAt.timestamp() if job.leaseExpiresAt else None
+        return job.id, job.userId, job.status, run_after, lease, job.model_dump_json()
+
+    def create(self, job: Job) -> Job:
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?)", self._row(job))
+        return job
+
+    def get(self, user_id: str, job_id: str) -> Optional[Job]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT doc FROM jobs WHERE id = ? AND user_id = ?", (job_id, user_id)
+            ).fetchone()
+        return Job.model_validate(json.loads(row[0])) if row else None
+
+    def finish(self, job: Job) -> bool:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT doc FROM jobs WHERE id = ?", (job.id,)).fetchone()
+            current = Job.model_validate(json.loads(row[0])) if row else None
+            if current is None or not _same_claim(current, job):
+                conn.execute("COMMIT")
+                return False
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, run_after = ?, lease_expires_at = ?, doc = ? WHERE id = ?",
+                self._row(job)[2:] + (job.id,)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim_next(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        now = datetime.now(timezone.utc)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT doc FROM jobs"
+                " WHERE (status = 'queued' AND run_after <= ?)"
+                " OR (status = 'running' AND lease_expires_at < ?)"
+                " ORDER BY run_after LIMIT 1",
+                (now.timestamp(), now.timestamp())
+            ).fetchone()
+            if not row:
+                conn.execute("COMMIT")
+                return None
+
+            job = Job.model_validate(json.loads(row[0]))
+            _mark_claimed(job, worker_id, lease_seconds, now)
+            conn.execute(
+                "UPDATE jobs SET status = ?, run_after = ?, lease_expires_at = ?, doc = ? WHERE id = ?",
+                self._row(job)[2:] + (job.id,)
+            )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew(self, job: Job, lease_seconds: float) -> bool:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT doc FROM jobs WHERE id = ?", (job.id,)).fetchone()
+            current = Job.model_validate(json.loads(row[0])) if row else None
+            if current is None or not _same_claim(current, job):
+                conn.execute("COMMIT")
+                return False
+
+            current.leaseExpiresAt = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+            conn.execute(
+                "UPDATE jobs SET status = ?, run_after = ?, lease_expires_at = ?, doc = ? WHERE id = ?",
+                self._row(current)[2:] + (job.id,)
+            )
+            conn.execute("COMMIT")
+            job.leaseExpiresAt = current.leaseExpiresAt
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+class CosmosJobStore(JobStore):
+    """Cosmos-backed store; claims use optimistic concurrency on `_etag`"""
+
+    CONTAINER = "Jobs"
+
+    def __init__(self):
+        self.cosmos = get_cosmos_service()
+
+    def create(self, job: Job) -> Job:
+        return self.cosmos.create_item(self.CONTAINER, job)
+
+    def get(self, user_id: str, job_id: str) -> Optional[Job]:
+        return self.cosmos.get_item(
+            container=self.CONTAINER,
+            item_id=job_id,
+            partition_key=user_id,
+            model_class=Job
+        )
+
+    def finish(self, job: Job) -> bool:
+        current, etag = self.cosmos.get_item_if_changed(
+            container=self.CONTAINER,
+            item_id=job.id,
+            partition_key=job.userId,
+            model_class=Job
+        )
+        if current is None or not _same_claim(current, job):
+            return False
+
+        try:
+            self.cosmos.update_item(self.CONTAINER, job, etag=etag)
+        except exceptions.CosmosAccessConditionFailedError:
+            return False
+        return True
+
+    def claim_next(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        now = datetime.now(timezone.utc)
+        candidates = self.cosmos.query_items(
+            container=self.CONTAINER,
+            query=(
+                "SELECT TOP 10 * FROM c WHERE c.type = 'job' AND ("
+                "(c.status = 'queued' AND c.runAfter <= @now) OR "
+                "(c.status = 'running' AND c.leaseExpiresAt < @now)"
+                ") ORDER BY c.runAfter"
+            ),
+            # Match the "Z" suffix pydantic uses when storing datetimes
+            parameters=[{"name": "@now", "value": now.isoformat().replace("+00:00", "Z")}]
+        )
+
+        for doc in candidates:
+            job = Job.model_validate(doc)
+            _mark_claimed(job, worker_id, lease_seconds, now)
+            try:
+                return self.cosmos.update_item(self.CONTAINER, job, etag=doc.get("_etag"))
+            except exceptions.CosmosAccessConditionFailedError:
+                # Another worker claimed it first
+                continue
+        return None
+
+    def renew(self, job: Job, lease_seconds: float) -> bool:
+        current, etag = self.cosmos.get_item_if_changed(
+            container=self.CONTAINER,
+            item_id=job.id,
+            partition_key=job.userId,
+            model_class=Job
+        )
+        if current is None or not _same_claim(current, job):
+            return False
+
+        current.leaseExpiresAt = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+        try:
+            self.cosmos.update_item(self.CONTAINER, current, etag=etag)
+        except exceptions.CosmosAccessConditionFailedError:
+            return False
+        job.leaseExpiresAt = current.leaseExpiresAt
+        return True
+
+
+def _mark_claimed(job: Job, worker_id: str, lease_seconds: float, now: datetime) -> None:
+    job.status = "running"
+    job.attempts += 1
+    job.workerId = worker_id
+    job.leaseExpiresAt = now + timedelta(seconds=lease_seconds)
+    job.updatedAt = now
+
+
+def get_job_store() -> JobStore:
+    """Build the store selected by JOB_QUEUE_BACKEND (local or cosmos)"""
+    backend = os.getenv("JOB_QUEUE_BACKEND", "local").lower()
+    if backend == "cosmos":
+        return CosmosJobStore()
+    if backend != "local":
+        raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
+    return LocalJobStore()
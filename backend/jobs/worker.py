@@ -0,0 +1,53 @@
+"""
+Job Worker
+Runs background jobs in a separate process
+
+Usage (from backend/):
+    python -m jobs.worker --workers 4
+
+Point the API and the worker at the same store (JOB_QUEUE_BACKEND and, for
+the local backend, JOB_STORE_PATH) and set JOB_WORKERS=0 on the API so it
+only enqueues.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+
+from dotenv import load_dotenv
+
+from learning_platform import LearningPlatform
+from jobs.handlers import build_handlers
+from jobs.job_service import JobService
+from dashboard.change_feed import DashboardFeedProcessor
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Studify background job workers")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS", "2")) or 2,
+                        help="Number of worker threads (default JOB_WORKERS or 2)")
+    args = parser.parse_args()
+
+    platform = LearningPlatform()
+    service = JobService(build_handlers(platform))
+    signal.signal(signal.SIGTERM, lambda *_: service.stop())
+
+    # Job writes change dashboards too; with the cosmos backend the lease
+    # keeps a single reader whichever process holds it
+    DashboardFeedProcessor(platform.dashboard).start()
+
+    service.start_workers(args.workers - 1)
+    logger.info(f"Job worker running on {socket.gethostname()} with {args.workers} thread(s)")
+    try:
+        service.run_worker(f"{socket.gethostname()}-{os.getpid()}-main")
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
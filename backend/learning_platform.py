@@ -3,12 +3,15 @@ Learning Platform Facade
 Unified interface for all learning platform operations
 """
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 
 from lesson_plans.lesson_plan_service import LessonPlanService
 from lessons.lesson_service import LessonService
 from quizzes.quiz_service import QuizService
+from quizzes.question_bank import QuestionBankService
 from progress.progress_service import ProgressService
+from dashboard.dashboard_service import DashboardService
+from lessons.pregeneration import PregenerationEngine
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +28,10 @@ class LearningPlatform:
         self.lesson_plans = LessonPlanService()
         self.lessons = LessonService()
         self.quizzes = QuizService()
+        self.question_banks = QuestionBankService()
         self.progress = ProgressService()
+        self.pregeneration = PregenerationEngine(self.lessons, self.quizzes, self.question_banks)
+        self.dashboard = DashboardService()
     
     # ==================== LESSON PLAN WORKFLOWS ====================
     
@@ -60,6 +66,9 @@ class LearningPlatform:
             level=level
         )
         
+        # Learners almost always open the first subtopic next
+        self.pregeneration.schedule_next(user_id, lesson_plan, after_order=0)
+        
         result = {
             "lessonPlan": lesson_plan,
             "subtopics": [
@@ -104,13 +113,16 @@ class LearningPlatform:
         
         if existing_lesson:
             lesson = existing_lesson
+            self.pregeneration.record_hit(lesson)
         else:
-            # Generate new lesson
-            lesson = self.lessons.generate_lesson(
-                user_id=user_id,
-                lesson_plan_id=lesson_plan_id,
-                subtopic_id=subtopic_id
-            )
+            # Join a speculative generation already under way, else generate now
+            lesson = self.pregeneration.claim(lesson_plan_id, subtopic_id)
+            if lesson is None:
+                lesson = self.lessons.generate_lesson(
+                    user_id=user_id,
+                    lesson_plan_id=lesson_plan_id,
+                    subtopic_id=subtopic_id
+                )
         
         return {
             "lessonId": lesson.id,
@@ -154,6 +166,24 @@ class LearningPlatform:
             "expandedContent": section.get("expanded") if section else None
         }
     
+    def stream_expand_lesson_section(
+        self,
+        user_id: str,
+        lesson_id: str,
+        section_id: str
+    ) -> Iterator[str]:
+        """
+        Expand a section, streaming the expansion as it is generated
+        
+        Returns:
+            Iterator over expanded content chunks
+        """
+        return self.lessons.stream_expand_section(
+            user_id=user_id,
+            lesson_id=lesson_id,
+            section_id=section_id
+        )
+    
     def complete_lesson(
         self,
         user_id: str,
@@ -174,6 +204,12 @@ class LearningPlatform:
         # Mark lesson complete
         lesson = self.lessons.mark_lesson_complete(user_id, lesson_id)
         
+        # Get the following lessons ready while the learner takes the quiz
+        lesson_plan = self.lesson_plans.get_lesson_plan(user_id, lesson.lessonPlanId) if lesson.lessonPlanId else None
+        if lesson_plan:
+            current = next((st for st in lesson_plan.structure if st.subtopicId == lesson.subtopicId), None)
+            self.pregeneration.schedule_next(user_id, lesson_plan, after_order=current.order if current else 0)
+        
         # Update progress
         progress = self.progress.update_lesson_completion(
             user_id=user_id,
@@ -201,7 +237,7 @@ class LearningPlatform:
         question_count: int = 5
     ) -> Dict[str, Any]:
         """
-        Generate and start a quiz
+        Start a quiz, sampled from the lesson's question bank when enabled
         
         Args:
             user_id: User identifier
@@ -215,14 +251,27 @@ class LearningPlatform:
         """
         logger.info(f"Starting quiz for lesson: {lesson_id}")
         
-        # Generate quiz
-        quiz = self.quizzes.generate_quiz(
-            user_id=user_id,
-            lesson_id=lesson_id,
-            subtopic_id=subtopic_id,
-            difficulty=difficulty,
-            count=question_count
-        )
+        # Sample the lesson's question bank; without banks, use a pregenerated
+        # quiz for default requests, otherwise generate one
+        quiz = None
+        if self.question_banks.enabled:
+            quiz = self.question_banks.start_quiz(
+                user_id=user_id,
+                lesson_id=lesson_id,
+                subtopic_id=subtopic_id,
+                difficulty=difficulty,
+                count=question_count
+            )
+        elif difficulty == "mixed":
+            quiz = self.quizzes.claim_pregenerated_quiz(user_id, lesson_id, count=question_count)
+        if quiz is None:
+            quiz = self.quizzes.generate_quiz(
+                user_id=user_id,
+                lesson_id=lesson_id,
+                subtopic_id=subtopic_id,
+                difficulty=difficulty,
+                count=question_count
+            )
         
         return {
             "quizId": quiz.id,
@@ -244,7 +293,8 @@ class LearningPlatform:
         self,
         user_id: str,
         quiz_id: str,
-        responses: List[Dict[str, Any]]
+        responses: List[Dict[str, Any]],
+        attempt_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Submit quiz and get results
@@ -253,6 +303,8 @@ class LearningPlatform:
             user_id: User identifier
             quiz_id: Quiz ID
             responses: List of responses
+            attempt_id: Fixed attempt id; resubmitting with it returns the
+                stored attempt and does not count it towards progress again
         
         Returns:
             Dict with results and next actions
@@ -263,7 +315,8 @@ class LearningPlatform:
         attempt = self.quizzes.submit_quiz(
             user_id=user_id,
             quiz_id=quiz_id,
-            responses=responses
+            responses=responses,
+            attempt_id=attempt_id
         )
         
         # Update progress
@@ -2,16 +2,20 @@
 Lesson Plan Service
 Handles lesson plan generation, approval, and management
 """
-import os
 import hashlib
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any
-from openai import OpenAI
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel
 import logging
 
 from shared.models import LessonPlan, LessonPlanItem
 from shared.cosmos_client import get_cosmos_service
+from shared.single_flight import get_single_flight
+from shared.llm_scheduler import llm_work
+from shared.tokens import budget_for, count_message_tokens, log_prompt_tokens, truncate_to_tokens
+from shared.llm_gateway import get_llm_gateway
+from shared.prompts import register_prompt
+from shared.http_responses import collection_etag
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +36,22 @@ class LessonPlanLLMResponse(BaseModel):
     subtopics: List[LessonPlanSubtopicLLM]
 
 
+LESSON_PLAN_PROMPT = register_prompt(
+    name="lesson_plan",
+    version="2",
+    instructions=(
+        "You are an expert {level} curriculum designer. "
+        "Generate a clear, well-structured lesson plan broken into logical subtopics. "
+        "Each subtopic should be {detail_level} and suitable for a 15–45 minute lesson. "
+        "Include key concepts for each subtopic. "
+        "Ensure subtopics build on each other logically and cover the topic comprehensively. "
+        "Provide a brief course description (2-3 sentences) in the description field that gives "
+        "an overview of what the entire lesson plan covers and what students will achieve by completing it."
+    ),
+    response_model=LessonPlanLLMResponse
+)
+
+
 class LessonPlanService:
     """Service for managing lesson plans"""
     
@@ -39,15 +59,9 @@ class LessonPlanService:
         self.cosmos = get_cosmos_service()
         
         # Initialize OpenAI client
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "").rstrip("/")
-        api_key = os.getenv("AZURE_OPENAI_KEY")
-        self.deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4")
+        self.llm = get_llm_gateway()
         
-        self.client = OpenAI(
-            base_url=f"{endpoint}/openai/v1/",
-            api_key=api_key,
-            default_headers={"api-key": api_key}
-        )
+        self.single_flight = get_single_flight()
     
     @staticmethod
     def _deterministic_id(*parts: str) -> str:
@@ -76,46 +90,57 @@ class LessonPlanService:
         Returns:
             Generated LessonPlan object
         """
+        # A retried "create" for the same (user, subject, topic) shares one generation
+        lesson_plan_id = self._deterministic_id(user_id, subject, topic)
+        started = datetime.now(timezone.utc)
+        
+        def lookup() -> Optional[LessonPlan]:
+            plan = self.get_lesson_plan(user_id, lesson_plan_id)
+            return plan if plan and plan.aiGeneratedAt and plan.aiGeneratedAt >= started else None
+        
+        return self.single_flight.do(
+            f"plan:{lesson_plan_id}",
+            lambda: self._generate_lesson_plan(user_id, subject, topic, level, preferences, lesson_plan_id),
+            partition_key=user_id,
+            lookup=lookup
+        )
+    
+    def _generate_lesson_plan(
+        self,
+        user_id: str,
+        subject: str,
+        topic: str,
+        level: str,
+        preferences: Optional[Dict[str, Any]],
+        lesson_plan_id: str
+    ) -> LessonPlan:
+        """Generate and store a lesson plan (see generate_lesson_plan)"""
         logger.info(f"Generating lesson plan for {subject} - {topic}")
         
         preferences = preferences or {}
         detail_level = preferences.get("detailLevel", "detailed")
         max_subtopics = preferences.get("maxSubtopics", 8)
         
-        # Build prompt based on preferences
-        system_prompt = (
-            f"You are an expert {level} curriculum designer. "
-            "Generate a clear, well-structured lesson plan broken into logical subtopics. "
-            f"Each subtopic should be {detail_level} and suitable for a 15–45 minute lesson. "
-            "Include key concepts for each subtopic. "
-            "Provide a brief course description (2-3 sentences) that gives an overview of what "
-            "the entire lesson plan covers and what students will achieve by completing it."
-        )
+        # Static instructions first so repeated requests share a cacheable prefix
+        def build_messages(subject_text: str, topic_text: str) -> List[Dict[str, str]]:
+            return LESSON_PLAN_PROMPT.messages(
+                f"Generate a {level}-level lesson plan for:\n"
+                f"Subject: {subject_text}\n"
+                f"Topic: {topic_text}\n\n"
+                f"Create up to {max_subtopics} subtopics.",
+                level=level,
+                detail_level=detail_level
+            )
         
-        user_prompt = (
-            f"Generate a {level}-level lesson plan for:\n"
-            f"Subject: {subject}\n"
-            f"Topic: {topic}\n\n"
-            f"Create up to {max_subtopics} subtopics that cover the topic comprehensively. "
-            "Ensure subtopics build on each other logically. "
-            "Include a description field with 2-3 sentences summarizing the entire course."
-        )
+        # Subject and topic come straight from the request; each gets half of what the budget leaves
+        share = (budget_for("plan") - count_message_tokens(build_messages("", ""))) // 2
+        messages = build_messages(truncate_to_tokens(subject, share), truncate_to_tokens(topic, share))
+        log_prompt_tokens("plan", messages)
         
         try:
-            # Call OpenAI with structured output
-            completion = self.client.beta.chat.completions.parse(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format=LessonPlanLLMResponse,
-            )
-            
-            llm_plan = completion.choices[0].message.parsed
-            
-            # Generate deterministic IDs
-            lesson_plan_id = self._deterministic_id(user_id, subject, topic)
+            # Call OpenAI with the prebuilt structured output schema
+            with llm_work(user_id=user_id):
+                llm_plan = self.llm.parse("plan", LESSON_PLAN_PROMPT, messages)
             
             # Convert LLM response to LessonPlan model
             lesson_plan = LessonPlan(
@@ -125,6 +150,7 @@ class LessonPlanService:
                 topic=llm_plan.topic,
                 description=llm_plan.description,  # Add AI-generated description
                 aiGeneratedAt=datetime.now(timezone.utc),
+                promptVersion=LESSON_PLAN_PROMPT.tag,
                 structure=[
                     LessonPlanItem(
                         subtopicId=self._deterministic_id(lesson_plan_id, sub.title),
@@ -164,7 +190,33 @@ class LessonPlanService:
             model_class=LessonPlan,
             item_type="lessonPlan"
         )
-    
+
+    def get_lesson_plan_if_changed(
+        self, user_id: str, plan_id: str, etag: Optional[str] = None
+    ) -> Tuple[Optional[LessonPlan], Optional[str]]:
+        """
+        Get a lesson plan unless it still has `etag`
+
+        Returns (plan, etag); the plan is None when it is unchanged (etag
+        set) or missing (etag None).
+        """
+        return self.cosmos.get_item_if_changed(
+            container="LessonPlans",
+            item_id=plan_id,
+            partition_key=user_id,
+            model_class=LessonPlan,
+            etag=etag
+        )
+
+    def get_user_lesson_plans_etag(self, user_id: str) -> str:
+        """Strong ETag for a user's plan list, from each plan's `_etag`"""
+        versions = self.cosmos.get_item_versions(
+            container="LessonPlans",
+            user_id=user_id,
+            item_type="lessonPlan"
+        )
+        return collection_etag(versions)
+
     # Note: approve_lesson_plan removed — plan lifecycle no longer includes draft/approved states
     
     def update_lesson_plan_structure(
@@ -5,14 +5,23 @@ Handles lesson content generation, expansion, and management
 """
 import os
 import hashlib
+import threading
+import contextvars
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
-from openai import OpenAI
+from typing import Optional, Dict, Any, List, Iterator, Tuple, Callable
+from azure.cosmos import exceptions
 from pydantic import BaseModel
 import logging
 
-from shared.models import Lesson, LessonSection, LessonPlan
+from shared.models import Lesson, LessonSection, LessonPlan, LessonPlanItem
 from shared.cosmos_client import get_cosmos_service
+from shared.single_flight import get_single_flight
+from shared.tokens import budget_for, count_message_tokens, log_prompt_tokens, truncate_to_tokens
+from shared.llm_gateway import get_llm_gateway
+from shared.llm_scheduler import llm_work
+from shared.prompts import FORMATTING_GUIDELINES, register_prompt
+from shared.stream_broadcast import StreamBroadcast
 
 logger = logging.getLogger(__name__)
 
@@ -32,21 +41,115 @@ class LessonContentLLM(BaseModel):
     keyTerms: List[str]
 
 
+class SectionOutlineLLM(BaseModel):
+    """LLM response for one section of a lesson outline"""
+    title: str
+    keyPoints: List[str]
+
+
+class LessonOutlineLLM(BaseModel):
+    """LLM response for a lesson outline; section bodies are written separately"""
+    introduction: str
+    sections: List[SectionOutlineLLM]
+    summary: str
+    keyTerms: List[str]
+
+
+LESSON_PROMPT = register_prompt(
+    name="lesson",
+    version="2",
+    instructions=(
+        "You are an expert {level} teacher. "
+        "Generate comprehensive, engaging lesson content that is clear and age-appropriate. "
+        "Break down complex concepts into understandable sections. "
+        "Include examples and analogies where helpful. "
+        "Output the lesson in **Markdown format**, using proper headings, bullet points, numbered lists, and LaTeX math where appropriate.\n\n"
+        "Lesson structure requirements:\n"
+        "• Use clear, descriptive section titles instead of numeric labels (avoid formats like 1.1, 1.2).\n"
+        "• Organize the lesson in a natural instructional flow that feels like a real classroom lesson.\n\n"
+        "Include the following sections:\n\n"
+        "## Introduction\n"
+        "- Briefly introduce the subtopic and explain why it is important or relevant.\n\n"
+        "## Core Lesson Sections\n"
+        "- Create 2–4 main sections, each with an engaging, meaningful heading (e.g., conceptual names, guiding questions, or real-world connections).\n"
+        "- Each section should clearly explain one or more key concepts using examples, explanations, or short activities where appropriate.\n\n"
+        "## Summary & Key Takeaways\n"
+        "- Concisely recap the most important ideas students should remember.\n\n"
+        "## Key Terms\n"
+        "- Provide a bullet-point list of essential vocabulary with brief definitions.\n\n"
+        + FORMATTING_GUIDELINES
+    ),
+    response_model=LessonContentLLM
+)
+
+LESSON_OUTLINE_PROMPT = register_prompt(
+    name="lesson_outline",
+    version="1",
+    instructions=(
+        "You are an expert {level} teacher planning a lesson. "
+        "Produce the lesson outline only: the section bodies are written separately from it.\n\n"
+        "Outline requirements:\n"
+        "• introduction: briefly introduce the subtopic and explain why it is important or relevant.\n"
+        "• sections: 2–4 main sections in a natural instructional flow, each with an engaging, "
+        "meaningful title (avoid numeric labels like 1.1, 1.2) and 2–5 key points it must teach. "
+        "Between them the sections must cover every key concept.\n"
+        "• summary: concisely recap the most important ideas students should remember.\n"
+        "• keyTerms: essential vocabulary, each with a brief definition.\n\n"
+        + FORMATTING_GUIDELINES
+    ),
+    response_model=LessonOutlineLLM
+)
+
+LESSON_SECTION_PROMPT = register_prompt(
+    name="lesson_section",
+    version="1",
+    instructions=(
+        "You are an expert {level} teacher writing one section of a lesson. "
+        "Write clear, engaging, age-appropriate content that teaches every key point of the section, "
+        "using examples and analogies where helpful and short activities where appropriate. "
+        "Stay within this section: other sections cover the rest of the outline.\n\n"
+        "Output only the section body in **Markdown format**, without the section title.\n\n"
+        + FORMATTING_GUIDELINES
+    )
+)
+
+EXPAND_PROMPT = register_prompt(
+    name="expand_section",
+    version="2",
+    instructions=(
+        "You are an expert teacher. Expand on the given section with more depth, "
+        "examples, and detailed explanations. Make it engaging and thorough.\n\n"
+        "Provide:\n"
+        "- More detailed explanations\n"
+        "- 2-3 concrete examples\n"
+        "- Step-by-step breakdowns where applicable\n"
+        "- Real-world applications or analogies\n\n"
+        + FORMATTING_GUIDELINES
+    )
+)
+
+
 class LessonService:
     """Service for managing lessons"""
     
     def __init__(self):
         self.cosmos = get_cosmos_service()
         
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "").rstrip("/")
-        api_key = os.getenv("AZURE_OPENAI_KEY")
-        self.deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4")
+        self.llm = get_llm_gateway()
         
-        self.client = OpenAI(
-            base_url=f"{endpoint}/openai/v1/",
-            api_key=api_key,
-            default_headers={"api-key": api_key}
+        self.single_flight = get_single_flight()
+        
+        # "outline" writes the outline first and then every section concurrently;
+        # "single" asks for the whole lesson in one structured call
+        self.generation_mode = os.getenv("LESSON_GENERATION_MODE", "outline")
+        self._section_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("LESSON_SECTION_CONCURRENCY", "4")),
+            thread_name_prefix="lesson-section"
         )
+        
+        # In-flight streamed expansions keyed by user|lesson|section
+        self._expansions: Dict[str, StreamBroadcast] = {}
+        self._expansions_lock = threading.Lock()
     
     @staticmethod
     def _deterministic_id(*parts: str) -> str:
@@ -59,7 +162,8 @@ class LessonService:
         user_id: str,
         lesson_plan_id: str,
         subtopic_id: str,
-        level: str = "GCSE"
+        level: str = "GCSE",
+        pregenerated: bool = False
     ) -> Lesson:
         """
         Generate lesson content for a specific subtopic
@@ -69,10 +173,29 @@ class LessonService:
             lesson_plan_id: Parent lesson plan ID
             subtopic_id: Subtopic ID from the lesson plan
             level: Education level
+            pregenerated: True when generated speculatively ahead of the learner
         
         Returns:
             Generated Lesson object
         """
+        # Concurrent requests for the same lesson share one generation
+        lesson_id = self._deterministic_id(lesson_plan_id, subtopic_id)
+        return self.single_flight.do(
+            f"lesson:{lesson_id}",
+            lambda: self._generate_lesson(user_id, lesson_plan_id, subtopic_id, level, pregenerated),
+            partition_key=user_id,
+            lookup=lambda: self.get_lesson(user_id, lesson_id)
+        )
+    
+    def _generate_lesson(
+        self,
+        user_id: str,
+        lesson_plan_id: str,
+        subtopic_id: str,
+        level: str,
+        pregenerated: bool
+    ) -> Lesson:
+        """Generate and store a lesson (see generate_lesson)"""
         logger.info(f"Generating lesson for subtopic: {subtopic_id}")
         
         # Get the lesson plan to retrieve subtopic details
@@ -95,59 +218,14 @@ class LessonService:
         if not subtopic_item:
             raise ValueError(f"Subtopic {subtopic_id} not found in lesson plan")
         
-        # Generate lesson content
-        system_prompt = (
-            f"You are an expert {level} teacher. "
-            "Generate comprehensive, engaging lesson content that is clear and age-appropriate. "
-            "Break down complex concepts into understandable sections. "
-            "Include examples and analogies where helpful. "
-            "Output the lesson in **Markdown format**, using proper headings, bullet points, numbered lists, and LaTeX math where appropriate."
-        )
-
-        concepts_str = ", ".join(subtopic_item.concepts)
-        user_prompt = (
-            f"Create a detailed {level} lesson for:\n"
-            f"Subject: {lesson_plan.subject}\n"
-            f"Topic: {lesson_plan.topic}\n"
-            f"Subtopic: {subtopic_item.title}\n"
-            f"Key Concepts: {concepts_str}\n\n"
-            f"The lesson should take approximately {subtopic_item.estimatedDuration} minutes.\n\n"
-            "Lesson structure requirements:\n"
-            "• Use clear, descriptive section titles instead of numeric labels (avoid formats like 1.1, 1.2).\n"
-            "• Organize the lesson in a natural instructional flow that feels like a real classroom lesson.\n\n"
-            "Include the following sections:\n\n"
-            "## Introduction\n"
-            "- Briefly introduce the subtopic and explain why it is important or relevant.\n\n"
-            "## Core Lesson Sections\n"
-            "- Create 2–4 main sections, each with an engaging, meaningful heading (e.g., conceptual names, guiding questions, or real-world connections).\n"
-            "- Each section should clearly explain one or more key concepts using examples, explanations, or short activities where appropriate.\n\n"
-            "## Summary & Key Takeaways\n"
-            "- Concisely recap the most important ideas students should remember.\n\n"
-            "## Key Terms\n"
-            "- Provide a bullet-point list of essential vocabulary with brief definitions.\n\n"
-            "Formatting and style guidelines:\n"
-            "- Use Markdown for all formatting.\n"
-            "- Use `#` and `##` for headings and subheadings.\n"
-            "- Use `-` or `*` for bullet points.\n"
-            "- Use `1.` for numbered lists only when sequence matters.\n"
-            "- Use `$...$` for inline math and `$$...$$` for block math when needed.\n\n"
-            "- Use triple backticks ``` **only** when rendering code blocks or clearly marked callouts.\n"
-            "- Do **not** use triple backticks for regular text, examples, or emphasis.\n\n"    
-            "Ensure the lesson is engaging, clearly written, and ready to render in a Markdown/KaTeX environment."
-        )
-
-        
         try:
-            completion = self.client.beta.chat.completions.parse(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format=LessonContentLLM,
-            )
-            
-            llm_lesson = completion.choices[0].message.parsed
+            with llm_work(user_id=user_id):
+                content, prompt_tag = self.compose_lesson_content(
+                    subject=lesson_plan.subject,
+                    topic=lesson_plan.topic,
+                    subtopic_item=subtopic_item,
+                    level=level
+                )
             
             # Generate lesson ID
             lesson_id = self._deterministic_id(lesson_plan_id, subtopic_id)
@@ -162,7 +240,7 @@ class LessonService:
                 topic=lesson_plan.topic,
                 subtopic=subtopic_item.title,
                 content={
-                    "introduction": llm_lesson.introduction,
+                    "introduction": content.introduction,
                     "sections": [
                         {
                             "sectionId": self._deterministic_id(lesson_id, f"section_{i}"),
@@ -171,12 +249,14 @@ class LessonService:
                             "keyPoints": section.keyPoints,
                             "expanded": None
                         }
-                        for i, section in enumerate(llm_lesson.sections)
+                        for i, section in enumerate(content.sections)
                     ],
-                    "summary": llm_lesson.summary,
-                    "keyTerms": llm_lesson.keyTerms
+                    "summary": content.summary,
+                    "keyTerms": content.keyTerms
                 },
-                status="active"
+                status="active",
+                pregenerated=pregenerated,
+                promptVersion=prompt_tag
             )
             
             # Save to database
@@ -189,26 +269,112 @@ class LessonService:
             logger.error(f"Error generating lesson: {e}")
             raise
     
-    def expand_section(
+    def compose_lesson_content(
         self,
-        user_id: str,
-        lesson_id: str,
-        section_id: str
-    ) -> Lesson:
+        subject: str,
+        topic: str,
+        subtopic_item: LessonPlanItem,
+        level: str = "GCSE",
+        mode: Optional[str] = None
+    ) -> Tuple[LessonContentLLM, str]:
         """
-        Expand a specific section with more detailed content
+        Generate the content of a lesson without storing it
+        
+        In "outline" mode a failed outline or section call falls back to
+        the single-call generation.
         
         Args:
-            user_id: User identifier
-            lesson_id: Lesson ID
-            section_id: Section ID to expand
+            subject: Subject name
+            topic: Topic name
+            subtopic_item: The subtopic from the lesson plan
+            level: Education level
+            mode: "outline" or "single" (default LESSON_GENERATION_MODE)
         
         Returns:
-            Updated Lesson with expanded section
+            (lesson content, prompt tag(s) that produced it)
         """
-        logger.info(f"Expanding section {section_id} in lesson {lesson_id}")
+        details = (
+            f"Subject: {subject}\n"
+            f"Topic: {topic}\n"
+            f"Subtopic: {subtopic_item.title}\n"
+            f"Key Concepts: {', '.join(subtopic_item.concepts)}\n\n"
+            f"The lesson should take approximately {subtopic_item.estimatedDuration} minutes."
+        )
+        # Titles and concept lists come from the plan and are unbounded; keep them within the lesson budget
+        overhead = count_message_tokens(LESSON_PROMPT.messages(f"Create a detailed {level} lesson for:\n", level=level))
+        details = truncate_to_tokens(details, budget_for("lesson") - overhead)
+        
+        if (mode or self.generation_mode) == "outline":
+            try:
+                return self._compose_from_outline(details, level)
+            except Exception as e:
+                logger.warning(f"Outline generation failed for {subtopic_item.title}; using a single call: {e}")
+        
+        # The per-lesson details go after the static instructions
+        messages = LESSON_PROMPT.messages(f"Create a detailed {level} lesson for:\n{details}", level=level)
+        log_prompt_tokens("lesson", messages)
+        return self.llm.parse("lesson", LESSON_PROMPT, messages), LESSON_PROMPT.tag
+    
+    def _compose_from_outline(self, details: str, level: str) -> Tuple[LessonContentLLM, str]:
+        """Outline the lesson, then write every section body concurrently"""
+        messages = LESSON_OUTLINE_PROMPT.messages(f"Outline a {level} lesson for:\n{details}", level=level)
+        log_prompt_tokens("lesson_outline", messages)
+        outline = self.llm.parse("lesson_outline", LESSON_OUTLINE_PROMPT, messages)
+        if not outline.sections:
+            raise ValueError("Lesson outline has no sections")
+        
+        titles = "\n".join(f"{i + 1}. {section.title}" for i, section in enumerate(outline.sections))
+        
+        def write(index: int, section: SectionOutlineLLM) -> str:
+            key_points = "\n".join(f"- {point}" for point in section.keyPoints)
+            section_messages = LESSON_SECTION_PROMPT.messages(
+                f"Lesson:\n{details}\n\n"
+                f"Lesson sections:\n{titles}\n\n"
+                f"Write section {index + 1}: {section.title}\n"
+                f"Key points to teach:\n{key_points}",
+                level=level
+            )
+            log_prompt_tokens("lesson_section", section_messages)
+            completion = self.llm.complete("lesson_section", section_messages)
+            body = (completion.choices[0].message.content or "").strip()
+            if not body:
+                raise ValueError(f"Empty body for section {section.title}")
+            return body
+        
+        # Each section runs in a copy of this context so it keeps the caller's
+        # scheduling class and user; results come back in outline order
+        futures = [
+            self._section_executor.submit(contextvars.copy_context().run, write, i, section)
+            for i, section in enumerate(outline.sections)
+        ]
+        # On the first failure the lesson is lost, so sections still queued
+        # are cancelled instead of spending LLM calls on them
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        bodies = [future.result() for future in futures]
         
-        # Get the lesson
+        content = LessonContentLLM(
+            introduction=outline.introduction,
+            sections=[
+                LessonSectionLLM(title=section.title, content=body, keyPoints=section.keyPoints)
+                for section, body in zip(outline.sections, bodies)
+            ],
+            summary=outline.summary,
+            keyTerms=outline.keyTerms
+        )
+        return content, f"{LESSON_OUTLINE_PROMPT.tag}+{LESSON_SECTION_PROMPT.tag}"
+    
+    def _find_section(
+        self,
+        user_id: str,
+        lesson_id: str,
+        section_id: str
+    ) -> Tuple[Lesson, int, Dict[str, Any]]:
+        """Load a lesson and locate one of its sections"""
         lesson = self.cosmos.get_item(
             container="Lessons",
             item_id=lesson_id,
@@ -219,60 +385,139 @@ class LessonService:
         if not lesson:
             raise ValueError(f"Lesson {lesson_id} not found")
         
-        # Find the section
-        section_index = None
-        section_data = None
         for i, section in enumerate(lesson.content.get("sections", [])):
             if section.get("sectionId") == section_id:
-                section_index = i
-                section_data = section
-                break
+                return lesson, i, section
         
-        if section_data is None:
-            raise ValueError(f"Section {section_id} not found")
+        raise ValueError(f"Section {section_id} not found")
+    
+    @staticmethod
+    def _build_expand_messages(section_data: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Build the prompt for expanding a section, trimming its content to the expand budget"""
+        def build_content(content: str) -> str:
+            return (
+                f"Expand this section with much more detail:\n\n"
+                f"Title: {section_data.get('title')}\n"
+                f"Current Content: {content}"
+            )
         
-        # Generate expanded content
-        system_prompt = (
-            "You are an expert teacher. Expand on the given section with more depth, "
-            "examples, and detailed explanations. Make it engaging and thorough."
+        overhead = count_message_tokens(EXPAND_PROMPT.messages(build_content("")))
+        content = truncate_to_tokens(section_data.get("content"), budget_for("expand") - overhead)
+        messages = EXPAND_PROMPT.messages(build_content(content))
+        log_prompt_tokens("expand", messages)
+        return messages
+    
+    def expand_section(
+        self,
+        user_id: str,
+        lesson_id: str,
+        section_id: str
+    ) -> Lesson:
+        """
+        Expand a specific section with more detailed content
+        
+        Args:
+            user_id: User identifier
+            lesson_id: Lesson ID
+            section_id: Section ID to expand
+        
+        Returns:
+            Updated Lesson with expanded section
+        """
+        _, _, section_data = self._find_section(user_id, lesson_id, section_id)
+        return self._expand_once(
+            user_id, lesson_id, section_id,
+            previous=section_data.get("expanded"),
+            fn=lambda: self._expand_section(user_id, lesson_id, section_id)
         )
+    
+    def _expand_once(
+        self,
+        user_id: str,
+        lesson_id: str,
+        section_id: str,
+        previous: Optional[str],
+        fn: Callable[[], Lesson]
+    ) -> Lesson:
+        """
+        Run an expansion under the section's single-flight key
+        
+        Streamed and non-streamed expansions share the key, so either kind
+        joins the other instead of generating the section a second time.
+        """
+        def lookup() -> Optional[Lesson]:
+            # Another worker's expansion is visible once the stored text changes
+            lesson, _, section = self._find_section(user_id, lesson_id, section_id)
+            return lesson if section.get("expanded") != previous else None
         
-        user_prompt = (
-            f"Expand this section with much more detail:\n\n"
-            f"Title: {section_data.get('title')}\n"
-            f"Current Content: {section_data.get('content')}\n\n"
-            f"Provide:\n"
-            "- More detailed explanations\n"
-            "- 2-3 concrete examples\n"
-            "- Step-by-step breakdowns where applicable\n"
-            "- Real-world applications or analogies"
-            "Formatting and style guidelines:\n"
-            "- Use Markdown for all formatting.\n"
-            "- Use `#` and `##` for headings and subheadings.\n"
-            "- Use `-` or `*` for bullet points.\n"
-            "- Use `1.` for numbered lists only when sequence matters.\n"
-            "- Use `$...$` for inline math and `$$...$$` for block math when needed.\n\n"
-            "- Use triple backticks ``` **only** when rendering code blocks or clearly marked callouts.\n"
-            "- Do **not** use triple backticks for regular text, examples, or emphasis.\n\n"  
+        return self.single_flight.do(
+            f"expand:{lesson_id}:{section_id}",
+            fn,
+            partition_key=user_id,
+            lookup=lookup
         )
+    
+    def _store_expansion(
+        self,
+        user_id: str,
+        lesson_id: str,
+        section_id: str,
+        expanded: str
+    ) -> Lesson:
+        """
+        Write one section's expansion into the latest stored lesson
         
-        try:
-            completion = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7
+        The lesson is re-read and replaced under its etag, so a concurrent
+        expansion of another section or a completion mark is never
+        overwritten; on a conflict the section is merged into the newer copy.
+        """
+        for _ in range(5):
+            lesson, etag = self.cosmos.get_item_if_changed(
+                container="Lessons",
+                item_id=lesson_id,
+                partition_key=user_id,
+                model_class=Lesson
             )
+            if lesson is None:
+                raise ValueError(f"Lesson {lesson_id} not found")
             
-            expanded_content = completion.choices[0].message.content
+            section = next(
+                (s for s in lesson.content.get("sections", []) if s.get("sectionId") == section_id),
+                None
+            )
+            if section is None:
+                raise ValueError(f"Section {section_id} not found")
             
-            # Update the section
-            lesson.content["sections"][section_index]["expanded"] = expanded_content
+            section["expanded"] = expanded
+            section["expandedPromptVersion"] = EXPAND_PROMPT.tag
             
-            # Save updated lesson
-            updated_lesson = self.cosmos.update_item("Lessons", lesson)
+            try:
+                return self.cosmos.update_item("Lessons", lesson, etag=etag)
+            except exceptions.CosmosAccessConditionFailedError:
+                # Changed since the read; merge the section into the new version
+                continue
+        
+        raise RuntimeError(f"Could not store expansion of section {section_id}")
+    
+    def _expand_section(
+        self,
+        user_id: str,
+        lesson_id: str,
+        section_id: str
+    ) -> Lesson:
+        """Generate and store a section expansion (see expand_section)"""
+        logger.info(f"Expanding section {section_id} in lesson {lesson_id}")
+        
+        _, _, section_data = self._find_section(user_id, lesson_id, section_id)
+        messages = self._build_expand_messages(section_data)
+        
+        try:
+            with llm_work(user_id=user_id):
+                completion = self.llm.complete("expand", messages, temperature=0.7)
+            
+            expanded_content = completion.choices[0].message.content
+            
+            updated_lesson = self._store_expansion(user_id, lesson_id, section_id, expanded_content)
             logger.info(f"Expanded section {section_id}")
             
             return updated_lesson
@@ -281,6 +526,96 @@ class LessonService:
             logger.error(f"Error expanding section: {e}")
             raise
     
+    def stream_expand_section(
+        self,
+        user_id: str,
+        lesson_id: str,
+        section_id: str
+    ) -> Iterator[str]:
+        """
+        Expand a section, yielding the expansion text as it is generated
+        
+        The lesson and section are validated before anything is streamed, so
+        a missing lesson still raises ValueError to the caller. Generation
+        runs on a background thread that persists the final text once the
+        stream ends, even if every reader has disconnected. A second request
+        for a section that is already being expanded joins the in-flight
+        stream instead of starting another generation; if a non-streamed
+        expansion of the section is already running (here or on another
+        worker), its text is sent as a single chunk once it is stored.
+        
+        Args:
+            user_id: User identifier
+            lesson_id: Lesson ID
+            section_id: Section ID to expand
+        
+        Returns:
+            Iterator over expansion text chunks
+        """
+        _, _, section_data = self._find_section(user_id, lesson_id, section_id)
+        key = f"{user_id}|{lesson_id}|{section_id}"
+        
+        with self._expansions_lock:
+            broadcast = self._expansions.get(key)
+            if broadcast is None:
+                broadcast = StreamBroadcast()
+                self._expansions[key] = broadcast
+                threading.Thread(
+                    target=self._run_streamed_expansion,
+                    args=(key, broadcast, user_id, lesson_id, section_data),
+                    daemon=True
+                ).start()
+            else:
+                logger.info(f"Joining in-flight expansion of section {section_id}")
+        
+        return broadcast.subscribe()
+    
+    def _run_streamed_expansion(
+        self,
+        key: str,
+        broadcast: StreamBroadcast,
+        user_id: str,
+        lesson_id: str,
+        section_data: Dict[str, Any]
+    ) -> None:
+        """Producer for stream_expand_section: stream tokens, then persist"""
+        section_id = section_data.get("sectionId")
+        streamed = False
+        error = None
+        
+        def generate() -> Lesson:
+            nonlocal streamed
+            streamed = True
+            logger.info(f"Streaming expansion of section {section_id} in lesson {lesson_id}")
+            messages = self._build_expand_messages(section_data)
+            with llm_work(user_id=user_id):
+                for text in self.llm.stream("expand", messages, temperature=0.7):
+                    broadcast.publish(text)
+            
+            lesson = self._store_expansion(user_id, lesson_id, section_id, broadcast.text)
+            logger.info(f"Expanded section {section_id} (streamed)")
+            return lesson
+        
+        try:
+            lesson = self._expand_once(
+                user_id, lesson_id, section_id,
+                previous=section_data.get("expanded"),
+                fn=generate
+            )
+            if not streamed:
+                # Joined another expansion; send its stored text
+                for section in lesson.content.get("sections", []):
+                    if section.get("sectionId") == section_id:
+                        broadcast.publish(section.get("expanded") or "")
+            
+        except Exception as e:
+            logger.error(f"Error streaming section expansion: {e}")
+            error = e
+        finally:
+            with self._expansions_lock:
+                self._expansions.pop(key, None)
+            broadcast.close(error)
+    
     def mark_lesson_complete(
         self,
         user_id: str,
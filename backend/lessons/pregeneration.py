@@ -0,0 +1,282 @@
+"""
+Lesson Pregeneration
+Speculatively generates upcoming lessons (and optionally their question bank
+or first quiz) so they are ready before the learner opens them
+"""
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FuturesTimeoutError
+from typing import Dict, Any, Optional, Tuple
+
+from azure.cosmos import exceptions
+
+from shared.models import Lesson, LessonPlan
+from lessons.lesson_service import LessonService
+from quizzes.quiz_service import QuizService
+from quizzes.question_bank import QuestionBankService
+from shared.llm_scheduler import BACKGROUND, INTERACTIVE_GENERATION, Escalation, llm_work
+
+logger = logging.getLogger(__name__)
+
+
+class PregenerationEngine:
+    """
+    Background generator for the next lessons of a plan
+
+    After a plan is created or a lesson completed, the next
+    `PREGEN_LOOKAHEAD` subtopics in `structure` order are queued on a small
+    worker pool. Work is keyed by the deterministic lesson id, so a learner
+    opening a lesson that is still being generated waits for that generation
+    instead of starting a second one, and a queued job is cancelled if the
+    learner gets there first. Jobs that have already started run to
+    completion, since an in-flight LLM call cannot be recalled, but a job a
+    learner joins is raised from background to interactive priority. With
+    PREGEN_INCLUDE_QUIZ the question bank (or first quiz) is built by a
+    follow-up job, so the lesson is handed over as soon as it exists.
+    """
+
+    def __init__(
+        self,
+        lessons: LessonService,
+        quizzes: QuizService,
+        question_banks: Optional[QuestionBankService] = None
+    ):
+        self.lessons = lessons
+        self.quizzes = quizzes
+        self.question_banks = question_banks
+
+        self.enabled = os.getenv("PREGEN_ENABLED", "true").lower() == "true"
+        self.lookahead = int(os.getenv("PREGEN_LOOKAHEAD", "1"))
+        self.max_pending = int(os.getenv("PREGEN_MAX_PENDING", "8"))
+        self.include_quiz = os.getenv("PREGEN_INCLUDE_QUIZ", "false").lower() == "true"
+        self.wait_timeout = float(os.getenv("PREGEN_WAIT_TIMEOUT_SECONDS", "120"))
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("PREGEN_MAX_WORKERS", "2")),
+            thread_name_prefix="pregen"
+        )
+        # lesson_id (or "quiz:<lesson_id>" for follow-ups) -> (lesson_plan_id, future, escalation)
+        self._jobs: Dict[str, Tuple[str, Future, Optional[Escalation]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "scheduled": 0,
+            "generated": 0,
+            "skipped": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "hits": 0,
+            "inflightJoins": 0,
+            "misses": 0,
+        }
+
+    # ==================== SCHEDULING ====================
+
+    def schedule_next(self, user_id: str, lesson_plan: LessonPlan, after_order: int = 0) -> int:
+        """
+        Queue the next lessons of a plan after the given subtopic order
+
+        Returns:
+            Number of lessons newly queued
+        """
+        if not self.enabled or self.lookahead <= 0:
+            return 0
+
+        upcoming = sorted(
+            (st for st in lesson_plan.structure if st.order > after_order),
+            key=lambda st: st.order
+        )[:self.lookahead]
+
+        queued = 0
+        for item in upcoming:
+            lesson_id = LessonService._deterministic_id(lesson_plan.id, item.subtopicId)
+            with self._lock:
+                if lesson_id in self._jobs:
+                    continue
+                if len(self._jobs) >= self.max_pending:
+                    logger.info("Pregeneration budget reached; not queueing more lessons")
+                    break
+                escalation = Escalation()
+                future = self._executor.submit(
+                    self._pregenerate, user_id, lesson_plan.id, item.subtopicId, lesson_id, escalation
+                )
+                self._jobs[lesson_id] = (lesson_plan.id, future, escalation)
+                self._stats["scheduled"] += 1
+            future.add_done_callback(lambda _f, lid=lesson_id: self._forget(lid))
+            queued += 1
+
+        if queued:
+            logger.info(f"Queued {queued} lesson(s) for pregeneration in plan {lesson_plan.id}")
+        return queued
+
+    def cancel_plan(self, lesson_plan_id: str) -> int:
+        """Cancel queued pregeneration for a plan (e.g. when it is deleted)"""
+        with self._lock:
+            jobs = [f for plan_id, f, _ in self._jobs.values() if plan_id == lesson_plan_id]
+        cancelled = sum(1 for f in jobs if f.cancel())
+        if cancelled:
+            with self._lock:
+                self._stats["cancelled"] += cancelled
+            logger.info(f"Cancelled {cancelled} pregeneration job(s) for plan {lesson_plan_id}")
+        return cancelled
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ==================== ON-DEMAND INTEGRATION ====================
+
+    def claim(self, lesson_plan_id: str, subtopic_id: str) -> Optional[Lesson]:
+        """
+        Hand an in-flight speculative generation to an on-demand request
+
+        A job that is still queued is cancelled so the caller can generate
+        immediately; a running job is raised to interactive priority and
+        awaited, and its lesson returned.
+
+        Returns:
+            The pregenerated Lesson, or None if the caller should generate it
+        """
+        lesson_id = LessonService._deterministic_id(lesson_plan_id, subtopic_id)
+        with self._lock:
+            job = self._jobs.get(lesson_id)
+
+        if job is None:
+            self._count("misses")
+            return None
+
+        _, future, escalation = job
+        if future.cancel():
+            self._count("cancelled")
+            self._count("misses")
+            return None
+
+        # A learner is waiting now; the rest of the job is no longer speculative
+        escalation.raise_to(INTERACTIVE_GENERATION)
+
+        try:
+            lesson = future.result(timeout=self.wait_timeout)
+        except FuturesTimeoutError:
+            logger.warning(f"Timed out waiting for pregenerated lesson {lesson_id}")
+            lesson = None
+        except Exception:
+            lesson = None
+
+        if lesson is None:
+            self._count("misses")
+            return None
+
+        self._count("inflightJoins")
+        self.record_hit(lesson)
+        return lesson
+
+    def record_hit(self, lesson: Lesson) -> None:
+        """Count the first open of a pregenerated lesson and clear its flag"""
+        if not lesson.pregenerated:
+            return
+        lesson.pregenerated = False
+
+        # Clear the flag on the stored lesson, not on this copy, which may
+        # predate a section expansion or another write
+        for _ in range(5):
+            try:
+                current, etag = self.lessons.cosmos.get_item_if_changed(
+                    container="Lessons",
+                    item_id=lesson.id,
+                    partition_key=lesson.userId,
+                    model_class=Lesson
+                )
+                if current is None or not current.pregenerated:
+                    return  # deleted, or another request already counted the hit
+                current.pregenerated = False
+                self.lessons.cosmos.update_item("Lessons", current, etag=etag)
+                break
+            except exceptions.CosmosAccessConditionFailedError:
+                continue
+            except Exception as e:
+                logger.warning(f"Could not clear pregenerated flag on lesson {lesson.id}: {e}")
+                return
+        else:
+            logger.warning(f"Could not clear pregenerated flag on lesson {lesson.id}: kept changing")
+            return
+
+        self._count("hits")
+        logger.info(f"Pregeneration hit for lesson {lesson.id} (hit rate {self.stats()['hitRate']:.0%})")
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters since startup; hitRate is hits per pregenerated lesson"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["pending"] = len(self._jobs)
+        stats["hitRate"] = stats["hits"] / stats["generated"] if stats["generated"] else 0.0
+        return stats
+
+    # ==================== WORKER ====================
+
+    def _pregenerate(
+        self,
+        user_id: str,
+        lesson_plan_id: str,
+        subtopic_id: str,
+        lesson_id: str,
+        escalation: Escalation
+    ) -> Optional[Lesson]:
+        # Speculative work must not hold up learners' own LLM calls
+        with llm_work(BACKGROUND, user_id, escalation):
+            if self.lessons.get_lesson(user_id, lesson_id):
+                self._count("skipped")
+                return None
+
+            try:
+                lesson = self.lessons.generate_lesson(
+                    user_id=user_id,
+                    lesson_plan_id=lesson_plan_id,
+                    subtopic_id=subtopic_id,
+                    pregenerated=True
+                )
+            except Exception as e:
+                self._count("failed")
+                logger.warning(f"Pregeneration failed for subtopic {subtopic_id}: {e}")
+                return None
+
+        self._count("generated")
+
+        if self.include_quiz:
+            self._schedule_quiz(user_id, lesson_plan_id, subtopic_id, lesson.id)
+
+        return lesson
+
+    def _schedule_quiz(self, user_id: str, lesson_plan_id: str, subtopic_id: str, lesson_id: str) -> None:
+        """Queue the question bank (or first quiz) of a pregenerated lesson as its own job"""
+        key = f"quiz:{lesson_id}"
+        with self._lock:
+            if key in self._jobs:
+                return
+            try:
+                future = self._executor.submit(self._pregenerate_quiz, user_id, subtopic_id, lesson_id)
+            except RuntimeError:
+                return  # shutting down
+            self._jobs[key] = (lesson_plan_id, future, None)
+        future.add_done_callback(lambda _f: self._forget(key))
+
+    def _pregenerate_quiz(self, user_id: str, subtopic_id: str, lesson_id: str) -> None:
+        with llm_work(BACKGROUND, user_id):
+            try:
+                if self.question_banks is not None and self.question_banks.enabled:
+                    self.question_banks.build_bank(user_id, lesson_id, subtopic_id)
+                else:
+                    self.quizzes.generate_quiz(
+                        user_id=user_id,
+                        lesson_id=lesson_id,
+                        subtopic_id=subtopic_id,
+                        pregenerated=True
+                    )
+            except Exception as e:
+                logger.warning(f"Quiz pregeneration failed for lesson {lesson_id}: {e}")
+
+    def _forget(self, lesson_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(lesson_id, None)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
@@ -7,11 +7,16 @@ from datetime import datetime, timezone
 from typing import Optional, Dict, Any, List
 import logging
 
+from azure.cosmos import exceptions
+
 from shared.models import Progress, LessonPlan, QuizAttempt, Lesson
 from shared.cosmos_client import get_cosmos_service
 
 logger = logging.getLogger(__name__)
 
+# Attempt ids remembered per subtopic so a resubmitted attempt is not counted twice
+APPLIED_ATTEMPTS_KEPT = 20
+
 
 class ProgressService:
     """Lightweight service for tracking overall progress per lesson plan."""
@@ -124,35 +129,56 @@ class ProgressService:
         if not lesson:
             raise ValueError(f"Lesson {attempt.lessonId} not found")
 
-        progress = self._get_or_create_progress(user_id, lesson.lessonPlanId)
-
-        subtopic_id = attempt.subtopicId
-        subprog = progress.subtopicProgress or {}
-        entry = subprog.setdefault(subtopic_id, {})
-
-        prev_count = int(entry.get("quizAttempts", 0))
-        prev_avg = float(entry.get("averageScore", 0.0))
-        score_pct = float((attempt.score or {}).get("percentage", 0.0))
-
-        # Update counts and rolling average
-        new_count = prev_count + 1
-        new_avg = (prev_avg * prev_count + score_pct) / new_count if new_count > 0 else 0.0
-
-        entry["quizAttempts"] = new_count
-        entry["averageScore"] = new_avg
-        entry["bestScore"] = max(float(entry.get("bestScore", 0.0)), score_pct)
-        entry["lastAttemptAt"] = attempt.completedAt.isoformat() if attempt.completedAt else None
-
-        # If best score reaches threshold, mark completed
-        if entry.get("bestScore", 0) >= 80:
-            entry["status"] = "completed"
-        else:
-            entry["status"] = "in_progress"
-
-        progress.subtopicProgress = subprog
-        progress.updatedAt = datetime.now(timezone.utc)
-
-        return self.cosmos.update_item("Progress", progress)
+        for _ in range(5):
+            progress, etag = self.cosmos.get_item_if_changed(
+                container="Progress",
+                item_id=f"progress_{lesson.lessonPlanId}",
+                partition_key=user_id,
+                model_class=Progress,
+            )
+            if progress is None:
+                self.initialize_progress(user_id, lesson.lessonPlanId)
+                continue
+
+            subprog = progress.subtopicProgress or {}
+            entry = subprog.setdefault(attempt.subtopicId, {})
+
+            # A resubmitted attempt (a retried job) was already counted
+            applied = entry.get("appliedAttempts", [])
+            if attempt.id in applied:
+                logger.info("Quiz attempt %s already counted towards progress", attempt.id)
+                return progress
+
+            prev_count = int(entry.get("quizAttempts", 0))
+            prev_avg = float(entry.get("averageScore", 0.0))
+            score_pct = float((attempt.score or {}).get("percentage", 0.0))
+
+            # Update counts and rolling average
+            new_count = prev_count + 1
+            new_avg = (prev_avg * prev_count + score_pct) / new_count if new_count > 0 else 0.0
+
+            entry["quizAttempts"] = new_count
+            entry["averageScore"] = new_avg
+            entry["bestScore"] = max(float(entry.get("bestScore", 0.0)), score_pct)
+            entry["lastAttemptAt"] = attempt.completedAt.isoformat() if attempt.completedAt else None
+            entry["appliedAttempts"] = (applied + [attempt.id])[-APPLIED_ATTEMPTS_KEPT:]
+
+            # If best score reaches threshold, mark completed
+            if entry.get("bestScore", 0) >= 80:
+                entry["status"] = "completed"
+            else:
+                entry["status"] = "in_progress"
+
+            progress.subtopicProgress = subprog
+            progress.updatedAt = datetime.now(timezone.utc)
+
+            try:
+                return self.cosmos.update_item("Progress", progress, etag=etag)
+            except exceptions.CosmosAccessConditionFailedError:
+                # Changed since the read; apply the attempt to the new version
+                continue
+
+        raise RuntimeError(f"Could not update progress for quiz attempt {quiz_attempt_id}")
     
     def get_progress(self, user_id: str, lesson_plan_id: str) -> Optional[Progress]:
         """Retrieve a single progress record."""
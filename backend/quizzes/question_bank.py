@@ -0,0 +1,476 @@
+"""
+Question Bank
+Per-lesson pool of generated questions that quizzes are sampled from, so
+starting or retaking a quiz does not need an LLM call
+"""
+import os
+import uuid
+import random
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from azure.cosmos import exceptions
+from pydantic import BaseModel
+
+from shared.models import Lesson, Question, QuestionBank, Quiz
+from shared.cosmos_client import get_cosmos_service
+from shared.tokens import (
+    budget_for, count_message_tokens, fit_lesson_context, log_prompt_tokens, truncate_to_tokens
+)
+from shared.llm_gateway import get_llm_gateway
+from shared.prompts import FORMATTING_GUIDELINES, register_prompt
+from shared.single_flight import get_single_flight
+from shared.llm_scheduler import BACKGROUND, llm_work
+from quizzes.quiz_service import QuestionLLM, compile_rubric, _normalize_answer
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ("easy", "medium", "hard")
+QUESTION_TYPES = ["multiple_choice", "short_answer", "long_answer"]
+
+
+class BankQuestionLLM(QuestionLLM):
+    """LLM response for a question bank entry"""
+    concept: str
+
+
+class QuestionBankLLM(BaseModel):
+    """LLM response for a batch of question bank entries"""
+    questions: List[BankQuestionLLM]
+
+
+QUESTION_BANK_PROMPT = register_prompt(
+    name="question_bank",
+    version="1",
+    instructions=(
+        "You are an expert GCSE assessment designer building a bank of questions for one lesson. "
+        "Quizzes are sampled from the bank, so every question must stand on its own and no two "
+        "questions may test the same point in the same way.\n\n"
+        "Cover every concept in the lesson content. Tag each question with `concept`, a short "
+        "lowercase name (2-4 words) for the concept it tests, reusing the same name for questions "
+        "on the same concept. Set `difficulty` to exactly one of easy, medium or hard.\n\n"
+        "Multiple choice questions should have 4 options with plausible distractors. "
+        "Short answer questions should be answerable in 1-2 sentences. "
+        "Long answer questions should require 3-5 sentences and deeper understanding. "
+        "For short/long answers, provide detailed mark schemes. "
+        "For every question include a numeric `maxMarks` field indicating the total marks available. "
+        "For multiple choice questions, use 1 mark unless there is a reason to use more.\n\n"
+        + FORMATTING_GUIDELINES
+    ),
+    response_model=QuestionBankLLM
+)
+
+
+class QuestionBankService:
+    """
+    Generates, stores and samples per-lesson question banks
+
+    The first quiz for a lesson generates QUESTION_BANK_SIZE questions in
+    one call, tagged with type, difficulty and concept. Every quiz after
+    that is sampled from the bank: the questions served least often come
+    first, and the mix is spread across concepts, types and (for "mixed"
+    quizzes) difficulties. When fewer than QUESTION_BANK_LOW_WATERMARK
+    unseen questions remain for a request, QUESTION_BANK_TOPUP_SIZE more
+    are generated in the background. Generated questions whose wording
+    (nearly) duplicates a banked one are dropped.
+    """
+
+    CONTAINER = "QuestionBanks"
+
+    def __init__(self):
+        self.cosmos = get_cosmos_service()
+
+        self.llm = get_llm_gateway()
+
+        self.single_flight = get_single_flight()
+
+        self.enabled = os.getenv("QUESTION_BANK_ENABLED", "true").lower() == "true"
+        self.initial_size = int(os.getenv("QUESTION_BANK_SIZE", "20"))
+        self.topup_size = int(os.getenv("QUESTION_BANK_TOPUP_SIZE", "10"))
+        self.low_watermark = int(os.getenv("QUESTION_BANK_LOW_WATERMARK", "5"))
+        self.max_size = int(os.getenv("QUESTION_BANK_MAX_SIZE", "100"))
+        # Word-set overlap (Jaccard) above which two questions count as duplicates
+        self.duplicate_threshold = float(os.getenv("QUESTION_BANK_DUPLICATE_THRESHOLD", "0.8"))
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("QUESTION_BANK_MAX_WORKERS", "2")),
+            thread_name_prefix="question-bank"
+        )
+        self._topups: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "quizzes": 0,
+            "builds": 0,
+            "topUps": 0,
+            "blockingTopUps": 0,
+            "generated": 0,
+            "duplicates": 0,
+            "failed": 0,
+        }
+
+    # ==================== QUIZZES ====================
+
+    def start_quiz(
+        self,
+        user_id: str,
+        lesson_id: str,
+        subtopic_id: str,
+        difficulty: str = "mixed",
+        count: int = 5,
+        question_types: Optional[List[str]] = None
+    ) -> Quiz:
+        """
+        Create a quiz sampled from the lesson's question bank
+
+        The bank is generated on first use. If it cannot cover the request
+        (e.g. the first "hard" quiz of a mixed bank), more questions are
+        generated before sampling; otherwise no LLM call is made.
+
+        Args:
+            user_id: User identifier
+            lesson_id: Lesson ID
+            subtopic_id: Subtopic ID
+            difficulty: easy, medium, hard or mixed
+            count: Number of questions
+            question_types: Question types to include (default all)
+
+        Returns:
+            The stored Quiz
+        """
+        question_types = question_types or QUESTION_TYPES
+        target = difficulty.lower() if difficulty and difficulty.lower() in DIFFICULTIES else None
+
+        bank = self.get_bank(user_id, lesson_id) or self.build_bank(user_id, lesson_id, subtopic_id)
+
+        candidates = self._candidates(bank, question_types, target)
+        if len(candidates) < count and len(bank.questions) < self.max_size:
+            self._count("blockingTopUps")
+            bank = self.top_up(user_id, lesson_id, max(self.topup_size, count - len(candidates)), target)
+            candidates = self._candidates(bank, question_types, target)
+        if len(candidates) < count and target:
+            logger.info(f"Not enough {target} questions for lesson {lesson_id}; mixing in other difficulties")
+            candidates = self._candidates(bank, question_types, None)
+        if not candidates:
+            raise RuntimeError(f"Question bank for lesson {lesson_id} has no usable questions")
+
+        picked = self._pick(candidates, bank.served, count, balance_difficulty=target is None)
+        served = self._record_served(user_id, lesson_id, [q.questionId for q in picked])
+
+        unseen = sum(1 for q in candidates if served.get(q.questionId, 0) == 0)
+        if unseen < self.low_watermark and len(bank.questions) < self.max_size:
+            self._schedule_top_up(user_id, lesson_id, target)
+
+        quiz = Quiz(
+            id=str(uuid.uuid4()),
+            userId=user_id,
+            lessonId=lesson_id,
+            subtopicId=subtopic_id,
+            questions=[
+                q.model_copy(update={"questionId": f"q{i+1}", "bankQuestionId": q.questionId})
+                for i, q in enumerate(picked)
+            ],
+            createdAt=datetime.now(timezone.utc),
+            promptVersion=bank.promptVersion,
+            questionBankId=bank.id
+        )
+        created_quiz = self.cosmos.create_item("Quizzes", quiz)
+        self._count("quizzes")
+        logger.info(f"Created quiz {created_quiz.id} from question bank ({len(picked)} of {len(candidates)} questions)")
+        return created_quiz
+
+    @staticmethod
+    def _candidates(
+        bank: QuestionBank,
+        question_types: List[str],
+        difficulty: Optional[str]
+    ) -> List[Question]:
+        return [
+            q for q in bank.questions
+            if q.type in question_types and (difficulty is None or q.difficulty == difficulty)
+        ]
+
+    @staticmethod
+    def _pick(
+        candidates: List[Question],
+        served: Dict[str, int],
+        count: int,
+        balance_difficulty: bool
+    ) -> List[Question]:
+        """
+        Choose `count` questions, least served first, then spread across
+        concepts, question types and (if balancing) difficulties
+
+        Ties are broken at random so retakes get a fresh mix. The result is
+        ordered from easiest to hardest.
+        """
+        remaining = list(candidates)
+        random.shuffle(remaining)
+        concepts: Counter = Counter()
+        types: Counter = Counter()
+        levels: Counter = Counter()
+        picked: List[Question] = []
+
+        while remaining and len(picked) < count:
+            best = min(remaining, key=lambda q: (
+                served.get(q.questionId, 0),
+                concepts[q.concept],
+                levels[q.difficulty] if balance_difficulty else 0,
+                types[q.type]
+            ))
+            remaining.remove(best)
+            picked.append(best)
+            concepts[best.concept] += 1
+            types[best.type] += 1
+            levels[best.difficulty] += 1
+
+        rank = {d: i for i, d in enumerate(DIFFICULTIES)}
+        return sorted(picked, key=lambda q: rank.get(q.difficulty, len(rank)))
+
+    def _record_served(self, user_id: str, lesson_id: str, question_ids: List[str]) -> Dict[str, int]:
+        """Bump the served counters; returns the bank's counters afterwards"""
+        def bump(bank: QuestionBank) -> None:
+            for question_id in question_ids:
+                bank.served[question_id] = bank.served.get(question_id, 0) + 1
+
+        try:
+            return self._modify(user_id, lesson_id, bump).served
+        except Exception as e:
+            # Sampling still works without the update; it only repeats questions sooner
+            logger.warning(f"Could not record served questions for lesson {lesson_id}: {e}")
+            return {}
+
+    # ==================== BANKS ====================
+
+    def get_bank(self, user_id: str, lesson_id: str) -> Optional[QuestionBank]:
+        return self._read(user_id, lesson_id)[0]
+
+    def build_bank(self, user_id: str, lesson_id: str, subtopic_id: Optional[str] = None) -> QuestionBank:
+        """Generate a lesson's bank; concurrent callers share one generation"""
+        return self.single_flight.do(
+            f"question_bank:{lesson_id}",
+            lambda: self._build_bank(user_id, lesson_id, subtopic_id),
+            partition_key=user_id,
+            lookup=lambda: self.get_bank(user_id, lesson_id)
+        )
+
+    def _build_bank(self, user_id: str, lesson_id: str, subtopic_id: Optional[str]) -> QuestionBank:
+        existing = self.get_bank(user_id, lesson_id)
+        if existing:
+            return existing
+
+        lesson = self._get_lesson(user_id, lesson_id)
+        logger.info(f"Building question bank for lesson: {lesson_id}")
+
+        now = datetime.now(timezone.utc)
+        bank = QuestionBank(
+            id=lesson_id,
+            userId=user_id,
+            lessonId=lesson_id,
+            subtopicId=subtopic_id or lesson.subtopicId,
+            createdAt=now,
+            updatedAt=now,
+            promptVersion=QUESTION_BANK_PROMPT.tag
+        )
+        with llm_work(user_id=user_id):
+            generated = self._generate(lesson, self.initial_size, None, [])
+        self._count("duplicates", self._merge(bank, generated))
+
+        try:
+            created = self.cosmos.create_item(self.CONTAINER, bank)
+        except exceptions.CosmosResourceExistsError:
+            # Another worker won the race; keep theirs
+            return self.get_bank(user_id, lesson_id)
+
+        self._count("builds")
+        logger.info(f"Question bank for lesson {lesson_id} has {len(created.questions)} questions")
+        return created
+
+    def top_up(
+        self,
+        user_id: str,
+        lesson_id: str,
+        size: int,
+        difficulty: Optional[str] = None
+    ) -> QuestionBank:
+        """Generate `size` more questions (of one difficulty, or mixed) and add the new ones"""
+        return self.single_flight.do(
+            f"question_bank_topup:{lesson_id}",
+            lambda: self._top_up(user_id, lesson_id, size, difficulty),
+            partition_key=user_id,
+            lookup=lambda: self.get_bank(user_id, lesson_id)
+        )
+
+    def _top_up(self, user_id: str, lesson_id: str, size: int, difficulty: Optional[str]) -> QuestionBank:
+        bank = self.get_bank(user_id, lesson_id)
+        if bank is None:
+            raise ValueError(f"Question bank for lesson {lesson_id} not found")
+
+        lesson = self._get_lesson(user_id, lesson_id)
+        logger.info(f"Topping up question bank for lesson {lesson_id} ({difficulty or 'mixed'})")
+        with llm_work(user_id=user_id):
+            generated = self._generate(lesson, size, difficulty, bank.questions)
+
+        dropped = 0
+
+        def add(current: QuestionBank) -> None:
+            nonlocal dropped
+            dropped = self._merge(current, generated)
+
+        bank = self._modify(user_id, lesson_id, add)
+        self._count("duplicates", dropped)
+        self._count("topUps")
+        return bank
+
+    def _schedule_top_up(self, user_id: str, lesson_id: str, difficulty: Optional[str]) -> None:
+        with self._lock:
+            if lesson_id in self._topups:
+                return
+            self._topups.add(lesson_id)
+
+        def run() -> None:
+            try:
+                with llm_work(BACKGROUND, user_id):
+                    self.top_up(user_id, lesson_id, self.topup_size, difficulty)
+            except Exception as e:
+                self._count("failed")
+                logger.warning(f"Question bank top-up failed for lesson {lesson_id}: {e}")
+            finally:
+                with self._lock:
+                    self._topups.discard(lesson_id)
+
+        self._executor.submit(run)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters since startup; quizzes served from a bank vs LLM generations"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["pendingTopUps"] = len(self._topups)
+        return stats
+
+    # ==================== GENERATION ====================
+
+    def _generate(
+        self,
+        lesson: Lesson,
+        size: int,
+        difficulty: Optional[str],
+        existing: List[Question]
+    ) -> List[Question]:
+        """Ask the LLM for `size` questions, steering it away from `existing` ones"""
+        budget = budget_for("question_bank")
+        avoid = truncate_to_tokens("\n".join(f"- {q.question}" for q in existing), budget // 4)
+
+        def build_content(lesson_context: str) -> str:
+            content = (
+                f"Create {size} questions for this lesson's question bank:\n\n"
+                f"Subject: {lesson.subject}\n"
+                f"Topic: {lesson.topic}\n"
+                f"Subtopic: {lesson.subtopic}\n"
+                f"Question Types to Include: {', '.join(QUESTION_TYPES)}\n"
+                f"Difficulty: {difficulty or 'an even mix of easy, medium and hard'}\n\n"
+            )
+            if avoid:
+                content += f"The bank already has these questions; do not repeat or reword them:\n{avoid}\n\n"
+            return content + f"Lesson Content:\n{lesson_context}"
+
+        overhead = count_message_tokens(QUESTION_BANK_PROMPT.messages(build_content("")))
+        lesson_context = fit_lesson_context(
+            lesson.content.get("sections", []),
+            lesson.content.get("summary", ""),
+            lesson.content.get("keyTerms", []),
+            budget - overhead
+        )
+        messages = QUESTION_BANK_PROMPT.messages(build_content(lesson_context))
+        log_prompt_tokens("question_bank", messages)
+
+        result = self.llm.parse("question_bank", QUESTION_BANK_PROMPT, messages)
+        self._count("generated", len(result.questions))
+
+        return [
+            Question(
+                questionId="",
+                type=q.type,
+                question=q.question,
+                options=q.options,
+                correctAnswer=q.correctAnswer,
+                markScheme=q.markScheme,
+                rubric=compile_rubric(q.markScheme, q.maxMarks) if q.markScheme else None,
+                maxMarks=float(q.maxMarks) if q.maxMarks is not None else None,
+                difficulty=q.difficulty.strip().lower(),
+                concept=q.concept.strip().lower()
+            )
+            for q in result.questions
+        ]
+
+    def _merge(self, bank: QuestionBank, questions: List[Question]) -> int:
+        """
+        Append questions that are not (near-)duplicates of banked ones
+
+        Returns:
+            Number of questions dropped as duplicates
+        """
+        seen = [set(_normalize_answer(q.question).split()) for q in bank.questions]
+        dropped = 0
+        for question in questions:
+            words = set(_normalize_answer(question.question).split())
+            if not words or any(
+                len(words & other) / len(words | other) >= self.duplicate_threshold for other in seen
+            ):
+                dropped += 1
+                continue
+            seen.append(words)
+            bank.questions.append(question.model_copy(update={"questionId": f"b{len(bank.questions) + 1}"}))
+        return dropped
+
+    # ==================== STORAGE ====================
+
+    def _get_lesson(self, user_id: str, lesson_id: str) -> Lesson:
+        lesson = self.cosmos.get_item(
+            container="Lessons",
+            item_id=lesson_id,
+            partition_key=user_id,
+            model_class=Lesson
+        )
+        if not lesson:
+            raise ValueError(f"Lesson {lesson_id} not found")
+        return lesson
+
+    def _read(self, user_id: str, lesson_id: str) -> Tuple[Optional[QuestionBank], Optional[str]]:
+        """Read a bank along with its `_etag`"""
+        return self.cosmos.get_item_if_changed(
+            container=self.CONTAINER,
+            item_id=lesson_id,
+            partition_key=user_id,
+            model_class=QuestionBank
+        )
+
+    def _modify(
+        self,
+        user_id: str,
+        lesson_id: str,
+        change: Callable[[QuestionBank], None],
+        attempts: int = 5
+    ) -> QuestionBank:
+        """Apply `change` to the stored bank with optimistic concurrency, retrying on conflict"""
+        for _ in range(attempts):
+            bank, etag = self._read(user_id, lesson_id)
+            if bank is None:
+                raise ValueError(f"Question bank for lesson {lesson_id} not found")
+            change(bank)
+            bank.updatedAt = datetime.now(timezone.utc)
+            try:
+                return self.cosmos.update_item(self.CONTAINER, bank, etag=etag)
+            except exceptions.CosmosAccessConditionFailedError:
+                continue
+        raise RuntimeError(f"Question bank for lesson {lesson_id} kept changing; update abandoned")
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
@@ -3,15 +3,27 @@ Quiz Service
 Handles quiz generation, submission, and grading
 """
 import os
+import re
+import time
 import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any
-from openai import OpenAI
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel
+from azure.cosmos import exceptions
 import logging
+import threading
 
 from shared.models import Quiz, Question, QuizAttempt, QuizAttemptResponse, Lesson
 from shared.cosmos_client import get_cosmos_service
+from shared.tokens import (
+    budget_for, count_tokens, count_message_tokens, fit_lesson_context,
+    log_prompt_tokens, truncate_to_tokens
+)
+from shared.llm_gateway import get_llm_gateway
+from shared.llm_scheduler import INTERACTIVE_GRADING, llm_work
+from shared.prompts import FORMATTING_GUIDELINES, register_prompt
 
 logger = logging.getLogger(__name__)
 
@@ -40,21 +52,263 @@ class QuizGradingLLM(BaseModel):
     generatedAnswer: Optional[str] = None
 
 
+class QuestionGradeLLM(BaseModel):
+    """LLM grade for one question in a batched grading response"""
+    questionId: str
+    marksAwarded: float
+    feedback: str
+
+
+class QuizBatchGradingLLM(BaseModel):
+    """LLM response for grading every written answer of an attempt at once"""
+    grades: List[QuestionGradeLLM]
+
+
+QUIZ_PROMPT = register_prompt(
+    name="quiz",
+    version="2",
+    instructions=(
+        "You are an expert GCSE assessment designer. "
+        "Create fair, clear questions that test understanding of the lesson content. "
+        "Multiple choice questions should have plausible distractors. "
+        "Short answer questions should be answerable in 1-2 sentences. "
+        "Long answer questions should require 3-5 sentences and deeper understanding.\n\n"
+        "Distribute questions across the content. "
+        "For multiple choice, provide 4 options. "
+        "For short/long answers, provide detailed mark schemes. "
+        "For every question include a numeric `maxMarks` field indicating the total marks available. "
+        "For multiple choice questions, use 1 mark unless there is a reason to use more.\n\n"
+        + FORMATTING_GUIDELINES
+    ),
+    response_model=QuizLLM
+)
+
+GRADE_PROMPT = register_prompt(
+    name="grade",
+    version="2",
+    instructions=(
+        "You are a fair, constructive GCSE examiner. "
+        "Grade the student answer according to the mark scheme. "
+        "Award partial marks for partially correct points based on the student's answer. "
+        "Provide constructive feedback on what was good and what was missing.\n\n"
+        + FORMATTING_GUIDELINES
+    ),
+    response_model=QuizGradingLLM
+)
+
+BATCH_GRADE_PROMPT = register_prompt(
+    name="grade_batch",
+    version="2",
+    instructions=(
+        "You are a fair, constructive GCSE examiner. "
+        "Grade each student answer against its rubric, where `[n]` is the marks for that point. "
+        "Award partial marks for partially correct points and never exceed a question's total. "
+        "Return one grade per question, using its question id, with constructive feedback on "
+        "what was good and what was missing.\n\n"
+        + FORMATTING_GUIDELINES
+    ),
+    response_model=QuizBatchGradingLLM
+)
+
+
+# Feedback of a written answer the LLM failed to grade; scored 0 and kept out of evaluations
+GRADING_FALLBACK_FEEDBACK = "Unable to grade answer automatically."
+
+_RUBRIC_MARKS_PATTERNS = [
+    re.compile(r"^\s*award\s+(\d+(?:\.\d+)?)\s+marks?\s+(?:for|if|when)\s+", re.IGNORECASE),
+    re.compile(r"^\s*\(?(\d+(?:\.\d+)?)\s*marks?\)?\s*[:\-\u2013]\s*", re.IGNORECASE),
+    re.compile(r"^\s*\[(\d+(?:\.\d+)?)\]\s*"),
+    re.compile(r"\s*[\(\[](\d+(?:\.\d+)?)\s*(?:marks?)?[\)\]]\s*\.?\s*$", re.IGNORECASE),
+]
+_RUBRIC_FILLER = re.compile(
+    r"^\s*(?:award\s+(?:a\s+|one\s+)?marks?\s+(?:for|if|when)\s+|"
+    r"(?:the\s+)?(?:student|candidate|answer)\s+(?:should\s+|must\s+)?(?:correctly\s+)?)",
+    re.IGNORECASE
+)
+
+
+def compile_rubric(mark_scheme: List[str], max_marks: Optional[float] = None) -> str:
+    """
+    Compile a verbose mark scheme into a compact rubric
+    
+    Each point becomes one `[marks] criterion` line. Explicit mark values
+    ("Award 2 marks for ...", "(1 mark)", "[2]") are kept; the remaining
+    marks are shared evenly across points that do not state any, which get
+    0 once the stated marks already reach `max_marks`.
+    """
+    points: List[Tuple[Optional[float], str]] = []
+    for raw in mark_scheme or []:
+        text = " ".join(str(raw).split())
+        marks = None
+        for pattern in _RUBRIC_MARKS_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                marks = float(match.group(1))
+                text = (text[:match.start()] + text[match.end():]).strip()
+                break
+        text = _RUBRIC_FILLER.sub("", text).rstrip(" .;")
+        if text:
+            points.append((marks, text[0].upper() + text[1:]))
+    
+    if not points:
+        return ""
+    
+    stated = sum(m for m, _ in points if m is not None)
+    unstated = [i for i, (m, _) in enumerate(points) if m is None]
+    if unstated:
+        remaining = (max_marks - stated) if max_marks is not None else float(len(unstated))
+        share = max(remaining, 0.0) / len(unstated)
+        points = [(share if m is None else m, t) for m, t in points]
+    
+    return "\n".join(f"[{m:g}] {t}" for m, t in points)
+
+
+_STOPWORDS = {
+    "about", "above", "after", "also", "answer", "award", "because", "being", "between",
+    "candidate", "correct", "correctly", "describe", "does", "each", "explain", "explains",
+    "from", "give", "gives", "have", "identify", "identifies", "into", "mark", "marks",
+    "mention", "mentions", "more", "must", "only", "other", "should", "show", "shows",
+    "state", "states", "student", "such", "that", "their", "them", "then", "there",
+    "these", "they", "this", "those", "through", "using", "what", "when", "where",
+    "which", "while", "will", "with", "would",
+}
+
+
+def _normalize_answer(text: Any) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^\w\s]", " ", str(text or "").lower()).split())
+
+
+def _keywords(text: str) -> List[str]:
+    """Content words of a mark-scheme point, stemmed to a 5-letter prefix"""
+    return sorted({w[:5] for w in _normalize_answer(text).split() if len(w) >= 4 and w not in _STOPWORDS})
+
+
+class TieredGrader:
+    """
+    Settles clear-cut written answers locally before any LLM call
+    
+    Tiers are tried cheapest first:
+    - `exact_match`: answers matching `correctAnswer` once normalized score full marks
+    - `blank`: empty or near-empty answers score 0
+    - `copied_question`: answers that restate the whole question and add
+      nothing score 0
+    - `too_short`: one- or two-word answers to questions worth 4+ marks score
+      at most 1 mark, and only if they hit a mark-scheme keyword
+    
+    Anything else is left to the LLM (`llm` tier). Some rules are too
+    unreliable to decide on and are only logged as hints for answers that
+    go to the LLM:
+    - `no_keywords`: short answers covering none of the mark-scheme points,
+      which a paraphrase can still answer correctly
+    
+    Decisions per tier and hints are counted so the split can be monitored.
+    """
+    
+    TIERS = ("exact_match", "blank", "copied_question", "too_short", "llm")
+    HINTS = ("no_keywords",)
+    
+    def __init__(self):
+        self._counts: Dict[str, int] = {tier: 0 for tier in self.TIERS}
+        self._hints: Dict[str, int] = {hint: 0 for hint in self.HINTS}
+        self._lock = threading.Lock()
+    
+    def decide(
+        self,
+        question: Question,
+        user_answer: Any,
+        max_marks: float
+    ) -> Tuple[str, Optional[QuizGradingLLM]]:
+        """Return the deciding tier and its grading, or (`llm`, None) if ambiguous"""
+        answer = _normalize_answer(user_answer)
+        words = answer.split()
+        points = [_keywords(p) for p in (question.markScheme or [])]
+        points = [p for p in points if p]
+        
+        def settle(tier: str, marks: float, feedback: str) -> Tuple[str, QuizGradingLLM]:
+            return tier, QuizGradingLLM(marksAwarded=marks, maxMarks=max_marks, feedback=feedback)
+        
+        correct = _normalize_answer(question.correctAnswer) if question.correctAnswer else ""
+        if correct and answer == correct:
+            return settle("exact_match", max_marks, "Correct! Your answer matches the expected answer.")
+        
+        if not answer or (len(answer.replace(" ", "")) < 3 and max_marks >= 2):
+            return settle("blank", 0.0, "No answer was given, so no marks could be awarded.")
+        
+        # Only a restatement of the whole question; a correct answer often reuses its terms
+        question_words = set(_normalize_answer(question.question).split())
+        answer_words = set(words)
+        if len(words) >= 3 and len(answer_words & question_words) / len(answer_words | question_words) >= 0.9:
+            return settle(
+                "copied_question", 0.0,
+                "Your answer repeats the question rather than answering it. "
+                "Try explaining the idea in your own words."
+            )
+        
+        answer_stems = {w[:5] for w in words}
+        covered = sum(1 for p in points if answer_stems.intersection(p))
+        
+        if len(words) <= 2 and max_marks >= 4:
+            return settle(
+                "too_short", min(1.0, max_marks) if covered else 0.0,
+                f"This question is worth {max_marks:g} marks, so a one- or two-word answer "
+                "cannot cover the points needed. Explain your reasoning in full sentences."
+            )
+        
+        for hint in self.hints(question, user_answer, max_marks):
+            logger.info(f"Grading hint {hint} for question {question.questionId}; leaving it to the LLM")
+            with self._lock:
+                self._hints[hint] += 1
+        
+        return "llm", None
+    
+    @staticmethod
+    def hints(question: Question, user_answer: Any, max_marks: float) -> List[str]:
+        """Rules that suggest a zero score for the answer without deciding it"""
+        words = _normalize_answer(user_answer).split()
+        points = [p for p in (_keywords(p) for p in (question.markScheme or [])) if p]
+        answer_stems = {w[:5] for w in words}
+        covered = sum(1 for p in points if answer_stems.intersection(p))
+        
+        if len(points) >= 2 and covered == 0 and len(words) < 4 * max_marks:
+            return ["no_keywords"]
+        return []
+    
+    def record(self, tier: str) -> None:
+        with self._lock:
+            self._counts[tier] = self._counts.get(tier, 0) + 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Decision counts and rates per tier since startup"""
+        with self._lock:
+            counts = dict(self._counts)
+            hints = dict(self._hints)
+        total = sum(counts.values())
+        return {
+            "total": total,
+            "counts": counts,
+            "rates": {tier: (n / total if total else 0.0) for tier, n in counts.items()},
+            "hints": hints,
+        }
+
+
 class QuizService:
     """Service for managing quizzes"""
     
     def __init__(self):
         self.cosmos = get_cosmos_service()
         
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "").rstrip("/")
-        api_key = os.getenv("AZURE_OPENAI_KEY")
-        self.deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4")
+        self.llm = get_llm_gateway()
         
-        self.client = OpenAI(
-            base_url=f"{endpoint}/openai/v1/",
-            api_key=api_key,
-            default_headers={"api-key": api_key}
-        )
+        # Written answers in a submission are graded concurrently
+        self.grading_concurrency = int(os.getenv("GRADING_MAX_CONCURRENCY", "4"))
+        self.grading_timeout = float(os.getenv("GRADING_TIMEOUT_SECONDS", "30"))
+        # "per_question" (one call per answer) or "batched" (one call per attempt)
+        self.grading_mode = os.getenv("GRADING_MODE", "per_question")
+        self.batch_grading_timeout = float(os.getenv("GRADING_BATCH_TIMEOUT_SECONDS", "60"))
+        # Cheap local checks settle clear-cut written answers before the LLM
+        self.local_prechecks = os.getenv("GRADING_LOCAL_PRECHECKS", "true").lower() == "true"
+        self.tiered_grader = TieredGrader()
     
     def generate_quiz(
         self,
@@ -63,7 +317,8 @@ class QuizService:
         subtopic_id: str,
         question_types: Optional[List[str]] = None,
         difficulty: str = "mixed",
-        count: int = 5
+        count: int = 5,
+        pregenerated: bool = False
     ) -> Quiz:
         """Generate a quiz for a lesson"""
         logger.info(f"Generating quiz for lesson: {lesson_id}")
@@ -84,56 +339,28 @@ class QuizService:
         key_terms = lesson.content.get("keyTerms", [])
         sections = lesson.content.get("sections", [])
         
-        sections_text = "\n\n".join([
-            f"Section: {s.get('title')}\n{s.get('content')}"
-            for s in sections
-        ])
-        
-        system_prompt = (
-            "You are an expert GCSE assessment designer. "
-            "Create fair, clear questions that test understanding of the lesson content. "
-            "Multiple choice questions should have plausible distractors. "
-            "Short answer questions should be answerable in 1-2 sentences. "
-            "Long answer questions should require 3-5 sentences and deeper understanding."
-        )
+        def build_content(lesson_context: str) -> str:
+            return (
+                f"Create {count} questions based on this lesson:\n\n"
+                f"Subject: {lesson.subject}\n"
+                f"Topic: {lesson.topic}\n"
+                f"Subtopic: {lesson.subtopic}\n"
+                f"Question Types to Include: {', '.join(question_types)}\n"
+                f"Difficulty: {difficulty}\n\n"
+                f"Lesson Content:\n{lesson_context}"
+            )
         
-        user_prompt = (
-            f"Create {count} questions based on this lesson:\n\n"
-            f"Subject: {lesson.subject}\n"
-            f"Topic: {lesson.topic}\n"
-            f"Subtopic: {lesson.subtopic}\n\n"
-            f"Lesson Content:\n{sections_text}\n\n"
-            f"Summary: {lesson_summary}\n\n"
-            f"Key Terms: {', '.join(key_terms)}\n\n"
-            f"Question Types to Include: {', '.join(question_types)}\n"
-            f"Difficulty: {difficulty}\n\n"
-            "Distribute questions across the content. "
-            "For multiple choice, provide 4 options. "
-            "For short/long answers, provide detailed mark schemes. "
-            "For every question include a numeric `maxMarks` field indicating the total marks available. "
-            "For multiple choice questions, use 1 mark unless there is a reason to use more. "
-            "Formatting and style guidelines:\n"
-            "- Use Markdown for all formatting.\n"
-            "- Use `#` and `##` for headings and subheadings.\n"
-            "- Use `-` or `*` for bullet points.\n"
-            "- Use `1.` for numbered lists only when sequence matters.\n"
-            "- Use `$...$` for inline math and `$$...$$` for block math when needed.\n\n"
-            "- Use triple backticks ``` **only** when rendering code blocks or clearly marked callouts.\n"
-            "- Do **not** use triple backticks for regular text, examples, or emphasis.\n\n"    
-            "Ensure the lesson is engaging, clearly written, and ready to render in a Markdown/KaTeX environment."
+        # Fit the lesson content into whatever the quiz budget leaves after the instructions
+        overhead = count_message_tokens(QUIZ_PROMPT.messages(build_content("")))
+        lesson_context = fit_lesson_context(
+            sections, lesson_summary, key_terms, budget_for("quiz") - overhead
         )
+        messages = QUIZ_PROMPT.messages(build_content(lesson_context))
+        log_prompt_tokens("quiz", messages)
         
         try:
-            completion = self.client.beta.chat.completions.parse(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format=QuizLLM,
-            )
-            
-            llm_quiz = completion.choices[0].message.parsed
+            with llm_work(user_id=user_id):
+                llm_quiz = self.llm.parse("quiz", QUIZ_PROMPT, messages)
             quiz_id = str(uuid.uuid4())
             
             quiz = Quiz(
@@ -151,12 +378,15 @@ class QuizService:
                         options=q.options,
                         correctAnswer=q.correctAnswer,
                         markScheme=q.markScheme,
+                        rubric=compile_rubric(q.markScheme, q.maxMarks) if q.markScheme else None,
                         maxMarks=float(q.maxMarks),
                         difficulty=q.difficulty
                     )
                     for i, q in enumerate(llm_quiz.questions)
                 ],
-                createdAt=datetime.now(timezone.utc)
+                createdAt=datetime.now(timezone.utc),
+                pregenerated=pregenerated,
+                promptVersion=QUIZ_PROMPT.tag
             )
             
             created_quiz = self.cosmos.create_item("Quizzes", quiz)
@@ -168,15 +398,55 @@ class QuizService:
             logger.error(f"Error generating quiz: {e}")
             raise
     
+    def claim_pregenerated_quiz(
+        self,
+        user_id: str,
+        lesson_id: str,
+        count: int = 5
+    ) -> Optional[Quiz]:
+        """
+        Take an unstarted pregenerated quiz for a lesson, if one exists
+        
+        Pregenerated quizzes use the default mixed difficulty, so callers
+        should only claim one for a default request. The quiz's flag is
+        cleared so it is handed out once.
+        """
+        quizzes = self.cosmos.query_items(
+            container="Quizzes",
+            query="SELECT * FROM c WHERE c.lessonId = @lessonId AND c.pregenerated = true",
+            partition_key=user_id,
+            model_class=Quiz,
+            parameters=[{"name": "@lessonId", "value": lesson_id}]
+        )
+        quiz = next((q for q in quizzes if len(q.questions) == count), None)
+        if not quiz:
+            return None
+        
+        quiz.pregenerated = False
+        logger.info(f"Claimed pregenerated quiz: {quiz.id}")
+        return self.cosmos.update_item("Quizzes", quiz)
+    
     def submit_quiz(
         self,
         user_id: str,
         quiz_id: str,
-        responses: List[Dict[str, Any]]
+        responses: List[Dict[str, Any]],
+        attempt_id: Optional[str] = None
     ) -> QuizAttempt:
-        """Submit and grade a quiz attempt"""
+        """
+        Submit and grade a quiz attempt
+        
+        With `attempt_id`, an attempt already stored under that id is
+        returned as it is, without grading again.
+        """
         logger.info(f"Submitting quiz: {quiz_id}")
         
+        if attempt_id:
+            existing = self._get_attempt(user_id, attempt_id)
+            if existing:
+                logger.info(f"Quiz attempt {attempt_id} already graded; returning it")
+                return existing
+        
         quiz = self.cosmos.query_items(
             container="Quizzes",
             query="SELECT * FROM c WHERE c.id = @quizId",
@@ -190,10 +460,11 @@ class QuizService:
         
         quiz = quiz[0]
         
-        graded_responses = []
+        # Grade multiple choice inline and collect written answers so their
+        # LLM gradings can run concurrently; slots keep the original order.
+        graded_slots: List[Optional[QuizAttemptResponse]] = []
+        written: List[Tuple[int, Question, Any]] = []
         total_correct = 0
-        total_marks = 0
-        max_marks = 0
         
         for resp in responses:
             question_id = resp.get("questionId")
@@ -211,7 +482,7 @@ class QuizService:
                 is_correct = user_answer == question.correctAnswer
                 q_max = float(question.maxMarks) if getattr(question, 'maxMarks', None) is not None else 1.0
                 awarded = q_max if is_correct else 0.0
-                graded_responses.append(QuizAttemptResponse(
+                graded_slots.append(QuizAttemptResponse(
                     questionId=question_id,
                     userAnswer=user_answer,
                     isCorrect=is_correct,
@@ -221,36 +492,59 @@ class QuizService:
                 ))
                 if is_correct:
                     total_correct += 1
-                total_marks += awarded
-                max_marks += q_max
             
             else:
-                grading = self._grade_written_answer(
-                    question=question.question,
-                    mark_scheme=question.markScheme or [],
-                    user_answer=user_answer or "",
-                    question_type=question.type,
-                    question_max_marks=getattr(question, 'maxMarks', None)
-                )
-                
-                graded_responses.append(QuizAttemptResponse(
-                    questionId=question_id,
-                    userAnswer=user_answer,
-                    aiGeneratedAnswer=grading.generatedAnswer,
-                    marksAwarded=grading.marksAwarded,
-                    maxMarks=grading.maxMarks,
-                    feedback=grading.feedback
-                ))
+                tier, grading = "llm", None
+                if self.local_prechecks:
+                    tier, grading = self.tiered_grader.decide(
+                        question,
+                        user_answer,
+                        self._resolve_max_marks(
+                            question.markScheme or [], question.type, getattr(question, 'maxMarks', None)
+                        )
+                    )
+                self.tiered_grader.record(tier)
                 
-                total_marks += grading.marksAwarded
-                max_marks += grading.maxMarks
+                if grading is not None:
+                    graded_slots.append(QuizAttemptResponse(
+                        questionId=question_id,
+                        userAnswer=user_answer,
+                        marksAwarded=grading.marksAwarded,
+                        maxMarks=grading.maxMarks,
+                        feedback=grading.feedback,
+                        gradingTier=tier
+                    ))
+                else:
+                    written.append((len(graded_slots), question, user_answer))
+                    graded_slots.append(None)
+        
+        with llm_work(INTERACTIVE_GRADING, user_id):
+            gradings = self._grade_written_answers([(q, a) for _, q, a in written])
+        
+        for (slot, question, user_answer), (grading, prompt_tag) in zip(written, gradings):
+            graded_slots[slot] = QuizAttemptResponse(
+                questionId=question.questionId,
+                userAnswer=user_answer,
+                aiGeneratedAnswer=grading.generatedAnswer,
+                marksAwarded=grading.marksAwarded,
+                maxMarks=grading.maxMarks,
+                feedback=grading.feedback,
+                gradingTier="llm",
+                promptVersion=prompt_tag
+            )
+        
+        logger.info(f"Grading tiers so far: {self.tiered_grader.stats()['counts']}")
+        
+        graded_responses: List[QuizAttemptResponse] = graded_slots
+        total_marks = sum(r.marksAwarded or 0 for r in graded_responses)
+        max_marks = sum(r.maxMarks or 0 for r in graded_responses)
         
         percentage = (total_marks / max_marks * 100) if max_marks > 0 else 0
         trigger_tutor = percentage < 40 or self._has_repeated_mistakes(graded_responses)
         weak_concepts = self._identify_weak_concepts(graded_responses, quiz.questions)
         
         attempt = QuizAttempt(
-            id=str(uuid.uuid4()),
+            id=attempt_id or str(uuid.uuid4()),
             userId=user_id,
             quizId=quiz_id,
             lessonId=quiz.lessonId,
@@ -269,11 +563,173 @@ class QuizService:
             completedAt=datetime.now(timezone.utc)
         )
         
-        created_attempt = self.cosmos.create_item("QuizAttempts", attempt)
+        try:
+            created_attempt = self.cosmos.create_item("QuizAttempts", attempt)
+        except exceptions.CosmosResourceExistsError:
+            # A concurrent run of the same submission stored it first
+            return self._get_attempt(user_id, attempt.id)
         logger.info(f"Created quiz attempt: {created_attempt.id}")
         
         return created_attempt
     
+    def _get_attempt(self, user_id: str, attempt_id: str) -> Optional[QuizAttempt]:
+        return self.cosmos.get_item(
+            container="QuizAttempts",
+            item_id=attempt_id,
+            partition_key=user_id,
+            model_class=QuizAttempt
+        )
+    
+    def _grade_written_answers(
+        self,
+        items: List[Tuple[Question, Any]]
+    ) -> List[Tuple[QuizGradingLLM, str]]:
+        """
+        Grade written answers using the configured grading mode, in input order
+        
+        Returns:
+            (grading, prompt tag) pairs, the tag naming the prompt that graded it
+        """
+        if self.grading_mode == "batched" and len(items) > 1:
+            return self._grade_written_answers_batched(items)
+        return [(g, GRADE_PROMPT.tag) for g in self._grade_written_answers_concurrently(items)]
+    
+    def _grade_written_answers_batched(
+        self,
+        items: List[Tuple[Question, Any]]
+    ) -> List[Tuple[QuizGradingLLM, str]]:
+        """
+        Grade every written answer in a single structured-output call
+        
+        Questions are presented by their compact rubric and the formatting
+        guidance is given once in the system prompt. Any question the model
+        leaves out, or the whole batch if the response cannot be parsed, is
+        re-graded with the per-question path.
+        """
+        max_marks = {
+            question.questionId: self._resolve_max_marks(
+                question.markScheme or [], question.type, getattr(question, 'maxMarks', None)
+            )
+            for question, _ in items
+        }
+        
+        # Questions and rubrics are kept whole; student answers share what is left of the budget
+        rubrics = {
+            question.questionId: question.rubric or compile_rubric(question.markScheme or [], max_marks[question.questionId])
+            for question, _ in items
+        }
+        fixed = sum(count_tokens(q.question) + count_tokens(rubrics[q.questionId]) + 20 for q, _ in items)
+        answer_budget = max((budget_for("grade_batch") - 200 - fixed) // len(items), 50)
+        
+        blocks = []
+        for question, user_answer in items:
+            blocks.append(
+                f"### {question.questionId} ({max_marks[question.questionId]:g} marks)\n"
+                f"Question: {question.question}\n"
+                f"Rubric:\n{rubrics[question.questionId]}\n"
+                f"Student Answer: {truncate_to_tokens(str(user_answer or ''), answer_budget)}"
+            )
+        
+        messages = BATCH_GRADE_PROMPT.messages("Grade these answers:\n\n" + "\n\n".join(blocks))
+        log_prompt_tokens("grade_batch", messages)
+        
+        grades: Dict[str, QuestionGradeLLM] = {}
+        try:
+            parsed = self.llm.parse(
+                "grade_batch", BATCH_GRADE_PROMPT, messages, timeout=self.batch_grading_timeout
+            )
+            grades = {g.questionId: g for g in parsed.grades if g.questionId in max_marks}
+        except Exception as e:
+            logger.error(f"Error batch grading answers: {e}")
+        
+        missing = [(q, a) for q, a in items if q.questionId not in grades]
+        if missing:
+            logger.warning(f"Batch grading missed {len(missing)} of {len(items)} answers; grading individually")
+        fallback = dict(zip(
+            (q.questionId for q, _ in missing),
+            self._grade_written_answers_concurrently(missing)
+        ))
+        
+        gradings = []
+        for question, _ in items:
+            if question.questionId in fallback:
+                gradings.append((fallback[question.questionId], GRADE_PROMPT.tag))
+                continue
+            grade = grades[question.questionId]
+            q_max = max_marks[question.questionId]
+            gradings.append((QuizGradingLLM(
+                marksAwarded=min(max(grade.marksAwarded, 0.0), q_max),
+                maxMarks=q_max,
+                feedback=grade.feedback
+            ), BATCH_GRADE_PROMPT.tag))
+        return gradings
+    
+    def _grade_written_answers_concurrently(
+        self,
+        items: List[Tuple[Question, Any]]
+    ) -> List[QuizGradingLLM]:
+        """
+        Grade written answers concurrently, returning gradings in input order
+        
+        At most `grading_concurrency` gradings run at once. Each LLM call is
+        bounded by `grading_timeout`; anything still outstanding when the
+        batch deadline passes gets the same fallback grading as a failed call,
+        so one slow answer never holds up the rest of the submission.
+        """
+        if not items:
+            return []
+        
+        workers = max(1, min(self.grading_concurrency, len(items)))
+        waves = -(-len(items) // workers)
+        deadline = time.monotonic() + self.grading_timeout * waves
+        
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grading")
+        try:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._grade_written_answer,
+                    question=question.question,
+                    mark_scheme=question.markScheme or [],
+                    user_answer=user_answer or "",
+                    question_type=question.type,
+                    question_max_marks=getattr(question, 'maxMarks', None),
+                    rubric=question.rubric
+                )
+                for question, user_answer in items
+            ]
+            
+            gradings = []
+            for (question, _), future in zip(items, futures):
+                try:
+                    gradings.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+                except FuturesTimeoutError:
+                    logger.warning(f"Grading timed out for question {question.questionId}")
+                    gradings.append(QuizGradingLLM(
+                        marksAwarded=0.0,
+                        maxMarks=self._resolve_max_marks(
+                            question.markScheme or [],
+                            question.type,
+                            getattr(question, 'maxMarks', None)
+                        ),
+                        feedback=GRADING_FALLBACK_FEEDBACK
+                    ))
+            return gradings
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def _resolve_max_marks(
+        mark_scheme: List[str],
+        question_type: str,
+        question_max_marks: Optional[float] = None
+    ) -> float:
+        """Marks available for a written question"""
+        # Prefer the explicit per-question max provided when the quiz was generated.
+        if question_max_marks is not None:
+            return float(question_max_marks)
+        return float(len(mark_scheme)) if mark_scheme else (3.0 if question_type == "short_answer" else 6.0)
+    
     def _grade_written_answer(
         self,
         question: str,
@@ -281,52 +737,35 @@ class QuizService:
         user_answer: str,
         question_type: str
         ,
-        question_max_marks: Optional[float] = None
+        question_max_marks: Optional[float] = None,
+        rubric: Optional[str] = None
     ) -> QuizGradingLLM:
         """Grade a written answer using AI"""
         
-        # Prefer the explicit per-question max provided when the quiz was generated.
-        if question_max_marks is not None:
-            max_marks = float(question_max_marks)
-        else:
-            max_marks = float(len(mark_scheme)) if mark_scheme else (3.0 if question_type == "short_answer" else 6.0)
+        max_marks = self._resolve_max_marks(mark_scheme, question_type, question_max_marks)
         
         generated_answer = None
         # Grade based only on the student's submitted answer. Bullet-point
         # entry was removed from the backend — do not rely on any notes.
-        original_student_answer = user_answer or ""
+        original_student_answer = truncate_to_tokens(
+            user_answer or "",
+            max(budget_for("grade") - 600 - count_tokens(question) - count_tokens(rubric or "\n".join(mark_scheme)), 50)
+        )
 
-        mark_scheme_text = "\n".join(f"{i+1}. {m}" for i, m in enumerate(mark_scheme))
+        if rubric:
+            mark_scheme_text = f"{rubric}\n([n] = marks for that point)"
+        else:
+            mark_scheme_text = "\n".join(f"{i+1}. {m}" for i, m in enumerate(mark_scheme))
 
-        grade_prompt = (
-            f"Grade this answer according to the mark scheme:\n\n"
+        messages = GRADE_PROMPT.messages(
             f"Question: {question}\n\n"
             f"Mark Scheme ({max_marks} marks total):\n{mark_scheme_text}\n\n"
-            f"Student Answer: {original_student_answer}\n\n"
-            "Award partial marks for partially correct points based on the student's answer. "
-            "Provide constructive feedback on what was good and what was missing."
-            "Formatting and style guidelines:\n"
-            "- Use Markdown for all formatting.\n"
-            "- Use `#` and `##` for headings and subheadings.\n"
-            "- Use `-` or `*` for bullet points.\n"
-            "- Use `1.` for numbered lists only when sequence matters.\n"
-            "- Use `$...$` for inline math and `$$...$$` for block math when needed.\n\n"
-            "- Use triple backticks ``` **only** when rendering code blocks or clearly marked callouts.\n"
-            "- Do **not** use triple backticks for regular text, examples, or emphasis.\n\n"    
-            "Ensure the lesson is engaging, clearly written, and ready to render in a Markdown/KaTeX environment."
+            f"Student Answer: {original_student_answer}"
         )
+        log_prompt_tokens("grade", messages)
         
         try:
-            grade_response = self.client.beta.chat.completions.parse(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": "You are a fair, constructive GCSE examiner."},
-                    {"role": "user", "content": grade_prompt}
-                ],
-                response_format=QuizGradingLLM
-            )
-            
-            grading = grade_response.choices[0].message.parsed
+            grading = self.llm.parse("grade", GRADE_PROMPT, messages, timeout=self.grading_timeout)
             grading.generatedAnswer = generated_answer
             grading.maxMarks = max_marks
             
@@ -337,7 +776,7 @@ class QuizService:
             return QuizGradingLLM(
                 marksAwarded=0.0,
                 maxMarks=max_marks,
-                feedback="Unable to grade answer automatically.",
+                feedback=GRADING_FALLBACK_FEEDBACK,
                 generatedAnswer=generated_answer
             )
     
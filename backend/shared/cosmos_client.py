@@ -1,9 +1,10 @@
 import os
 import logging
-from typing import Optional, List, Dict, Any, Type, TypeVar
+from typing import Callable, Iterator, Optional, List, Dict, Any, Tuple, Type, TypeVar
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
+from azure.core import MatchConditions
 from azure.cosmos import CosmosClient, PartitionKey, exceptions
 from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
 
@@ -25,9 +26,12 @@ class CosmosService:
         "LessonPlans": "/userId",
         "Lessons": "/userId",
         "Quizzes": "/userId",
+        "QuestionBanks": "/userId",
         "QuizAttempts": "/userId",
         "TutorSessions": "/userId",
         "Progress": "/userId",
+        "Jobs": "/userId",
+        "Leases": "/userId",  # enable TTL (default -1) so expired leases are purged
     }
 
     def __init__(self, use_async: bool = False):
@@ -41,6 +45,7 @@ class CosmosService:
         self.use_async = use_async
         self._client = None
         self._database = None
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
 
     # ---------- Lazy Azure-safe initialization ----------
 
@@ -74,6 +79,19 @@ class CosmosService:
     def _dict_to_model(self, data: Dict[str, Any], model_class: Type[T]) -> T:
         return model_class.model_validate(data)
 
+    # ---------- Write notifications ----------
+
+    def subscribe(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Call `listener(container, document)` after each successful write from this process"""
+        self._listeners.append(listener)
+
+    def _notify(self, container: str, result: Dict[str, Any]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(container, result)
+            except Exception as e:
+                logger.warning(f"Write listener failed for {container}: {e}")
+
     # ---------- CRUD Operations ----------
 
     def create_item(self, container: str, item: BaseModel) -> BaseModel:
@@ -82,6 +100,7 @@ class CosmosService:
             item_dict = self._model_to_dict(item)
             result = container_client.create_item(body=item_dict)
             logger.info(f"Created item in {container}: {result.get('id')}")
+            self._notify(container, result)
             return self._dict_to_model(result, type(item))
         except exceptions.CosmosResourceExistsError:
             logger.error(f"Item already exists: {item.id}")
@@ -111,19 +130,91 @@ class CosmosService:
             logger.error(f"Error getting item from {container}: {e}")
             raise
 
-    def update_item(self, container: str, item: BaseModel) -> BaseModel:
+    def get_item_if_changed(
+        self,
+        container: str,
+        item_id: str,
+        partition_key: str,
+        model_class: Type[T],
+        etag: Optional[str] = None,
+    ) -> Tuple[Optional[T], Optional[str]]:
+        """
+        Point read that skips the body when the item still has `etag`
+
+        Returns (item, etag) for a changed item, (None, etag) when it is
+        unchanged (Cosmos answers 304 with no body), and (None, None) when
+        it does not exist.
+        """
+        try:
+            container_client = self._get_container(container)
+            conditions = (
+                {"etag": etag, "match_condition": MatchConditions.IfModified}
+                if etag else {}
+            )
+            result = container_client.read_item(
+                item=item_id,
+                partition_key=partition_key,
+                **conditions,
+            )
+            if not result:
+                return None, etag
+            return self._dict_to_model(result, model_class), result.get("_etag")
+        except exceptions.CosmosResourceNotFoundError:
+            logger.warning(f"Item not found: {item_id} in {container}")
+            return None, None
+        except Exception as e:
+            logger.error(f"Error getting item from {container}: {e}")
+            raise
+
+    def get_item_versions(
+        self,
+        container: str,
+        user_id: str,
+        item_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """`id` and `_etag` of a user's items, without reading their bodies"""
+        query = "SELECT c.id, c._etag FROM c WHERE c.userId = @userId"
+        parameters = [{"name": "@userId", "value": user_id}]
+
+        if item_type:
+            query += " AND c.type = @type"
+            parameters.append({"name": "@type", "value": item_type})
+
+        return self.query_items(
+            container=container,
+            query=query,
+            partition_key=user_id,
+            parameters=parameters,
+        )
+
+    def update_item(
+        self,
+        container: str,
+        item: BaseModel,
+        etag: Optional[str] = None,
+    ) -> BaseModel:
+        """Replace an item; with `etag`, only if it is unchanged since read"""
         try:
             container_client = self._get_container(container)
             item_dict = self._model_to_dict(item)
+            conditions = (
+                {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+                if etag else {}
+            )
             result = container_client.replace_item(
                 item=item.id,
                 body=item_dict,
+                **conditions,
             )
             logger.info(f"Updated item in {container}: {result.get('id')}")
+            self._notify(container, result)
             return self._dict_to_model(result, type(item))
         except exceptions.CosmosResourceNotFoundError:
             logger.error(f"Item not found for update: {item.id}")
             raise
+        except exceptions.CosmosAccessConditionFailedError:
+            logger.info(f"Item changed since read, not updated: {item.id}")
+            raise
         except Exception as e:
             logger.error(f"Error updating item in {container}: {e}")
             raise
@@ -134,6 +225,7 @@ class CosmosService:
             item_dict = self._model_to_dict(item)
             result = container_client.upsert_item(body=item_dict)
             logger.info(f"Upserted item in {container}: {result.get('id')}")
+            self._notify(container, result)
             return self._dict_to_model(result, type(item))
         except Exception as e:
             logger.error(f"Error upserting item in {container}: {e}")
@@ -144,18 +236,28 @@ class CosmosService:
         container: str,
         item_id: str,
         partition_key: str,
+        etag: Optional[str] = None,
     ) -> bool:
+        """Delete an item; with `etag`, only if it is unchanged since read"""
         try:
             container_client = self._get_container(container)
+            conditions = (
+                {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+                if etag else {}
+            )
             container_client.delete_item(
                 item=item_id,
                 partition_key=partition_key,
+                **conditions,
             )
             logger.info(f"Deleted item from {container}: {item_id}")
             return True
         except exceptions.CosmosResourceNotFoundError:
             logger.warning(f"Item not found for deletion: {item_id}")
             return False
+        except exceptions.CosmosAccessConditionFailedError:
+            logger.info(f"Item changed since read, not deleted: {item_id}")
+            raise
         except Exception as e:
             logger.error(f"Error deleting item from {container}: {e}")
             raise
@@ -239,6 +341,36 @@ class CosmosService:
             parameters=parameters,
         )
 
+    # ---------- Change feed ----------
+
+    def read_change_feed(
+        self,
+        container: str,
+        continuation: Optional[str] = None,
+        page_size: int = 100,
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Pages of items changed since `continuation`, each with the token to resume after it
+
+        Without a continuation the feed starts from the beginning of the
+        container. Each item appears in its latest version; deletes are not
+        included.
+        """
+        container_client = self._get_container(container)
+        if continuation:
+            feed = container_client.query_items_change_feed(
+                continuation=continuation, max_item_count=page_size
+            )
+        else:
+            feed = container_client.query_items_change_feed(
+                start_time="Beginning", max_item_count=page_size
+            )
+        pages = feed.by_page()
+        for page in pages:
+            items = list(page)
+            if items:
+                yield items, pages.continuation_token
+
     def close(self):
         if self._client and hasattr(self._client, "close"):
             self._client.close()
@@ -0,0 +1,166 @@
+"""
+HTTP Responses
+orjson rendering for JSON responses, negotiated gzip/brotli compression
+for large response bodies and ETag helpers for conditional GETs
+"""
+import os
+import gzip
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+
+import anyio
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/markdown", "text/csv")
+
+# Bodies this large are compressed on a worker thread rather than the event loop
+THREAD_COMPRESSION_BYTES = 64 * 1024
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, several times faster than the stdlib encoder on lesson payloads"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete response bodies of RESPONSE_COMPRESSION_MIN_BYTES or more
+
+    The encoding is negotiated from Accept-Encoding: brotli when the client
+    accepts it and the Brotli package is installed, otherwise gzip.
+    Streamed responses (SSE expansion) pass through untouched so their
+    chunks are not held back, as do bodies that are already encoded or not
+    a text type. Gzip defaults to level 4; on lesson payloads it costs under
+    a third of level 6's CPU for output about 15% larger.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        self.minimum_size = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+        self.gzip_level = int(os.getenv("RESPONSE_GZIP_LEVEL", "4"))
+        self.brotli_quality = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+
+        async def send_compressed(message: Dict[str, Any]) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk shows whether the response is streamed
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            held, start = start, None
+            headers = MutableHeaders(raw=held["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(held)
+                await send(message)
+                return
+
+            if len(body) >= THREAD_COMPRESSION_BYTES:
+                compressed = await anyio.to_thread.run_sync(self.compress, body, encoding)
+            else:
+                compressed = self.compress(body, encoding)
+            headers.add_vary_header("Accept-Encoding")
+            if len(compressed) < len(body):
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(compressed))
+                body = compressed
+            await send(held)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None for identity"""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    br = accepted.get("br", wildcard) if brotli is not None else 0.0
+    gz = accepted.get("gzip", wildcard)
+    # Highest quality wins; brotli on a tie since it compresses markdown better
+    if br > 0 and br >= gz:
+        return "br"
+    return "gzip" if gz > 0 else None
+
+
+# ==================== CONDITIONAL GETS ====================
+
+# Clients may reuse a stored copy but must revalidate it with If-None-Match first
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def collection_etag(versions: Iterable[Dict[str, Any]]) -> str:
+    """Strong ETag over the `id`/`_etag` pairs of a set of Cosmos documents"""
+    digest = hashlib.sha256()
+    for version in sorted(versions, key=lambda v: v["id"]):
+        digest.update(f"{version['id']}:{version['_etag']}\n".encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def if_none_match(request: Request) -> List[str]:
+    """Entity tags listed in the request's If-None-Match header"""
+    header = request.headers.get("if-none-match", "")
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def etag_matches(tags: List[str], etag: Optional[str]) -> bool:
+    """Weak comparison, as RFC 9110 prescribes for If-None-Match"""
+    if etag is None:
+        return False
+    bare = etag.removeprefix("W/")
+    return any(tag == "*" or tag.removeprefix("W/") == bare for tag in tags)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: Optional[str]) -> None:
+    """Mark a 200 response so the client can revalidate it later"""
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
@@ -0,0 +1,300 @@
+"""
+Idempotency
+Stores the response to a request carrying an Idempotency-Key and replays it
+for retries of the same request, so a flaky connection does not repeat
+generation or grading
+"""
+import os
+import time
+import uuid
+import socket
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Optional
+
+from azure.cosmos import exceptions
+from fastapi import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from shared.models import IdempotencyRecord
+from shared.cosmos_client import get_cosmos_service
+
+logger = logging.getLogger(__name__)
+
+# Responses worth replaying; 5xx and throttling are released so a retry runs again
+def _replayable(status_code: int) -> bool:
+    return status_code < 500 and status_code != 429
+
+
+def _same_claim(current: IdempotencyRecord, record: IdempotencyRecord) -> bool:
+    # Every claim or takeover sets a fresh lease expiry
+    return current.status == "in_progress" and current.owner == record.owner and current.expiresAt == record.expiresAt
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+
+class IdempotencyTimeout(Exception):
+    """The original request is still running after IDEMPOTENCY_WAIT_SECONDS"""
+
+
+class IdempotentReplay(Exception):
+    """An identical request already completed; answer with its response"""
+
+    def __init__(self, record: IdempotencyRecord):
+        super().__init__(record.key)
+        self.record = record
+
+    def response(self) -> Response:
+        return Response(
+            content=self.record.body or "",
+            status_code=self.record.statusCode or 200,
+            media_type=self.record.contentType,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+
+class IdempotencyStore:
+    """
+    Idempotency records in the Leases container, one per (user, route, key)
+
+    The first request creates an in-progress record holding a lease of
+    IDEMPOTENCY_LEASE_SECONDS. A duplicate that arrives meanwhile waits for
+    it (woken directly within a process, polling across processes) and then
+    replays its response, which is kept for IDEMPOTENCY_TTL_SECONDS; Cosmos
+    TTL removes the record after that. The key is bound to a hash of the
+    method, route and body, and reusing it for a different request is an
+    error. A response of 5xx or 429 releases the key so the retry runs
+    again, as does a lease that expired because its process died. Storing
+    or releasing is conditioned on the claim's owner and etag, so a request
+    whose lease lapsed never overwrites the retry that took its key over. If
+    the store is unavailable, requests run unprotected.
+    """
+
+    CONTAINER = "Leases"
+
+    def __init__(self):
+        self.cosmos = get_cosmos_service()
+        self.enabled = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+        self.ttl_seconds = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+        self.lease_seconds = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "300"))
+        self.wait_seconds = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "300"))
+        self.poll_interval = float(os.getenv("IDEMPOTENCY_POLL_SECONDS", "1"))
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._settled: Dict[str, asyncio.Event] = {}
+        self._stats = {"claimed": 0, "replayed": 0, "waited": 0, "conflicts": 0, "released": 0, "unavailable": 0}
+
+    # ==================== CLAIMS ====================
+
+    async def begin(self, subject: str, method: str, route: str, key: str, body: bytes) -> Optional[IdempotencyRecord]:
+        """
+        Claim `key` for this request, or settle the request from an earlier one
+
+        Returns the claimed record, to be passed to `complete` or `release`,
+        or None when idempotency is off or the store is unavailable.
+
+        Raises:
+            IdempotentReplay: an identical request already completed
+            IdempotencyConflict: the key was used for a different request
+            IdempotencyTimeout: the original request is still running
+        """
+        if not self.enabled:
+            return None
+        record_id = hashlib.sha256(f"{subject}|{method}|{route}|{key}".encode()).hexdigest()
+        request_hash = hashlib.sha256(method.encode() + b" " + route.encode() + b"\n" + body).hexdigest()
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+
+        while True:
+            now = datetime.now(timezone.utc)
+            record = IdempotencyRecord(
+                id=record_id,
+                userId=subject,
+                key=key,
+                route=f"{method} {route}",
+                requestHash=request_hash,
+                owner=self.owner,
+                expiresAt=now + timedelta(seconds=self.lease_seconds),
+                ttl=self.lease_seconds
+            )
+            try:
+                existing = await run_in_threadpool(self._claim, record)
+            except Exception as e:
+                self._stats["unavailable"] += 1
+                logger.warning(f"Idempotency store unavailable, running {route} without a key: {e}")
+                return None
+
+            if existing is None:
+                self._stats["claimed"] += 1
+                return record
+            if existing.requestHash != request_hash:
+                self._stats["conflicts"] += 1
+                raise IdempotencyConflict(key)
+            if existing.status == "completed":
+                self._stats["replayed"] += 1
+                logger.info(f"Replaying {existing.route} for Idempotency-Key {key}")
+                raise IdempotentReplay(existing)
+
+            if not waited:
+                self._stats["waited"] += 1
+                waited = True
+                logger.info(f"Waiting for the original {existing.route} with Idempotency-Key {key}")
+            if time.monotonic() >= deadline:
+                raise IdempotencyTimeout(key)
+            event = self._settled.setdefault(record_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim(self, record: IdempotencyRecord) -> Optional[IdempotencyRecord]:
+        """Create or take over the record; returns the live record that blocks it, if any"""
+        for _ in range(5):
+            try:
+                self.cosmos.create_item(self.CONTAINER, record)
+                return None
+            except exceptions.CosmosResourceExistsError:
+                pass
+            current, etag = self.cosmos.get_item_if_changed(
+                container=self.CONTAINER,
+                item_id=record.id,
+                partition_key=record.userId,
+                model_class=IdempotencyRecord
+            )
+            if current is None:
+                continue  # released since the create
+            if current.expiresAt > datetime.now(timezone.utc):
+                return current
+            try:
+                # Replay window over, or the original's process died holding the lease
+                self.cosmos.update_item(self.CONTAINER, record, etag=etag)
+                return None
+            except exceptions.CosmosAccessConditionFailedError:
+                continue
+        raise RuntimeError(f"Could not claim idempotency record {record.id}")
+
+    # ==================== SETTLING ====================
+
+    async def complete(self, record: IdempotencyRecord, status_code: int, content_type: Optional[str], body: bytes) -> None:
+        """Store the response for replay, or release the key if it should not be replayed"""
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            text = None
+        if text is None or not _replayable(status_code):
+            await self.release(record)
+            return
+
+        completed = record.model_copy(update={
+            "status": "completed",
+            "statusCode": status_code,
+            "contentType": content_type,
+            "body": text,
+            "expiresAt": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds),
+            "ttl": self.ttl_seconds,
+        })
+        try:
+            if not await run_in_threadpool(self._settle, record, completed):
+                logger.warning(f"Idempotency-Key {record.key} was taken over, response not stored")
+        except Exception as e:
+            logger.warning(f"Could not store response for Idempotency-Key {record.key}: {e}")
+        self._wake(record.id)
+
+    async def release(self, record: IdempotencyRecord) -> None:
+        """Drop the claim so the next request with the key runs"""
+        self._stats["released"] += 1
+        try:
+            await run_in_threadpool(self._settle, record, None)
+        except Exception as e:
+            logger.warning(f"Could not release Idempotency-Key {record.key}: {e}")
+        self._wake(record.id)
+
+    def _settle(self, record: IdempotencyRecord, settled: Optional[IdempotencyRecord]) -> bool:
+        """
+        Replace the claim with `settled`, or delete it when None, if it is still ours
+
+        A claim whose lease lapsed may have been taken over by a retry; that
+        record is left alone. Returns False when the claim was no longer held.
+        """
+        current, etag = self.cosmos.get_item_if_changed(
+            container=self.CONTAINER,
+            item_id=record.id,
+            partition_key=record.userId,
+            model_class=IdempotencyRecord
+        )
+        if current is None or not _same_claim(current, record):
+            return False
+        try:
+            if settled is None:
+                self.cosmos.delete_item(self.CONTAINER, record.id, record.userId, etag=etag)
+            else:
+                self.cosmos.update_item(self.CONTAINER, settled, etag=etag)
+        except exceptions.CosmosAccessConditionFailedError:
+            return False
+        return True
+
+    def _wake(self, record_id: str) -> None:
+        event = self._settled.pop(record_id, None)
+        if event is not None:
+            event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, **self._stats}
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware that settles the record a request's dependency claimed
+
+    The claim is left in the request state; once the response has been
+    sent, its status and body are stored for replay (or the key released).
+    Add it inside the compression middleware so the stored body is the
+    uncompressed one.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        self.store = get_idempotency_store()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        response: Dict[str, Any] = {"status": None, "contentType": None, "body": [], "complete": False}
+
+        async def capture(message: Dict[str, Any]) -> None:
+            if "idempotency" in state:
+                if message["type"] == "http.response.start":
+                    response["status"] = message["status"]
+                    response["contentType"] = Headers(raw=message.get("headers", [])).get("content-type")
+                elif message["type"] == "http.response.body":
+                    response["body"].append(message.get("body", b""))
+                    response["complete"] = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            record = state.pop("idempotency", None)
+            if record is not None:
+                if response["complete"]:
+                    await self.store.complete(record, response["status"], response["contentType"], b"".join(response["body"]))
+                else:
+                    await self.store.release(record)
+
+
+_idempotency_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = IdempotencyStore()
+    return _idempotency_store
@@ -0,0 +1,245 @@
+"""
+LLM Endpoints
+Pool of Azure OpenAI endpoints serving the routed deployments, balanced by
+the quota each has left and skipped while throttled or failing
+"""
+import os
+import json
+import time
+import random
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Rate-limit windows are per minute, so an observation is fully stale after this
+QUOTA_WINDOW_SECONDS = 60.0
+
+
+class EndpointConfig(BaseModel):
+    """One Azure OpenAI resource (or OpenAI-compatible server) in the pool"""
+    name: str
+    endpoint: Optional[str] = None  # resource URL, e.g. https://my-resource.openai.azure.com
+    baseUrl: Optional[str] = None  # full base URL instead, e.g. a stand-in's http://localhost:8101/openai/v1/
+    apiKey: Optional[str] = None
+    apiKeyEnv: Optional[str] = None  # name of the environment variable holding the key
+    # Routed deployment name → this resource's deployment name; empty serves every deployment under its own name
+    deployments: Dict[str, str] = {}
+    priority: int = 0  # lower tiers take traffic first; higher tiers only get spillover
+    weight: float = 1.0
+
+    def base_url(self) -> str:
+        return self.baseUrl or f"{(self.endpoint or '').rstrip('/')}/openai/v1/"
+
+    def api_key(self) -> Optional[str]:
+        if self.apiKey:
+            return self.apiKey
+        return os.getenv(self.apiKeyEnv) if self.apiKeyEnv else os.getenv("AZURE_OPENAI_KEY")
+
+
+class EndpointTarget:
+    """A deployment on one endpoint, with its last reported quota and health"""
+
+    def __init__(self, config: EndpointConfig, client: OpenAI, deployment: str):
+        self.config = config
+        self.client = client
+        self.deployment = deployment
+        self.key = f"{deployment}@{config.name}"
+        self.remaining_tokens: Optional[int] = None
+        self.limit_tokens: Optional[int] = None
+        self.remaining_requests: Optional[int] = None
+        self.limit_requests: Optional[int] = None
+        self.observed_at = 0.0
+        self.throttled_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.server_errors = 0
+
+    def headroom(self, now: float) -> float:
+        """Fraction of the per-minute quota left, assuming it refills linearly since the last response"""
+        fractions = []
+        for remaining, limit in ((self.remaining_tokens, self.limit_tokens),
+                                 (self.remaining_requests, self.limit_requests)):
+            if remaining is not None and limit:
+                fractions.append(remaining / limit)
+        if not fractions:
+            return 1.0
+        refilled = (now - self.observed_at) / QUOTA_WINDOW_SECONDS
+        return min(1.0, min(fractions) + refilled)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "endpoint": self.config.name,
+            "deployment": self.deployment,
+            "priority": self.config.priority,
+            "headroom": round(self.headroom(now), 3),
+            "remainingTokens": self.remaining_tokens,
+            "remainingRequests": self.remaining_requests,
+            "throttledFor": max(round(self.throttled_until - now, 1), 0),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "serverErrors": self.server_errors,
+        }
+
+
+class EndpointPool:
+    """
+    Chooses which endpoint serves each call of a routed deployment
+
+    The pool is a JSON list of EndpointConfig objects read from
+    LLM_ENDPOINTS or the file named by LLM_ENDPOINTS_FILE. Without one it
+    is the single endpoint given by LLM_BASE_URL or AZURE_OPENAI_ENDPOINT,
+    so existing deployments behave as before.
+
+    Every response's x-ratelimit-remaining-tokens/-requests headers update
+    that target's headroom. Candidates are ordered by priority tier and,
+    within a tier, by a weighted draw on weight × headroom, so traffic
+    leans towards the endpoint with the most quota left and a pay-as-you-go
+    tier only sees what a provisioned tier above it cannot take. Targets
+    below LLM_ENDPOINT_MIN_HEADROOM drop behind every tier that still has
+    quota. A 429 parks the target until its Retry-After has passed; parked
+    targets are only offered once nothing else is. The gateway fails over along the
+    returned order and keeps a circuit breaker per target.
+    """
+
+    def __init__(self, request_hooks: List[Callable[[httpx.Request], None]], timeout: httpx.Timeout):
+        self.default_cooldown = float(os.getenv("LLM_ENDPOINT_THROTTLE_SECONDS", "10"))
+        self.min_headroom = float(os.getenv("LLM_ENDPOINT_MIN_HEADROOM", "0.05"))
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self._targets: Dict[str, EndpointTarget] = {}
+        self.configs = self._load()
+        self.clients: Dict[str, OpenAI] = {}
+        for config in self.configs:
+            api_key = config.api_key()
+            self.clients[config.name] = OpenAI(
+                base_url=config.base_url(),
+                api_key=api_key,
+                default_headers={"api-key": api_key},
+                http_client=DefaultHttpxClient(event_hooks={
+                    "request": request_hooks,
+                    "response": [self._response_hook(config.name)],
+                }),
+                timeout=timeout
+            )
+
+    @staticmethod
+    def _load() -> List[EndpointConfig]:
+        raw = os.getenv("LLM_ENDPOINTS")
+        path = os.getenv("LLM_ENDPOINTS_FILE")
+        if not raw and path:
+            with open(path, encoding="utf-8") as f:
+                raw = f.read()
+        if not raw:
+            # LLM_BASE_URL points the gateway elsewhere, e.g. at tools/llm_standin.py
+            return [EndpointConfig(
+                name="default",
+                endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+                baseUrl=os.getenv("LLM_BASE_URL") or None
+            )]
+
+        configs = [EndpointConfig.model_validate(entry) for entry in json.loads(raw)]
+        if not configs:
+            raise ValueError("LLM endpoint pool is empty")
+        if len({c.name for c in configs}) != len(configs):
+            raise ValueError("LLM endpoint names must be unique")
+        logger.info(f"LLM endpoint pool: {', '.join(f'{c.name} (tier {c.priority})' for c in configs)}")
+        return configs
+
+    def _target(self, config: EndpointConfig, deployment: str) -> EndpointTarget:
+        key = f"{deployment}@{config.name}"
+        with self._lock:
+            if key not in self._targets:
+                self._targets[key] = EndpointTarget(config, self.clients[config.name], deployment)
+            return self._targets[key]
+
+    # ==================== SELECTION ====================
+
+    def candidates(self, deployment: str) -> List[EndpointTarget]:
+        """Endpoints serving `deployment`, in the order to try them"""
+        targets = [
+            self._target(c, c.deployments.get(deployment, deployment) if c.deployments else deployment)
+            for c in self.configs
+            if not c.deployments or deployment in c.deployments
+        ]
+        if not targets:
+            raise ValueError(f"No LLM endpoint serves deployment {deployment}")
+
+        now = time.monotonic()
+        ready = [t for t in targets if t.throttled_until <= now and t.headroom(now) >= self.min_headroom]
+        exhausted = [t for t in targets if t.throttled_until <= now and t.headroom(now) < self.min_headroom]
+        parked = sorted((t for t in targets if t.throttled_until > now), key=lambda t: t.throttled_until)
+        return self._by_tier(ready, now) + self._by_tier(exhausted, now) + parked
+
+    def _by_tier(self, targets: List[EndpointTarget], now: float) -> List[EndpointTarget]:
+        ordered: List[EndpointTarget] = []
+        for tier in sorted({t.config.priority for t in targets}):
+            pool = [t for t in targets if t.config.priority == tier]
+            while pool:
+                weights = [max(t.config.weight * t.headroom(now), 1e-6) for t in pool]
+                pick = self._rng.choices(range(len(pool)), weights=weights)[0]
+                ordered.append(pool.pop(pick))
+        return ordered
+
+    # ==================== QUOTA AND HEALTH ====================
+
+    def _response_hook(self, endpoint: str) -> Callable[[httpx.Response], None]:
+        def observe(response: httpx.Response) -> None:
+            try:
+                deployment = json.loads(response.request.content).get("model")
+            except (ValueError, AttributeError, httpx.RequestNotRead):
+                return
+            if deployment:
+                self.observe(endpoint, deployment, response.status_code, response.headers)
+        return observe
+
+    def observe(self, endpoint: str, deployment: str, status: int, headers: httpx.Headers) -> None:
+        """Update a target from one HTTP response (including the client's own retries)"""
+        target = self._targets.get(f"{deployment}@{endpoint}")
+        if target is None:
+            return
+        now = time.monotonic()
+
+        def header_int(name: str) -> Optional[int]:
+            value = headers.get(name)
+            try:
+                return int(float(value)) if value is not None else None
+            except ValueError:
+                return None
+
+        with self._lock:
+            target.requests += 1
+            remaining_tokens = header_int("x-ratelimit-remaining-tokens")
+            remaining_requests = header_int("x-ratelimit-remaining-requests")
+            if remaining_tokens is not None or remaining_requests is not None:
+                target.remaining_tokens = remaining_tokens
+                target.remaining_requests = remaining_requests
+                # Azure only reports what is left, so the largest value seen stands in for the limit
+                target.limit_tokens = header_int("x-ratelimit-limit-tokens") or max(
+                    target.limit_tokens or 0, remaining_tokens or 0
+                ) or None
+                target.limit_requests = header_int("x-ratelimit-limit-requests") or max(
+                    target.limit_requests or 0, remaining_requests or 0
+                ) or None
+                target.observed_at = now
+
+            if status == 429:
+                target.throttled += 1
+                retry_ms = header_int("retry-after-ms")
+                retry_after = retry_ms / 1000 if retry_ms is not None else header_int("retry-after")
+                cooldown = retry_after if retry_after is not None else self.default_cooldown
+                target.throttled_until = max(target.throttled_until, now + cooldown)
+                logger.warning(f"{target.key} throttled; parked for {cooldown:g}s")
+            elif status >= 500:
+                target.server_errors += 1
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Quota and health per endpoint deployment seen so far"""
+        now = time.monotonic()
+        with self._lock:
+            return [t.stats(now) for t in self._targets.values()]
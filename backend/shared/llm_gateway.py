@@ -0,0 +1,260 @@
+"""
+LLM Gateway
+Single entry point for Azure OpenAI calls; every call is timed and its token
+usage recorded by task
+"""
+import time
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+from openai.lib.streaming.chat import ChatCompletionStreamState
+
+from shared.prompts import PromptTemplate
+from shared.llm_telemetry import LLMCall, get_llm_telemetry
+from shared.model_routing import get_model_router
+from shared.llm_endpoints import EndpointPool
+from shared.llm_resilience import LLMResilience, CircuitOpenError, HedgeCancelled, TRANSIENT_ERRORS
+from shared.llm_scheduler import Admission, get_llm_scheduler
+from shared.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# The call currently running on this thread, so HTTP hooks can attribute retries
+_current_call: ContextVar[Optional[LLMCall]] = ContextVar("llm_call", default=None)
+
+
+def _count_attempt(request: httpx.Request) -> None:
+    call = _current_call.get()
+    if call is not None:
+        call.attempts += 1
+
+
+class LLMGateway:
+    """
+    Wraps the OpenAI clients used by the services
+
+    Callers name the task (plan, lesson, lesson_outline, lesson_section,
+    expand, quiz, question_bank, grade, grade_batch); the model router
+    picks the deployment and parameters for it, and the endpoint pool the
+    order in which the endpoints serving that deployment are tried. A
+    target that is throttled, times out or errors fails over to the next
+    endpoint and then to the route's fallbacks, skipping the client's own
+    retries while an alternative remains, and one whose circuit is open is
+    skipped outright. Short idempotent tasks may be hedged (see
+    LLMResilience). Every call, hedge duplicates included, first waits for
+    admission by the LLM scheduler. The gateway records
+    deployment, prompt/completion/cached tokens, wall time, time to first
+    token for streams, client retries and parse failures in the
+    process-wide telemetry.
+    """
+
+    def __init__(self):
+        self.resilience = LLMResilience()
+        self.pool = EndpointPool([_count_attempt], self.resilience.http_timeout())
+        self.router = get_model_router()
+        self.telemetry = get_llm_telemetry()
+        self.scheduler = get_llm_scheduler()
+
+    def _admit(self, task: str, messages: List[Dict[str, str]]) -> ContextManager[Admission]:
+        """Wait for the scheduler to admit a call of this task"""
+        cost = self.scheduler.estimate(
+            task, count_message_tokens(messages), self.router.route_for(task).maxTokens
+        )
+        return self.scheduler.admit(task, cost)
+
+    @staticmethod
+    def _settle(admission: Admission, call: LLMCall) -> None:
+        admission.settle(call.prompt_tokens, call.completion_tokens)
+
+    def _create(
+        self,
+        task: str,
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        stream: bool = False
+    ) -> Tuple[Any, LLMCall]:
+        """
+        Send the request on the task's route, failing over on transient errors
+
+        Failed attempts are recorded here, as is the usage of a non-stream
+        response; the caller finishes and records the returned call once it
+        has consumed the response.
+        """
+        if stream:
+            params = {**params, "stream": True, "stream_options": {"include_usage": True}}
+
+        # Each routed deployment on each endpoint that serves it, fallback deployments last
+        attempts = [
+            (route, target)
+            for route in self.router.route_for(task).candidates()
+            for target in self.pool.candidates(route.deployment)
+        ]
+        for i, (route, target) in enumerate(attempts):
+            last = i == len(attempts) - 1
+            if not self.resilience.breaker(target.key).allow():
+                logger.warning(f"Circuit open for {target.key}; skipping it for {task}")
+                continue
+
+            client = target.client if last else target.client.with_options(max_retries=0)
+            request = route.apply(params)
+            request["timeout"] = self.resilience.http_timeout(request.get("timeout"))
+            call = LLMCall(task, route.deployment, stream=stream)
+            call.endpoint = target.config.name
+
+            def send(target=target, client=client, request=request, **extra: Any) -> Any:
+                return client.chat.completions.create(
+                    model=target.deployment,
+                    messages=messages,
+                    **request,
+                    **extra
+                )
+
+            token = _current_call.set(call)
+            try:
+                delay = None if stream else self.resilience.hedge_delay(task, target.key)
+                if delay is None:
+                    response = send()
+                    if not stream:
+                        call.record_usage(getattr(response, "usage", None))
+                else:
+                    response, call.hedged, call.hedge_won = self.resilience.run_hedged(
+                        lambda cancelled, send=send, call=call: self._collect(send, messages, call, cancelled),
+                        delay,
+                        lambda cancelled, send=send, route=route, target=target: self._send_duplicate(
+                            task, route.deployment, target.config.name, send, messages, cancelled
+                        )
+                    )
+                self.resilience.record_outcome(target.key, None)
+                if not stream:
+                    self.resilience.observe_latency(task, target.key, time.perf_counter() - call.started)
+                return response, call
+            except Exception as e:
+                self.resilience.record_outcome(target.key, e)
+                call.error = str(e)
+                call.transient = isinstance(e, TRANSIENT_ERRORS)
+                call.finish()
+                self.telemetry.record(call)
+                if last or not isinstance(e, TRANSIENT_ERRORS):
+                    raise
+                logger.warning(f"{target.key} failed for {task} ({type(e).__name__}); trying {attempts[i + 1][1].key}")
+            finally:
+                _current_call.reset(token)
+
+        raise CircuitOpenError(f"No deployment available for {task}: every circuit is open")
+
+    @staticmethod
+    def _collect(send: Any, messages: List[Dict[str, str]], call: LLMCall, cancelled: threading.Event) -> Any:
+        """
+        Send one side of a hedge as a stream and assemble the completion, so
+        it can close its response once the other side has answered
+        """
+        state = ChatCompletionStreamState()
+        generated = 0
+        with send(stream=True, stream_options={"include_usage": True}) as stream:
+            for chunk in stream:
+                if cancelled.is_set():
+                    # Billed for the prompt and the output so far, about a token per chunk
+                    call.prompt_tokens = count_message_tokens(messages)
+                    call.completion_tokens = generated
+                    raise HedgeCancelled()
+                state.handle_chunk(chunk)
+                generated += 1
+        completion = state.get_final_completion()
+        call.record_usage(completion.usage)
+        return completion
+
+    def _send_duplicate(
+        self,
+        task: str,
+        deployment: str,
+        endpoint: str,
+        send: Any,
+        messages: List[Dict[str, str]],
+        cancelled: threading.Event
+    ) -> Any:
+        """Send a hedge's duplicate request, admitted and accounted like any other call"""
+        duplicate = LLMCall(task, deployment)
+        duplicate.endpoint = endpoint
+        duplicate.duplicate = True
+        token = _current_call.set(duplicate)
+        try:
+            with self._admit(task, messages) as admission:
+                try:
+                    if cancelled.is_set():
+                        raise HedgeCancelled()  # the primary answered while this waited
+                    return self._collect(send, messages, duplicate, cancelled)
+                except Exception as e:
+                    duplicate.error = "cancelled" if isinstance(e, HedgeCancelled) else str(e)
+                    raise
+                finally:
+                    duplicate.finish()
+                    self.telemetry.record(duplicate)
+                    self._settle(admission, duplicate)
+        finally:
+            _current_call.reset(token)
+
+    def complete(self, task: str, messages: List[Dict[str, str]], **params: Any) -> Any:
+        """Run a chat completion and return the raw completion"""
+        with self._admit(task, messages) as admission:
+            completion, call = self._create(task, messages, params)
+            call.finish()
+            self.telemetry.record(call)
+            self._settle(admission, call)
+            return completion
+
+    def parse(
+        self,
+        task: str,
+        prompt: PromptTemplate,
+        messages: List[Dict[str, str]],
+        **params: Any
+    ) -> BaseModel:
+        """Run a structured completion with the prompt's prebuilt schema and validate it"""
+        with self._admit(task, messages) as admission:
+            completion, call = self._create(
+                task, messages, {**params, "response_format": prompt.response_format}
+            )
+            self._settle(admission, call)
+            try:
+                return prompt.parse(completion)
+            except Exception as e:
+                call.parse_failed = True
+                call.error = str(e)
+                raise
+            finally:
+                call.finish()
+                self.telemetry.record(call)
+
+    def stream(self, task: str, messages: List[Dict[str, str]], **params: Any) -> Iterator[str]:
+        """Stream a chat completion, yielding text deltas"""
+        with self._admit(task, messages) as admission:
+            stream, call = self._create(task, messages, params, stream=True)
+            try:
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        call.record_usage(chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        call.first_token()
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                call.error = str(e)
+                call.transient = isinstance(e, TRANSIENT_ERRORS)
+                raise
+            finally:
+                call.finish()
+                self.telemetry.record(call)
+                self._settle(admission, call)
+
+
+_llm_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    global _llm_gateway
+    if _llm_gateway is None:
+        _llm_gateway = LLMGateway()
+    return _llm_gateway
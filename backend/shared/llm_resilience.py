@@ -0,0 +1,264 @@
+"""
+LLM Resilience
+Per-deployment circuit breakers, percentile-based request hedging and
+explicit HTTP timeouts for LLM calls
+"""
+import os
+import time
+import threading
+import contextvars
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import httpx
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# Errors that say the deployment, not the request, is unhealthy
+TRANSIENT_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+
+class CircuitOpenError(Exception):
+    """Raised when every deployment for a task has an open circuit"""
+
+
+class HedgeCancelled(Exception):
+    """Raised by a hedged request that stopped because the other one answered first"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one deployment
+
+    After `failure_threshold` transient failures in a row the circuit opens
+    and calls fail fast for `reset_seconds`. It then half-opens: one trial
+    call is let through, and closes the circuit on success or re-opens it
+    on failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._trial_running = False
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failure(s)")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+
+class LatencyWindow:
+    """Rolling window of recent call latencies"""
+
+    def __init__(self, size: int):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class LLMResilience:
+    """
+    Circuit breakers, hedging policy and timeouts used by the LLM gateway
+
+    Hedging applies only to the tasks in LLM_HEDGE_TASKS, which must be
+    short and idempotent (grading by default). If the first request has not
+    answered after the task's LLM_HEDGE_PERCENTILE latency (or
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS until enough samples exist), a duplicate
+    is sent from a pool of LLM_HEDGE_MAX_WORKERS threads, the first success
+    wins and the loser is abandoned mid-response. Hedges are capped at
+    LLM_HEDGE_MAX_RATIO of calls so a slow endpoint is not hit with double
+    traffic.
+    """
+
+    def __init__(self):
+        self.connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+        self.read_timeout = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "120"))
+
+        self.failure_threshold = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.reset_seconds = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+        self.hedge_tasks = {
+            t.strip() for t in os.getenv("LLM_HEDGE_TASKS", "grade").split(",") if t.strip()
+        }
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+        self.hedge_default_delay = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "8"))
+        self.hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.hedge_max_ratio = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[Tuple[str, str], LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("LLM_HEDGE_MAX_WORKERS", "16")),
+            thread_name_prefix="llm-hedge"
+        )
+
+    # ==================== TIMEOUTS ====================
+
+    def http_timeout(self, read: Optional[float] = None) -> httpx.Timeout:
+        """Explicit connect/read timeouts; `read` overrides the default read timeout"""
+        return httpx.Timeout(
+            read or self.read_timeout,
+            connect=self.connect_timeout
+        )
+
+    # ==================== CIRCUIT BREAKERS ====================
+
+    def breaker(self, deployment: str) -> CircuitBreaker:
+        with self._lock:
+            if deployment not in self._breakers:
+                self._breakers[deployment] = CircuitBreaker(
+                    deployment, self.failure_threshold, self.reset_seconds
+                )
+            return self._breakers[deployment]
+
+    def record_outcome(self, deployment: str, error: Optional[Exception]) -> None:
+        """Update the deployment's breaker; non-transient errors still prove it is reachable"""
+        if isinstance(error, RateLimitError):
+            # Out of quota, not unhealthy; the endpoint pool parks it until Retry-After
+            return
+        breaker = self.breaker(deployment)
+        if isinstance(error, TRANSIENT_ERRORS):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def circuits(self) -> Dict[str, str]:
+        with self._lock:
+            return {name: b.state for name, b in self._breakers.items()}
+
+    # ==================== HEDGING ====================
+
+    def observe_latency(self, task: str, deployment: str, seconds: float) -> None:
+        with self._lock:
+            window = self._latencies.setdefault((task, deployment), LatencyWindow(200))
+        window.observe(seconds)
+
+    def hedge_delay(self, task: str, deployment: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None if this call should not be hedged"""
+        if task not in self.hedge_tasks:
+            return None
+        with self._lock:
+            self._calls += 1
+            if self._hedges >= self.hedge_max_ratio * self._calls:
+                return None
+            window = self._latencies.get((task, deployment))
+        if window is None or len(window.samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return window.percentile(self.hedge_percentile)
+
+    def run_hedged(
+        self,
+        send: Callable[[threading.Event], Any],
+        delay: float,
+        send_hedge: Optional[Callable[[threading.Event], Any]] = None
+    ) -> Tuple[Any, bool, bool]:
+        """
+        Run `send` on the calling thread, sending a duplicate from the pool if
+        it has not answered after `delay`
+
+        The duplicate is sent by `send_hedge` (default `send`) in a copy of
+        the caller's context. Each request is handed an event that is set
+        once the other has succeeded; it must then close its response and
+        raise HedgeCancelled. The first success wins.
+
+        Returns:
+            (result, whether a hedge was sent, whether the hedge won)
+        """
+        send_hedge = send_hedge or send
+        primary_cancel, hedge_cancel = threading.Event(), threading.Event()
+        context = contextvars.copy_context()
+        lock = threading.Lock()
+        state: Dict[str, Any] = {"settled": False, "hedge": None}
+
+        def run_hedge() -> Any:
+            result = send_hedge(hedge_cancel)
+            with lock:
+                if not state["settled"]:
+                    state["settled"] = True
+                    primary_cancel.set()
+            return result
+
+        def start_hedge() -> None:
+            with lock:
+                if state["settled"]:
+                    return
+                state["hedge"] = self._executor.submit(context.run, run_hedge)
+            with self._lock:
+                self._hedges += 1
+            logger.info(f"Hedging LLM request after {delay:.2f}s")
+
+        timer = threading.Timer(delay, start_hedge)
+        timer.daemon = True
+        timer.start()
+        try:
+            result = send(primary_cancel)
+        except HedgeCancelled:
+            return state["hedge"].result(), True, True
+        except Exception as error:
+            timer.cancel()
+            with lock:
+                hedge = state["hedge"]
+                state["settled"] = hedge is None
+            if hedge is None:
+                raise
+            try:
+                return hedge.result(), True, True
+            except Exception:
+                raise error
+        timer.cancel()
+        with lock:
+            state["settled"] = True
+            hedged = state["hedge"] is not None
+        hedge_cancel.set()
+        return result, hedged, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hedge_rate = self._hedges / self._calls if self._calls else 0.0
+            return {"hedgeEligibleCalls": self._calls, "hedges": self._hedges, "hedgeRate": hedge_rate}
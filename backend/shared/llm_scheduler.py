@@ -0,0 +1,392 @@
+"""
+LLM Scheduler
+Admits LLM calls by priority class with per-user weighted fair queueing
+over a shared tokens-per-minute and concurrency budget
+"""
+import os
+import time
+import heapq
+import itertools
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from shared.llm_telemetry import Histogram, LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE_GRADING = "interactive_grading"
+INTERACTIVE_GENERATION = "interactive_generation"
+BACKGROUND = "background"
+PRIORITY_CLASSES = (INTERACTIVE_GRADING, INTERACTIVE_GENERATION, BACKGROUND)
+
+# Class used when the caller has not set one
+_TASK_PRIORITIES = {
+    "grade": INTERACTIVE_GRADING,
+    "grade_batch": INTERACTIVE_GRADING,
+}
+
+
+class SchedulerTimeoutError(Exception):
+    """Raised when an LLM call waits longer than LLM_SCHEDULER_MAX_WAIT_SECONDS for admission"""
+
+
+class Escalation:
+    """
+    Raises the priority class of work that is already under way
+
+    Pass it to `llm_work` for work that someone may start waiting on, such
+    as speculative background generation. After `raise_to`, the block's
+    queued calls are re-queued in the new class and its later calls are
+    made in it; a call already running keeps its slot. A class is only ever
+    raised, never lowered.
+    """
+
+    def __init__(self):
+        self.priority: Optional[str] = None
+        self._schedulers: Set["LLMScheduler"] = set()
+        self._lock = threading.Lock()
+
+    def raise_to(self, priority: str) -> None:
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown LLM priority class: {priority}")
+        with self._lock:
+            if self.priority is not None and _rank(self.priority) <= _rank(priority):
+                return
+            self.priority = priority
+            schedulers = list(self._schedulers)
+        for scheduler in schedulers:
+            scheduler._escalate(self)
+
+    def _track(self, scheduler: "LLMScheduler") -> None:
+        with self._lock:
+            self._schedulers.add(scheduler)
+
+
+def _rank(priority: str) -> int:
+    """Position in PRIORITY_CLASSES; lower runs first"""
+    return PRIORITY_CLASSES.index(priority)
+
+
+def _effective_priority(priority: str, escalation: Optional[Escalation]) -> str:
+    if escalation is not None and escalation.priority and _rank(escalation.priority) < _rank(priority):
+        return escalation.priority
+    return priority
+
+
+# (priority class, user id, escalation) of the work running on this thread
+_current_work: ContextVar[Tuple[Optional[str], Optional[str], Optional[Escalation]]] = ContextVar(
+    "llm_work", default=(None, None, None)
+)
+
+
+@contextmanager
+def llm_work(
+    priority: Optional[str] = None,
+    user_id: Optional[str] = None,
+    escalation: Optional[Escalation] = None
+) -> Iterator[None]:
+    """
+    Attribute LLM calls made inside the block to a priority class and user
+
+    Any argument may be omitted to keep the enclosing block's value, so
+    background work keeps its class when it calls into a service that only
+    sets the user. Worker threads do not inherit the block; submit to them
+    with `contextvars.copy_context().run`.
+    """
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown LLM priority class: {priority}")
+    current_priority, current_user, current_escalation = _current_work.get()
+    token = _current_work.set((
+        priority or current_priority,
+        user_id or current_user,
+        escalation or current_escalation
+    ))
+    try:
+        yield
+    finally:
+        _current_work.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "user_id", "cost", "finish", "escalation", "enqueued_at")
+
+    def __init__(self, priority: str, user_id: str, cost: int, finish: float, escalation: Optional[Escalation]):
+        self.priority = priority
+        self.user_id = user_id
+        self.cost = cost
+        self.finish = finish
+        self.escalation = escalation
+        self.enqueued_at = time.monotonic()
+
+
+class _ClassStats:
+    def __init__(self):
+        self.queued = 0
+        self.inflight = 0
+        self.admitted = 0
+        self.timed_out = 0
+        self.tokens = 0
+        self.wait = Histogram(LATENCY_BUCKETS)
+
+
+class Admission:
+    """An admitted call; report its real token usage with `settle`"""
+
+    def __init__(self):
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens = 0
+
+    def settle(self, prompt_tokens: int, completion_tokens: int) -> None:
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class LLMScheduler:
+    """
+    Orders LLM calls when capacity is short
+
+    Every call is admitted against two budgets: at most
+    LLM_MAX_CONCURRENCY calls in flight, and a token bucket refilled at
+    LLM_TPM_LIMIT tokens per minute (0 disables it). A call is charged its
+    prompt tokens plus the task's recent average output; the estimate is
+    corrected with the real usage once the call ends.
+
+    Waiting calls are served by self-clocked weighted fair queueing. Each
+    (priority class, user) pair is a flow; a call's finish tag advances that
+    flow's virtual clock by cost / class weight (LLM_SCHEDULER_WEIGHTS), and
+    the call with the smallest tag is admitted next. A user bulk-generating
+    therefore only delays their own later calls, and interactive grading
+    overtakes queued background work without starving it.
+    """
+
+    def __init__(self):
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self.tpm_limit = int(os.getenv("LLM_TPM_LIMIT", "0"))
+        self.max_wait = float(os.getenv("LLM_SCHEDULER_MAX_WAIT_SECONDS", "300"))
+        self.default_output_tokens = int(os.getenv("LLM_SCHEDULER_DEFAULT_OUTPUT_TOKENS", "1000"))
+        self.weights = self._parse_weights(
+            os.getenv("LLM_SCHEDULER_WEIGHTS", "interactive_grading=8,interactive_generation=4,background=1")
+        )
+
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._flow_finish: Dict[Tuple[str, str], float] = {}
+        self._inflight = 0
+        self._tokens = float(self.tpm_limit)
+        self._refilled_at = time.monotonic()
+        self._output_estimates: Dict[str, float] = {}
+        self._stats: Dict[str, _ClassStats] = {p: _ClassStats() for p in PRIORITY_CLASSES}
+
+    @staticmethod
+    def _parse_weights(raw: str) -> Dict[str, float]:
+        weights = {p: 1.0 for p in PRIORITY_CLASSES}
+        for part in raw.split(","):
+            if "=" in part:
+                name, value = part.split("=", 1)
+                if name.strip() in weights:
+                    weights[name.strip()] = max(float(value), 0.01)
+        return weights
+
+    # ==================== ADMISSION ====================
+
+    def estimate(self, task: str, prompt_tokens: int, max_output_tokens: Optional[int] = None) -> int:
+        """Tokens to charge for a call before its real usage is known"""
+        output = self._output_estimates.get(task, self.default_output_tokens)
+        if max_output_tokens:
+            output = min(output, max_output_tokens)
+        return int(prompt_tokens + output)
+
+    @contextmanager
+    def admit(self, task: str, cost: int) -> Iterator[Admission]:
+        """
+        Block until the call may run, then hold its slot for the block
+
+        The priority class and user come from the enclosing `llm_work`
+        block; without one, grading tasks are interactive grading and
+        everything else interactive generation.
+        """
+        priority, user_id, escalation = _current_work.get()
+        priority = priority or _TASK_PRIORITIES.get(task, INTERACTIVE_GENERATION)
+        user_id = user_id or "anonymous"
+
+        waiter = self._enqueue(priority, user_id, cost, escalation)
+        admission = Admission()
+        try:
+            yield admission
+        finally:
+            self._release(task, waiter, admission)
+
+    def _enqueue(self, priority: str, user_id: str, cost: int, escalation: Optional[Escalation]) -> _Waiter:
+        deadline = time.monotonic() + self.max_wait if self.max_wait > 0 else None
+        if escalation is not None:
+            escalation._track(self)
+
+        with self._cond:
+            # Read under the lock so a concurrent raise_to either sees this waiter or is seen by it
+            priority = _effective_priority(priority, escalation)
+            waiter = _Waiter(priority, user_id, cost, self._finish_tag(priority, user_id, cost), escalation)
+            heapq.heappush(self._queue, (waiter.finish, next(self._seq), waiter))
+            self._stats[priority].queued += 1
+            self._cond.notify_all()
+
+            while True:
+                blocked_for = self._blocked_for(waiter)
+                if blocked_for == 0.0:
+                    break
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+                    heapq.heapify(self._queue)
+                    stats = self._stats[waiter.priority]
+                    stats.queued -= 1
+                    stats.timed_out += 1
+                    self._cond.notify_all()
+                    raise SchedulerTimeoutError(
+                        f"LLM call for {user_id} waited over {self.max_wait:g}s in the {waiter.priority} queue"
+                    )
+                timeouts = [t for t in (blocked_for, remaining) if t is not None]
+                self._cond.wait(timeout=min(timeouts) if timeouts else None)
+
+            heapq.heappop(self._queue)
+            self._virtual_time = waiter.finish
+            if len(self._flow_finish) > 1024:
+                # Flows at or behind the virtual clock restart from it anyway
+                self._flow_finish = {f: t for f, t in self._flow_finish.items() if t > self._virtual_time}
+            self._inflight += 1
+            if self.tpm_limit > 0:
+                self._tokens -= cost
+            stats = self._stats[waiter.priority]
+            stats.queued -= 1
+            stats.inflight += 1
+            stats.admitted += 1
+            stats.wait.observe(time.monotonic() - waiter.enqueued_at)
+        return waiter
+
+    def _finish_tag(self, priority: str, user_id: str, cost: int) -> float:
+        """Advance the (class, user) flow's virtual clock by the call's weighted cost"""
+        flow = (priority, user_id)
+        finish = max(self._virtual_time, self._flow_finish.get(flow, 0.0)) + cost / self.weights[priority]
+        self._flow_finish[flow] = finish
+        return finish
+
+    def _escalate(self, escalation: Escalation) -> None:
+        """Re-queue the escalated block's waiting calls in its new class"""
+        with self._cond:
+            moved = False
+            for i, (_, seq, waiter) in enumerate(self._queue):
+                if waiter.escalation is not escalation:
+                    continue
+                priority = _effective_priority(waiter.priority, escalation)
+                if priority == waiter.priority:
+                    continue
+                self._stats[waiter.priority].queued -= 1
+                self._stats[priority].queued += 1
+                waiter.priority = priority
+                waiter.finish = self._finish_tag(priority, waiter.user_id, waiter.cost)
+                self._queue[i] = (waiter.finish, seq, waiter)
+                moved = True
+            if moved:
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def _blocked_for(self, waiter: _Waiter) -> Optional[float]:
+        """0 if the waiter may run now, else seconds until tokens suffice (None: wait for a release)"""
+        if self._queue[0][2] is not waiter:
+            return None
+        if self.max_concurrency > 0 and self._inflight >= self.max_concurrency:
+            return None
+        if self.tpm_limit <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        rate = self.tpm_limit / 60.0
+        self._tokens = min(float(self.tpm_limit), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+        # A call larger than the whole bucket runs once the bucket is full
+        needed = min(waiter.cost, self.tpm_limit)
+        if self._tokens >= needed:
+            return 0.0
+        return (needed - self._tokens) / rate
+
+    def _release(self, task: str, waiter: _Waiter, admission: Admission) -> None:
+        with self._cond:
+            self._inflight -= 1
+            stats = self._stats[waiter.priority]
+            stats.inflight -= 1
+            if admission.prompt_tokens is not None:
+                actual = admission.prompt_tokens + admission.completion_tokens
+                stats.tokens += actual
+                if self.tpm_limit > 0:
+                    self._tokens -= actual - waiter.cost
+                # Running average of the task's output size for later estimates
+                previous = self._output_estimates.get(task)
+                self._output_estimates[task] = (
+                    admission.completion_tokens if previous is None
+                    else 0.8 * previous + 0.2 * admission.completion_tokens
+                )
+            self._cond.notify_all()
+
+    # ==================== METRICS ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, in-flight calls and admission waits per priority class"""
+        with self._cond:
+            classes = {
+                priority: {
+                    "queueDepth": s.queued,
+                    "inflight": s.inflight,
+                    "admitted": s.admitted,
+                    "timedOut": s.timed_out,
+                    "tokens": s.tokens,
+                    "waitSeconds": s.wait.summary(),
+                }
+                for priority, s in self._stats.items()
+            }
+            return {
+                "maxConcurrency": self.max_concurrency,
+                "tpmLimit": self.tpm_limit,
+                "availableTokens": self._tokens if self.tpm_limit > 0 else None,
+                "weights": self.weights,
+                "classes": classes,
+            }
+
+    def prometheus(self) -> str:
+        """Queue gauges, admission counters and wait histograms in Prometheus text format"""
+        lines: List[str] = []
+        series = [
+            ("llm_scheduler_queue_depth", "gauge", "queued", "Calls waiting for admission"),
+            ("llm_scheduler_inflight", "gauge", "inflight", "Admitted calls still running"),
+            ("llm_scheduler_admitted_total", "counter", "admitted", "Calls admitted"),
+            ("llm_scheduler_timeouts_total", "counter", "timed_out", "Calls that gave up waiting for admission"),
+            ("llm_scheduler_tokens_total", "counter", "tokens", "Tokens used by admitted calls"),
+        ]
+
+        with self._cond:
+            for name, kind, attr, help_text in series:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for priority, s in self._stats.items():
+                    lines.append(f'{name}{{class="{priority}"}} {getattr(s, attr)}')
+
+            name = "llm_scheduler_wait_seconds"
+            lines += [f"# HELP {name} Time spent waiting for admission", f"# TYPE {name} histogram"]
+            for priority, s in self._stats.items():
+                for bound, count in s.wait.cumulative():
+                    lines.append(f'{name}_bucket{{class="{priority}",le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{class="{priority}"}} {s.wait.sum:g}')
+                lines.append(f'{name}_count{{class="{priority}"}} {s.wait.count}')
+        return "\n".join(lines) + "\n"
+
+
+_llm_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        _llm_scheduler = LLMScheduler()
+    return _llm_scheduler
@@ -0,0 +1,250 @@
+"""
+LLM Telemetry
+Per-task latency, time-to-first-token and token usage for LLM calls,
+aggregated into histograms for logs and the metrics endpoint
+"""
+import time
+import bisect
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300]
+TOKEN_BUCKETS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus-style cumulative buckets on export)"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket containing it"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        out, seen = [], 0
+        for bound, n in zip(self.buckets + ["+Inf"], self.counts):
+            seen += n
+            out.append((f"{bound:g}" if bound != "+Inf" else bound, seen))
+        return out
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class LLMCall:
+    """Measurements for one LLM call, filled in while it runs"""
+
+    def __init__(self, task: str, deployment: str, stream: bool = False):
+        self.task = task
+        self.deployment = deployment
+        self.endpoint: Optional[str] = None
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.wall: Optional[float] = None
+        self.attempts = 0  # HTTP requests sent, so retries = attempts - 1
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.parse_failed = False
+        self.hedged = False
+        self.hedge_won = False
+        self.duplicate = False  # the duplicate request of a hedge; counts towards tokens only
+        self.error: Optional[str] = None
+        self.transient = False  # failed on throttling, a timeout or a dropped connection
+
+    @property
+    def retries(self) -> int:
+        return max(self.attempts - 1, 0)
+
+    def first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+
+    def record_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+    def finish(self) -> None:
+        self.wall = time.perf_counter() - self.started
+
+
+class _TaskStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.parse_failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.ttft = Histogram(LATENCY_BUCKETS)
+        self.prompt_token_hist = Histogram(TOKEN_BUCKETS)
+        self.completion_token_hist = Histogram(TOKEN_BUCKETS)
+
+
+class LLMTelemetry:
+    """Aggregates finished LLM calls per (task, deployment)"""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], _TaskStats] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[LLMCall], None]] = []
+        self.started_at = time.time()
+
+    def subscribe(self, listener: Callable[[LLMCall], None]) -> None:
+        """Call `listener` with every finished LLM call"""
+        self._listeners.append(listener)
+
+    def record(self, call: LLMCall) -> None:
+        if call.duplicate:
+            self._record_duplicate(call)
+            return
+        with self._lock:
+            stats = self._stats.setdefault((call.task, call.deployment), _TaskStats())
+            stats.calls += 1
+            stats.errors += 1 if call.error else 0
+            stats.parse_failures += 1 if call.parse_failed else 0
+            stats.retries += call.retries
+            stats.hedges += 1 if call.hedged else 0
+            stats.hedge_wins += 1 if call.hedge_won else 0
+            stats.prompt_tokens += call.prompt_tokens
+            stats.completion_tokens += call.completion_tokens
+            stats.cached_tokens += call.cached_tokens
+            stats.latency.observe(call.wall or 0.0)
+            if call.ttft is not None:
+                stats.ttft.observe(call.ttft)
+            if not call.error:
+                stats.prompt_token_hist.observe(call.prompt_tokens)
+                stats.completion_token_hist.observe(call.completion_tokens)
+
+        ttft = f", ttft {call.ttft:.2f}s" if call.ttft is not None else ""
+        hedge = (", hedge won" if call.hedge_won else ", hedge lost") if call.hedged else ""
+        target = f"{call.deployment}@{call.endpoint}" if call.endpoint else call.deployment
+        outcome = "parse failure" if call.parse_failed else ("error" if call.error else "ok")
+        logger.info(
+            f"LLM call [{call.task}] {target}: {outcome} in {call.wall:.2f}s{ttft}, "
+            f"tokens {call.prompt_tokens} in ({call.cached_tokens} cached) / {call.completion_tokens} out, "
+            f"retries {call.retries}{hedge}"
+        )
+        for listener in self._listeners:
+            listener(call)
+
+    def _record_duplicate(self, call: LLMCall) -> None:
+        """Add a hedge duplicate's tokens; its call was recorded by the request it duplicated"""
+        with self._lock:
+            stats = self._stats.setdefault((call.task, call.deployment), _TaskStats())
+            stats.prompt_tokens += call.prompt_tokens
+            stats.completion_tokens += call.completion_tokens
+            stats.cached_tokens += call.cached_tokens
+        logger.info(
+            f"LLM hedge duplicate [{call.task}] {call.deployment}: {call.error or 'ok'} in {(call.wall or 0.0):.2f}s, "
+            f"tokens {call.prompt_tokens} in / {call.completion_tokens} out"
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-task totals and latency/token summaries since startup"""
+        elapsed_minutes = max((time.time() - self.started_at) / 60, 1e-9)
+        with self._lock:
+            tasks = []
+            for (task, deployment), s in sorted(self._stats.items()):
+                tasks.append({
+                    "task": task,
+                    "deployment": deployment,
+                    "calls": s.calls,
+                    "errors": s.errors,
+                    "parseFailures": s.parse_failures,
+                    "retries": s.retries,
+                    "hedges": s.hedges,
+                    "hedgeWins": s.hedge_wins,
+                    "promptTokens": s.prompt_tokens,
+                    "completionTokens": s.completion_tokens,
+                    "cachedTokens": s.cached_tokens,
+                    "tokensPerMinute": (s.prompt_tokens + s.completion_tokens) / elapsed_minutes,
+                    "latencySeconds": s.latency.summary(),
+                    "ttftSeconds": s.ttft.summary(),
+                    "promptTokensPerCall": s.prompt_token_hist.summary(),
+                    "completionTokensPerCall": s.completion_token_hist.summary(),
+                })
+        return {"since": self.started_at, "tasks": tasks}
+
+    def prometheus(self) -> str:
+        """Render the aggregates in the Prometheus text exposition format"""
+        lines: List[str] = []
+        counters = [
+            ("llm_calls_total", "calls", "LLM calls"),
+            ("llm_errors_total", "errors", "LLM calls that raised"),
+            ("llm_parse_failures_total", "parse_failures", "Structured responses that failed validation"),
+            ("llm_retries_total", "retries", "HTTP retries made by the client"),
+            ("llm_hedges_total", "hedges", "Calls that sent a hedged duplicate request"),
+            ("llm_hedge_wins_total", "hedge_wins", "Hedged calls answered first by the duplicate"),
+            ("llm_prompt_tokens_total", "prompt_tokens", "Input tokens"),
+            ("llm_completion_tokens_total", "completion_tokens", "Output tokens"),
+            ("llm_cached_tokens_total", "cached_tokens", "Input tokens served from the prompt cache"),
+        ]
+        histograms = [
+            ("llm_latency_seconds", "latency", "Wall time per call"),
+            ("llm_ttft_seconds", "ttft", "Time to first token for streamed calls"),
+            ("llm_prompt_tokens", "prompt_token_hist", "Input tokens per call"),
+            ("llm_completion_tokens", "completion_token_hist", "Output tokens per call"),
+        ]
+
+        with self._lock:
+            items = sorted(self._stats.items())
+            for name, attr, help_text in counters:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (task, deployment), s in items:
+                    lines.append(f'{name}{{task="{task}",deployment="{deployment}"}} {getattr(s, attr)}')
+            for name, attr, help_text in histograms:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (task, deployment), s in items:
+                    hist: Histogram = getattr(s, attr)
+                    labels = f'task="{task}",deployment="{deployment}"'
+                    for bound, count in hist.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f"{name}_sum{{{labels}}} {hist.sum:g}")
+                    lines.append(f"{name}_count{{{labels}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+_llm_telemetry: Optional[LLMTelemetry] = None
+
+
+def get_llm_telemetry() -> LLMTelemetry:
+    global _llm_telemetry
+    if _llm_telemetry is None:
+        _llm_telemetry = LLMTelemetry()
+    return _llm_telemetry
@@ -0,0 +1,144 @@
+"""
+Load Shedding
+Adaptive (AIMD) concurrency limit for generation requests, driven by the
+latency of the LLM calls they make
+"""
+import os
+import time
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+from shared.llm_telemetry import LLMCall, get_llm_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Caps concurrent generation requests and sheds the excess early
+
+    Every finished LLM call is compared with its task's baseline latency (a
+    slow moving average; time to first token for streams). A call slower
+    than LOAD_SHED_LATENCY_TOLERANCE × baseline, or one that failed because
+    the deployment was throttled or unreachable, cuts the limit by
+    LOAD_SHED_BACKOFF, at most once per LOAD_SHED_DECREASE_INTERVAL_SECONDS
+    so one slow burst is not counted many times. Healthy calls made while
+    the limit is nearly used grow it by about one per limit's worth of
+    calls. Requests over the limit are rejected straight away rather than
+    queueing behind calls that are already slow.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("LOAD_SHED_ENABLED", "true").lower() == "true"
+        self.min_limit = float(os.getenv("LOAD_SHED_MIN_LIMIT", "4"))
+        self.max_limit = float(os.getenv("LOAD_SHED_MAX_LIMIT", "256"))
+        self.limit = min(max(float(os.getenv("LOAD_SHED_INITIAL_LIMIT", "32")), self.min_limit), self.max_limit)
+        self.tolerance = float(os.getenv("LOAD_SHED_LATENCY_TOLERANCE", "2.0"))
+        self.backoff = float(os.getenv("LOAD_SHED_BACKOFF", "0.75"))
+        self.decrease_interval = float(os.getenv("LOAD_SHED_DECREASE_INTERVAL_SECONDS", "5"))
+        self.retry_after_seconds = int(os.getenv("LOAD_SHED_RETRY_AFTER_SECONDS", "5"))
+        self.min_samples = int(os.getenv("LOAD_SHED_MIN_SAMPLES", "5"))
+
+        self.inflight = 0
+        self._baselines: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "shed": 0, "increases": 0, "decreases": 0}
+        self._shed_by_route: Dict[str, int] = {}
+
+        get_llm_telemetry().subscribe(self.observe)
+
+    # ==================== ADMISSION ====================
+
+    def try_acquire(self, route: str) -> bool:
+        """Take a slot, or count the request as shed and return False"""
+        with self._lock:
+            if self.enabled and self.inflight >= int(self.limit):
+                self._stats["shed"] += 1
+                self._shed_by_route[route] = self._shed_by_route.get(route, 0) + 1
+                return False
+            self.inflight += 1
+            self._stats["admitted"] += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+
+    # ==================== LIMIT ADJUSTMENT ====================
+
+    def observe(self, call: LLMCall) -> None:
+        """Adjust the limit from one finished LLM call"""
+        latency = call.ttft if call.stream and call.ttft is not None else call.wall
+        with self._lock:
+            if call.transient:
+                self._decrease(f"{call.task} call to {call.deployment} failed: {call.error}")
+                return
+            if call.error or latency is None:
+                return
+
+            key = f"{call.task}:{'stream' if call.stream else 'call'}"
+            baseline = self._baselines.get(key)
+            samples = self._samples.get(key, 0) + 1
+            self._samples[key] = samples
+            self._baselines[key] = latency if baseline is None else 0.95 * baseline + 0.05 * latency
+            if baseline is None or samples < self.min_samples:
+                return
+
+            if latency > self.tolerance * baseline:
+                self._decrease(f"{call.task} took {latency:.1f}s against a {baseline:.1f}s baseline")
+            elif self.inflight >= 0.8 * self.limit and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._stats["increases"] += 1
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_interval:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._stats["decreases"] += 1
+        logger.warning(f"Generation concurrency limit {previous:.1f} -> {self.limit:.1f} ({reason})")
+
+    # ==================== METRICS ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Current limit, in-flight requests and shed counts since startup"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "limit": int(self.limit),
+                "inflight": self.inflight,
+                **self._stats,
+                "shedByRoute": dict(self._shed_by_route),
+            }
+
+    def prometheus(self) -> str:
+        """Limiter gauges and counters in Prometheus text format"""
+        with self._lock:
+            lines: List[str] = [
+                "# HELP generation_concurrency_limit Current adaptive limit on generation requests",
+                "# TYPE generation_concurrency_limit gauge",
+                f"generation_concurrency_limit {int(self.limit)}",
+                "# HELP generation_inflight Generation requests in progress",
+                "# TYPE generation_inflight gauge",
+                f"generation_inflight {self.inflight}",
+                "# HELP generation_shed_total Generation requests rejected with 503",
+                "# TYPE generation_shed_total counter",
+            ]
+            for route, count in sorted(self._shed_by_route.items()):
+                lines.append(f'generation_shed_total{{route="{route}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+_concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None
+
+
+def get_concurrency_limiter() -> AdaptiveConcurrencyLimiter:
+    global _concurrency_limiter
+    if _concurrency_limiter is None:
+        _concurrency_limiter = AdaptiveConcurrencyLimiter()
+    return _concurrency_limiter
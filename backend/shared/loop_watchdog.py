@@ -0,0 +1,191 @@
+"""
+Event Loop Watchdog
+Measures event-loop lag and captures the blocking stack, tagged with the
+route being served, whenever the loop stalls
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from shared.llm_telemetry import Histogram
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class LoopWatchdog:
+    """
+    Heartbeat on the event loop plus a monitor thread watching it
+
+    A coroutine sleeps LOOP_WATCHDOG_INTERVAL_SECONDS at a time; how late
+    it wakes is the loop's lag, kept in a histogram. If the heartbeat is
+    more than LOOP_WATCHDOG_STALL_SECONDS overdue, the monitor thread grabs
+    the loop thread's current stack and the route of the request whose
+    task is running, and logs it once per stall. The stall's full duration
+    is added when the loop comes back. Cost is one wake-up per interval on
+    each side, so it can stay on in production.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("LOOP_WATCHDOG_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("LOOP_WATCHDOG_INTERVAL_SECONDS", "0.1"))
+        self.stall_threshold = float(os.getenv("LOOP_WATCHDOG_STALL_SECONDS", "0.5"))
+        self.stack_depth = int(os.getenv("LOOP_WATCHDOG_STACK_DEPTH", "25"))
+
+        self.lag = Histogram(LAG_BUCKETS)
+        self._stall_seconds: Dict[str, Histogram] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._requests: Dict[asyncio.Task, Dict[str, Any]] = {}
+        self._stall: Optional[Dict[str, Any]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._monitor: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Watch `loop`; call from the loop's thread. Repeat calls are no-ops"""
+        if not self.enabled or self._loop is loop:
+            return
+        with self._lock:
+            self._loop = loop
+            self._loop_thread = threading.get_ident()
+            self._last_beat = time.monotonic()
+            self._stall = None
+        loop.create_task(self._heartbeat(loop))
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._monitor.start()
+
+    async def _heartbeat(self, loop: asyncio.AbstractEventLoop) -> None:
+        while self._loop is loop:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            with self._lock:
+                self.lag.observe(lag)
+                self._last_beat = now
+                stall, self._stall = self._stall, None
+                if stall is not None:
+                    stall["seconds"] = round(lag, 3)
+                    self._stall_seconds.setdefault(stall["route"], Histogram(LAG_BUCKETS)).observe(lag)
+            if stall is not None:
+                logger.warning(f"Event loop was blocked for {lag:.2f}s serving {stall['route']}")
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.interval / 2)
+            with self._lock:
+                overdue = time.monotonic() - self._last_beat - self.interval
+                if self._stall is not None or overdue < self.stall_threshold or self._loop is None:
+                    continue
+                loop, thread = self._loop, self._loop_thread
+
+            frame = sys._current_frames().get(thread)
+            stack = "".join(traceback.format_stack(frame)[-self.stack_depth:]) if frame is not None else ""
+            task = asyncio.current_task(loop)
+            scope = self._requests.get(task) if task is not None else None
+            stall = {
+                "route": self._route(scope),
+                "method": scope.get("method") if scope else None,
+                "detectedAt": time.time(),
+                "seconds": None,  # filled in once the loop resumes
+                "stack": stack,
+            }
+            with self._lock:
+                self._stall = stall
+                self._recent.append(stall)
+            logger.warning(
+                f"Event loop blocked for over {overdue:.2f}s serving {stall['route']}; blocking stack:\n{stack}"
+            )
+
+    @staticmethod
+    def _route(scope: Optional[Dict[str, Any]]) -> str:
+        if scope is None:
+            return "none"
+        # Route templates keep the label set small; unmatched paths share one label
+        return getattr(scope.get("route"), "path", None) or "unmatched"
+
+    # ==================== REQUEST TRACKING ====================
+
+    def track(self, scope: Dict[str, Any]) -> Optional[asyncio.Task]:
+        """Attribute stalls in the current task to this request"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests[task] = scope
+        return task
+
+    def untrack(self, task: Optional[asyncio.Task]) -> None:
+        if task is not None:
+            self._requests.pop(task, None)
+
+    # ==================== METRICS ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Lag summary, stall counts by route and the most recent stalls with their stacks"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "stallThresholdSeconds": self.stall_threshold,
+                "lagSeconds": self.lag.summary(),
+                "stalls": {route: h.summary() for route, h in sorted(self._stall_seconds.items())},
+                "recentStalls": list(self._recent),
+            }
+
+    def prometheus(self) -> str:
+        """Lag and stall histograms in Prometheus text format"""
+        lines: List[str] = []
+        with self._lock:
+            name = "event_loop_lag_seconds"
+            lines += [f"# HELP {name} How late the watchdog heartbeat woke", f"# TYPE {name} histogram"]
+            for bound, count in self.lag.cumulative():
+                lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+            lines += [f"{name}_sum {self.lag.sum:g}", f"{name}_count {self.lag.count}"]
+
+            name = "event_loop_stall_seconds"
+            lines += [f"# HELP {name} Event loop stalls over the threshold, by route", f"# TYPE {name} histogram"]
+            for route, hist in sorted(self._stall_seconds.items()):
+                for bound, count in hist.cumulative():
+                    lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{route="{route}"}} {hist.sum:g}')
+                lines.append(f'{name}_count{{route="{route}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+
+class LoopWatchdogMiddleware:
+    """ASGI middleware that starts the watchdog and tags stalls with the request's route"""
+
+    def __init__(self, app: Any):
+        self.app = app
+        self.watchdog = get_loop_watchdog()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        self.watchdog.start(asyncio.get_running_loop())
+        if scope["type"] != "http" or not self.watchdog.enabled:
+            await self.app(scope, receive, send)
+            return
+        task = self.watchdog.track(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.watchdog.untrack(task)
+
+
+_loop_watchdog: Optional[LoopWatchdog] = None
+
+
+def get_loop_watchdog() -> LoopWatchdog:
+    global _loop_watchdog
+    if _loop_watchdog is None:
+        _loop_watchdog = LoopWatchdog()
+    return _loop_watchdog
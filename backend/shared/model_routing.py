@@ -0,0 +1,122 @@
+"""
+Model Routing
+Maps each LLM task to a deployment and its call parameters, with fallback
+deployments for when one is throttled
+"""
+import os
+import json
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRoute(BaseModel):
+    """Deployment and parameters for one task"""
+    deployment: str
+    maxTokens: Optional[int] = None
+    temperature: Optional[float] = None
+    reasoningEffort: Optional[str] = None  # minimal, low, medium, high (reasoning models only)
+    # Tried in order when the deployment is throttled; a plain name reuses this route's parameters
+    fallbacks: List[Union[str, "ModelRoute"]] = []
+
+    def candidates(self) -> List["ModelRoute"]:
+        """This route followed by its fallbacks, resolved to full routes"""
+        routes = [self]
+        for fallback in self.fallbacks:
+            if isinstance(fallback, str):
+                fallback = self.model_copy(update={"deployment": fallback, "fallbacks": []})
+            routes.append(fallback)
+        return routes
+
+    def apply(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge the route's settings over the caller's default parameters"""
+        merged = dict(params)
+        if self.maxTokens is not None:
+            merged["max_completion_tokens"] = self.maxTokens
+        if self.reasoningEffort is not None:
+            merged["reasoning_effort"] = self.reasoningEffort
+            # Reasoning models reject sampling parameters unless explicitly routed
+            merged.pop("temperature", None)
+        if "temperature" in self.model_fields_set:
+            if self.temperature is None:
+                merged.pop("temperature", None)
+            else:
+                merged["temperature"] = self.temperature
+        return merged
+
+
+ModelRoute.model_rebuild()
+
+
+class ModelRouter:
+    """
+    Task → route table
+
+    The table is a JSON object keyed by task (plan, lesson, lesson_outline,
+    lesson_section, expand, quiz, question_bank, grade, grade_batch) plus
+    an optional "default", read from LLM_ROUTING or from the file named by
+    LLM_ROUTING_FILE. The file is re-read when it changes, so routes can be
+    adjusted without a deploy. Tasks without an entry use "default", which
+    falls back to DEPLOYMENT_NAME.
+    """
+
+    def __init__(self):
+        self.default_deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4")
+        self.path = os.getenv("LLM_ROUTING_FILE")
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.routes: Dict[str, ModelRoute] = self._parse(os.getenv("LLM_ROUTING") or "{}")
+        if self.path:
+            self._reload_if_changed()
+
+    def _parse(self, raw: str) -> Dict[str, ModelRoute]:
+        table = json.loads(raw)
+        if not isinstance(table, dict):
+            raise ValueError("LLM routing table must be a JSON object keyed by task")
+        return {task: ModelRoute.model_validate(route) for task, route in table.items()}
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.warning(f"Cannot read LLM routing file {self.path}: {e}")
+            return
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.routes = self._parse(f.read())
+                logger.info(f"Loaded LLM routes for: {', '.join(sorted(self.routes)) or 'none'}")
+            except Exception as e:
+                # Keep serving the previous table rather than failing requests
+                logger.error(f"Invalid LLM routing file {self.path}: {e}")
+            self._mtime = mtime
+
+    def route_for(self, task: str) -> ModelRoute:
+        if self.path:
+            self._reload_if_changed()
+        return self.routes.get(task) or self.routes.get("default") or ModelRoute(deployment=self.default_deployment)
+
+    def table(self) -> Dict[str, Any]:
+        """Effective routes, for diagnostics"""
+        routes = {task: route.model_dump(exclude_unset=True) for task, route in self.routes.items()}
+        routes.setdefault("default", {"deployment": self.default_deployment})
+        return routes
+
+
+_model_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter()
+    return _model_router
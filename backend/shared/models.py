@@ -30,6 +30,7 @@ class LessonPlan(BaseModel):
     structure: List[LessonPlanItem] = []
     aiGeneratedAt: Optional[datetime] = None
     approvedAt: Optional[datetime] = None
+    promptVersion: Optional[str] = None  # registry tag of the prompt that generated it
 
 
 class LessonSection(BaseModel):
@@ -52,6 +53,8 @@ class Lesson(BaseModel):
     mediaAssets: List[Dict[str, Any]] = []
     status: str = "not_started"
     completedAt: Optional[datetime] = None
+    pregenerated: bool = False  # generated ahead of time and not yet opened
+    promptVersion: Optional[str] = None  # registry tag of the prompt that generated it
 
 
 class Question(BaseModel):
@@ -61,8 +64,11 @@ class Question(BaseModel):
     options: Optional[List[str]] = None
     correctAnswer: Optional[Any] = None
     markScheme: Optional[List[str]] = None
+    rubric: Optional[str] = None  # compact form of markScheme used for grading
     maxMarks: Optional[float] = None
     difficulty: Optional[str] = None
+    concept: Optional[str] = None  # lesson concept the question tests
+    bankQuestionId: Optional[str] = None  # question bank entry it was sampled from
 
 class Quiz(BaseModel):
     id: str
@@ -72,6 +78,21 @@ class Quiz(BaseModel):
     subtopicId: Optional[str] = None
     questions: List[Question] = []
     createdAt: Optional[datetime]
+    pregenerated: bool = False  # generated ahead of time and not yet started
+    promptVersion: Optional[str] = None  # registry tag of the prompt that generated it
+    questionBankId: Optional[str] = None  # set when sampled from a question bank
+
+class QuestionBank(BaseModel):
+    id: str  # the lesson id; one bank per lesson
+    userId: str
+    type: str = "questionBank"
+    lessonId: str
+    subtopicId: Optional[str] = None
+    questions: List[Question] = []
+    served: Dict[str, int] = {}  # bank questionId -> times included in a quiz
+    createdAt: Optional[datetime]
+    updatedAt: Optional[datetime] = None
+    promptVersion: Optional[str] = None
 
 class QuizAttemptResponse(BaseModel):
     questionId: str
@@ -82,6 +103,8 @@ class QuizAttemptResponse(BaseModel):
     feedback: Optional[str] = None
     isCorrect: Optional[bool] = None
     timeSpent: Optional[int] = None
+    gradingTier: Optional[str] = None  # which grading tier decided a written answer
+    promptVersion: Optional[str] = None  # registry tag of the grading prompt, if LLM-graded
 
 class QuizAttempt(BaseModel):
     id: str
@@ -106,6 +129,70 @@ class Progress(BaseModel):
     overallProgress: Optional[Dict[str, Any]] = {}
     updatedAt: Optional[datetime]
 
+class Job(BaseModel):
+    """Long-running LLM work queued for a background worker"""
+    id: str
+    userId: str
+    type: str = "job"
+    kind: str  # create_lesson_plan, start_lesson, start_quiz, submit_quiz
+    payload: Dict[str, Any] = {}
+    status: Literal["queued", "running", "succeeded", "failed"] = "queued"
+    attempts: int = 0
+    maxAttempts: int = 3
+    runAfter: Optional[datetime] = None
+    leaseExpiresAt: Optional[datetime] = None
+    workerId: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    updatedAt: Optional[datetime] = None
+
+class Lease(BaseModel):
+    """Short-lived lock document coordinating work across API workers"""
+    id: str
+    userId: str
+    type: str = "lease"
+    key: str
+    owner: str
+    expiresAt: datetime
+    ttl: int  # seconds; Cosmos removes the document after this
+
+class DashboardSummary(BaseModel):
+    """Per-user dashboard view, kept up to date from plan, progress and attempt changes"""
+    id: str  # dashboard_<userId>
+    userId: str
+    type: str = "dashboard"
+    plans: Dict[str, Dict[str, Any]] = {}  # plan id -> titles, counts and progress
+    attemptScores: Dict[str, float] = {}  # completed quiz attempt id -> percentage
+    totals: Dict[str, Any] = {}
+    recommendations: List[str] = []
+    updatedAt: Optional[datetime] = None
+
+class FeedCheckpoint(BaseModel):
+    """How far a change feed consumer has read a container"""
+    id: str
+    userId: str  # fixed partition shared by all checkpoints
+    type: str = "feedCheckpoint"
+    container: str
+    continuation: Optional[str] = None
+    updatedAt: Optional[datetime] = None
+
+class IdempotencyRecord(BaseModel):
+    """First response to a request sent with an Idempotency-Key"""
+    id: str  # hash of user, method, route and key
+    userId: str
+    type: str = "idempotency"
+    key: str
+    route: str
+    requestHash: str
+    owner: str
+    status: Literal["in_progress", "completed"] = "in_progress"
+    statusCode: Optional[int] = None
+    contentType: Optional[str] = None
+    body: Optional[str] = None
+    expiresAt: datetime  # lease while in progress, end of the replay window once completed
+    ttl: int  # seconds; Cosmos removes the document after this
+
     # ==================== REQUEST/RESPONSE MODELS ====================
 
 class CreateLessonPlanRequest(BaseModel):
@@ -377,6 +464,31 @@ class QuizResultResponse(BaseModel):
     weak_concepts: List[str]
 
 
+class JobResponse(BaseModel):
+    """Status (and, once finished, result) of a background job"""
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "job_id": "6f1c2b0e-8a4d-4c55-9d7e-3f2a1b0c9d8e",
+            "kind": "start_lesson",
+            "status": "succeeded",
+            "attempts": 1,
+            "result": {"lesson_id": "lesson123", "subject": "Math"},
+            "error": None,
+            "created_at": "2025-12-15T17:39:23.775022+00:00",
+            "updated_at": "2025-12-15T17:39:41.102311+00:00"
+        }
+    })
+
+    job_id: str
+    kind: str
+    status: str
+    attempts: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
 # Tutor request/response models removed
 
 
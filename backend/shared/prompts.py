@@ -0,0 +1,116 @@
+"""
+Prompt Registry
+Versioned prompt templates with static instructions first and structured
+output schemas built once at startup
+"""
+from typing import Any, Dict, List, Optional, Type
+
+from openai import pydantic_function_tool
+from pydantic import BaseModel
+
+# Shared by every prompt whose output is rendered in the frontend
+FORMATTING_GUIDELINES = (
+    "Formatting and style guidelines:\n"
+    "- Use Markdown for all formatting.\n"
+    "- Use `#` and `##` for headings and subheadings.\n"
+    "- Use `-` or `*` for bullet points.\n"
+    "- Use `1.` for numbered lists only when sequence matters.\n"
+    "- Use `$...$` for inline math and `$$...$$` for block math when needed.\n"
+    "- Use triple backticks ``` **only** when rendering code blocks or clearly marked callouts.\n"
+    "- Do **not** use triple backticks for regular text, examples, or emphasis.\n"
+    "- Ensure the output is clearly written and ready to render in a Markdown/KaTeX environment."
+)
+
+
+def strict_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Strict JSON schema for a structured-output model
+
+    Taken from the SDK's public function-tool helper, which runs the same
+    conversion parse() applies per request.
+    """
+    return pydantic_function_tool(model)["function"]["parameters"]
+
+
+class PromptTemplate:
+    """
+    A named, versioned prompt
+
+    The system message holds everything that is the same from call to call
+    (role, task rules, formatting guidelines) and may only take
+    low-cardinality parameters such as the course level. Per-request content
+    always goes last, in the user message, so calls share an identical
+    prefix that the provider can cache. For structured prompts the strict
+    JSON schema is built when the template is registered instead of on
+    every call.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        instructions: str,
+        response_model: Optional[Type[BaseModel]] = None
+    ):
+        self.name = name
+        self.version = version
+        self.instructions = instructions
+        self.response_model = response_model
+        self.response_format: Optional[Dict[str, Any]] = None
+        if response_model is not None:
+            self.response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": response_model.__name__,
+                    "schema": strict_json_schema(response_model),
+                    "strict": True,
+                },
+            }
+
+    @property
+    def tag(self) -> str:
+        """Identifier stored on generated documents, e.g. `lesson@2`"""
+        return f"{self.name}@{self.version}"
+
+    def messages(self, content: str, **params: Any) -> List[Dict[str, str]]:
+        """Build the chat messages: static instructions, then the request content"""
+        system = self.instructions.format(**params) if params else self.instructions
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": content}
+        ]
+
+    def parse(self, completion: Any) -> BaseModel:
+        """Validate a structured completion against the template's response model"""
+        message = completion.choices[0].message
+        if getattr(message, "refusal", None):
+            raise RuntimeError(f"Model refused {self.tag}: {message.refusal}")
+        return self.response_model.model_validate_json(message.content)
+
+
+_registry: Dict[str, PromptTemplate] = {}
+
+
+def register_prompt(
+    name: str,
+    version: str,
+    instructions: str,
+    response_model: Optional[Type[BaseModel]] = None
+) -> PromptTemplate:
+    """Create a template and add it to the registry (once per name)"""
+    if name in _registry:
+        raise ValueError(f"Prompt {name} is already registered")
+    template = PromptTemplate(name, version, instructions, response_model)
+    _registry[name] = template
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    if name not in _registry:
+        raise KeyError(f"Unknown prompt: {name}")
+    return _registry[name]
+
+
+def prompt_versions() -> Dict[str, str]:
+    """Versions of every registered prompt"""
+    return {name: template.version for name, template in _registry.items()}
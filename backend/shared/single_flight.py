@@ -0,0 +1,233 @@
+"""
+Single Flight
+Collapses concurrent identical generations into one call, within a process
+and, through short-lived Cosmos lease documents, across API workers
+"""
+import os
+import time
+import uuid
+import socket
+import hashlib
+import threading
+import logging
+from concurrent.futures import Future
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from azure.cosmos import exceptions
+
+from shared.models import Lease
+from shared.cosmos_client import get_cosmos_service
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Run at most one generation per key at a time
+
+    Callers in the same process that arrive while a generation for their key
+    is running wait for it and share its result (or its exception). The
+    in-process leader also takes a Cosmos lease for the key; if a worker in
+    another process already holds it, the leader waits for that lease to be
+    released or expire and then reads the persisted result via `lookup`,
+    falling back to generating itself if nothing was stored.
+
+    A heartbeat renews the lease every third of SINGLE_FLIGHT_LEASE_SECONDS
+    while the generation runs, so a slow generation keeps it and a dead
+    worker's lapses soon after. Renewals and the release are conditioned on
+    the lease's owner and etag, so a worker never extends or deletes a lease
+    another worker has since taken over.
+    """
+
+    CONTAINER = "Leases"
+
+    def __init__(self):
+        self.cosmos = get_cosmos_service()
+        self.lease_seconds = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "120"))
+        self.poll_interval = float(os.getenv("SINGLE_FLIGHT_POLL_SECONDS", "1"))
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], T],
+        partition_key: str,
+        lookup: Optional[Callable[[], Optional[T]]] = None
+    ) -> T:
+        """
+        Run `fn` once for `key`, sharing the result with concurrent callers
+
+        Args:
+            key: Deterministic id of the work (e.g. "lesson:<lesson id>")
+            fn: The generation to run
+            partition_key: User id the lease document is stored under
+            lookup: Reads the result another worker persisted, if any
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+
+        if not leader:
+            logger.info(f"Joining in-flight generation: {key}")
+            return call.result()
+
+        try:
+            result = self._run_with_lease(key, fn, partition_key, lookup)
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    # ==================== CROSS-WORKER LEASES ====================
+
+    def _run_with_lease(
+        self,
+        key: str,
+        fn: Callable[[], T],
+        partition_key: str,
+        lookup: Optional[Callable[[], Optional[T]]]
+    ) -> T:
+        if self.lease_seconds <= 0:
+            return fn()
+
+        lease_id = hashlib.sha256(key.encode()).hexdigest()
+        while True:
+            acquired = self._acquire(lease_id, key, partition_key)
+            if acquired is not False:
+                stop = threading.Event()
+                if acquired:
+                    heartbeat = threading.Thread(
+                        target=self._heartbeat,
+                        args=(lease_id, key, partition_key, stop),
+                        name=f"lease-{lease_id[:8]}",
+                        daemon=True
+                    )
+                    heartbeat.start()
+                try:
+                    return fn()
+                finally:
+                    if acquired:
+                        stop.set()
+                        heartbeat.join()  # no renewal may land between the release's read and delete
+                        self._release(lease_id, partition_key)
+
+            logger.info(f"Waiting for another worker's generation: {key}")
+            self._wait_for_release(lease_id, partition_key)
+
+            if lookup:
+                result = lookup()
+                if result is not None:
+                    return result
+
+    def _acquire(self, lease_id: str, key: str, partition_key: str) -> Optional[bool]:
+        """
+        Returns:
+            True if acquired, False if another worker holds it, None if the
+            lease store is unavailable (the caller proceeds uncoordinated)
+        """
+        now = datetime.now(timezone.utc)
+        lease = Lease(
+            id=lease_id,
+            userId=partition_key,
+            key=key,
+            owner=self.owner,
+            expiresAt=now + timedelta(seconds=self.lease_seconds),
+            ttl=self.lease_seconds
+        )
+        for _ in range(2):
+            try:
+                self.cosmos.create_item(self.CONTAINER, lease)
+                return True
+            except exceptions.CosmosResourceExistsError:
+                current, etag = self._read(lease_id, partition_key)
+                if current is None:
+                    continue
+                if current.expiresAt > now:
+                    return False
+                # Holder died without releasing; clear the stale lease and retry
+                self._delete(lease_id, partition_key, etag)
+            except Exception as e:
+                logger.warning(f"Lease store unavailable, generating without coordination: {e}")
+                return None
+        return False
+
+    def _heartbeat(self, lease_id: str, key: str, partition_key: str, stop: threading.Event) -> None:
+        """Extend our lease every third of its length until `stop` is set"""
+        while not stop.wait(self.lease_seconds / 3):
+            current, etag = self._read(lease_id, partition_key)
+            if current is None or current.owner != self.owner:
+                logger.warning(f"Lost lease for {key}; another worker may run the same generation")
+                return
+            current.expiresAt = datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)
+            try:
+                self.cosmos.update_item(self.CONTAINER, current, etag=etag)
+            except exceptions.CosmosAccessConditionFailedError:
+                logger.warning(f"Lost lease for {key}; another worker may run the same generation")
+                return
+            except Exception as e:
+                logger.warning(f"Error renewing lease {lease_id}: {e}")
+
+    def _wait_for_release(self, lease_id: str, partition_key: str) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            current, _ = self._read(lease_id, partition_key)
+            if current is None or current.expiresAt <= datetime.now(timezone.utc):
+                return
+
+    def _read(self, lease_id: str, partition_key: str) -> Tuple[Optional[Lease], Optional[str]]:
+        """The lease and its etag, or (None, None) if it is gone or unreadable"""
+        try:
+            return self.cosmos.get_item_if_changed(
+                container=self.CONTAINER,
+                item_id=lease_id,
+                partition_key=partition_key,
+                model_class=Lease
+            )
+        except Exception as e:
+            logger.warning(f"Error reading lease {lease_id}: {e}")
+            return None, None
+
+    def _release(self, lease_id: str, partition_key: str) -> None:
+        """Delete the lease if this worker still holds it"""
+        current, etag = self._read(lease_id, partition_key)
+        if current is not None and current.owner == self.owner:
+            self._delete(lease_id, partition_key, etag)
+
+    def _delete(self, lease_id: str, partition_key: str, etag: Optional[str]) -> None:
+        """Delete the lease unless it changed since it was read with `etag`"""
+        try:
+            self.cosmos.delete_item(
+                container=self.CONTAINER,
+                item_id=lease_id,
+                partition_key=partition_key,
+                etag=etag
+            )
+        except exceptions.CosmosAccessConditionFailedError:
+            pass  # renewed or taken over since the read; not ours to delete
+        except Exception as e:
+            logger.warning(f"Error releasing lease {lease_id}: {e}")
+
+
+# ---------- Singleton (one registry per process) ----------
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
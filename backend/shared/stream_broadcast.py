@@ -0,0 +1,65 @@
+"""
+Stream Broadcast
+Fans out the chunks of a single producer to any number of readers
+"""
+import threading
+from typing import Iterator, List, Optional
+
+
+class StreamBroadcast:
+    """
+    Thread-safe buffer of streamed chunks.
+
+    One producer publishes chunks; every subscriber replays what has been
+    buffered so far and then follows the live stream until it is closed.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def text(self) -> str:
+        """Everything published so far"""
+        with self._cond:
+            return "".join(self._chunks)
+
+    def publish(self, chunk: str) -> None:
+        if not chunk:
+            return
+        with self._cond:
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Mark the stream finished, optionally with the producer's error"""
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def subscribe(self) -> Iterator[str]:
+        """Yield buffered chunks, then live ones until the producer closes"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._chunks) and not self._done:
+                    self._cond.wait()
+                pending = self._chunks[index:]
+                index += len(pending)
+                finished = self._done and index >= len(self._chunks)
+                error = self._error
+
+            for chunk in pending:
+                yield chunk
+
+            if finished:
+                if error is not None:
+                    raise error
+                return
@@ -0,0 +1,150 @@
+"""
+Token Accounting
+Counts prompt tokens with a local tokenizer and trims prompt content to
+per-task input budgets
+"""
+import os
+import math
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default input-token budgets per prompt builder; override with
+# PROMPT_TOKEN_BUDGET_<TASK> (e.g. PROMPT_TOKEN_BUDGET_QUIZ=8000)
+DEFAULT_BUDGETS = {
+    "plan": 2000,
+    "lesson": 3000,
+    "expand": 4000,
+    "quiz": 6000,
+    "question_bank": 8000,
+    "grade": 2500,
+    "grade_batch": 8000,
+}
+
+# Chat formatting overhead per message (role, separators)
+_MESSAGE_OVERHEAD = 4
+_TRUNCATION_MARK = " …"
+
+# tiktoken keeps downloaded BPE files here unless TIKTOKEN_CACHE_DIR is set;
+# python -m tools.cache_tokenizer fills it so the tokenizer loads offline
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tiktoken")
+
+_encoding = None
+_retry_at = 0.0
+_lock = threading.Lock()
+
+
+def _get_encoding():
+    """
+    Load the tiktoken encoding, retrying every TOKENIZER_RETRY_SECONDS
+
+    tiktoken fetches its BPE file on first use unless it is already in
+    TIKTOKEN_CACHE_DIR (default backend/.tiktoken), so deployments should
+    pre-cache it at build time with tools.cache_tokenizer. Until it loads,
+    counts fall back to a ~4 characters per token estimate.
+    """
+    global _encoding, _retry_at
+    if _encoding is not None or time.monotonic() < _retry_at:
+        return _encoding
+    with _lock:
+        if _encoding is None and time.monotonic() >= _retry_at:
+            if not os.getenv("TIKTOKEN_CACHE_DIR"):
+                os.environ["TIKTOKEN_CACHE_DIR"] = DEFAULT_CACHE_DIR
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", "o200k_base"))
+            except Exception as e:
+                retry_seconds = float(os.getenv("TOKENIZER_RETRY_SECONDS", "300"))
+                _retry_at = time.monotonic() + retry_seconds
+                logger.warning(f"Tokenizer unavailable, estimating token counts for {retry_seconds:g}s: {e}")
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(count_tokens(str(m.get("content", ""))) + _MESSAGE_OVERHEAD for m in messages)
+
+
+def truncate_to_tokens(text: Optional[str], max_tokens: int) -> str:
+    """Cut text to at most `max_tokens`, marking the cut"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text or ""
+    if max_tokens <= 0:
+        return ""
+
+    encoding = _get_encoding()
+    keep = max(max_tokens - count_tokens(_TRUNCATION_MARK), 0)
+    if encoding is None:
+        return text[:keep * 4].rstrip() + _TRUNCATION_MARK
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:keep]).rstrip() + _TRUNCATION_MARK
+
+
+def budget_for(task: str) -> int:
+    default = DEFAULT_BUDGETS.get(task, 4000)
+    return int(os.getenv(f"PROMPT_TOKEN_BUDGET_{task.upper()}", default))
+
+
+def fit_lesson_context(
+    sections: List[Dict[str, Any]],
+    summary: str,
+    key_terms: List[str],
+    budget: int
+) -> str:
+    """
+    Render lesson content for a prompt within `budget` tokens
+
+    Trimming is deterministic and keeps the most information-dense parts
+    first: the lesson summary and key terms, then every section's title and
+    key points, then section content, which is truncated to an equal share
+    of whatever budget is left. If even the summary and key points do not
+    fit, the whole rendering is hard-truncated.
+    """
+    def render(content_tokens: Optional[int]) -> str:
+        parts = [f"Summary: {summary}", f"Key Terms: {', '.join(key_terms)}"]
+        for s in sections:
+            block = f"Section: {s.get('title')}"
+            if content_tokens is None:
+                block += f"\n{s.get('content')}"
+            else:
+                points = s.get("keyPoints") or []
+                if points:
+                    block += "\nKey points:\n" + "\n".join(f"- {p}" for p in points)
+                if content_tokens > 0:
+                    block += f"\n{truncate_to_tokens(s.get('content'), content_tokens)}"
+            parts.append(block)
+        return "\n\n".join(parts)
+
+    full = render(None)
+    if count_tokens(full) <= budget:
+        return full
+
+    condensed = render(0)
+    remaining = budget - count_tokens(condensed)
+    if remaining <= 0 or not sections:
+        return truncate_to_tokens(condensed, budget)
+
+    # Key points are repeated once per section header, so leave a small margin
+    per_section = remaining // len(sections) - 8
+    return render(per_section) if per_section > 0 else condensed
+
+
+def log_prompt_tokens(task: str, messages: List[Dict[str, Any]]) -> int:
+    """Log (and return) the input token count of a prompt against its budget"""
+    tokens = count_message_tokens(messages)
+    budget = budget_for(task)
+    if tokens > budget:
+        logger.warning(f"Prompt tokens [{task}]: {tokens} exceeds budget {budget}")
+    else:
+        logger.info(f"Prompt tokens [{task}]: {tokens} / {budget}")
+    return tokens
@@ -0,0 +1,119 @@
+"""
+Shared test fixtures
+Services run against an in-memory Cosmos container client, so etag
+conditions, conflicts and not-found errors take the same code paths as
+against a real account. No network access is needed.
+"""
+import os
+import re
+import sys
+import copy
+import time
+import itertools
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("COSMOS_CONNECTION_STRING", "AccountEndpoint=https://localhost:8081/;AccountKey=dGVzdA==;")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://localhost")
+os.environ.setdefault("AZURE_OPENAI_KEY", "test")
+
+import shared.cosmos_client as cosmos_client  # noqa: E402
+
+_etags = itertools.count(1)
+
+
+class InMemoryContainer:
+    """The subset of the Cosmos ContainerProxy API that CosmosService uses"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _stored(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        doc = copy.deepcopy(body)
+        doc["_etag"] = f'"{next(_etags)}"'
+        doc["_ts"] = int(time.time())
+        self.items[(doc["id"], doc["userId"])] = doc
+        return copy.deepcopy(doc)
+
+    def _current(self, item: str, partition_key: str) -> Dict[str, Any]:
+        doc = self.items.get((item, partition_key))
+        if doc is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+        return doc
+
+    @staticmethod
+    def _check(doc: Dict[str, Any], etag: Optional[str], match_condition: Any) -> None:
+        if match_condition == MatchConditions.IfNotModified and doc["_etag"] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="etag mismatch")
+
+    def read_item(self, item: str, partition_key: str, etag: Optional[str] = None, match_condition: Any = None):
+        with self._lock:
+            doc = self._current(item, partition_key)
+            if match_condition == MatchConditions.IfModified and doc["_etag"] == etag:
+                return None  # 304 Not Modified
+            return copy.deepcopy(doc)
+
+    def create_item(self, body: Dict[str, Any]):
+        with self._lock:
+            if (body["id"], body["userId"]) in self.items:
+                raise exceptions.CosmosResourceExistsError(status_code=409, message=f"{body['id']} exists")
+            return self._stored(body)
+
+    def replace_item(self, item: str, body: Dict[str, Any], etag: Optional[str] = None, match_condition: Any = None):
+        with self._lock:
+            self._check(self._current(item, body["userId"]), etag, match_condition)
+            return self._stored(body)
+
+    def upsert_item(self, body: Dict[str, Any]):
+        with self._lock:
+            return self._stored(body)
+
+    def delete_item(self, item: str, partition_key: str, etag: Optional[str] = None, match_condition: Any = None):
+        with self._lock:
+            self._check(self._current(item, partition_key), etag, match_condition)
+            del self.items[(item, partition_key)]
+
+    def query_items(
+        self,
+        query: str,
+        partition_key: Optional[str] = None,
+        parameters: Optional[List[Dict[str, Any]]] = None,
+        **kwargs: Any
+    ):
+        # Equality filters only: "c.<field> = @<param>" joined by AND
+        values = {p["name"]: p["value"] for p in parameters or []}
+        filters = re.findall(r"c\.(\w+)\s*=\s*(@\w+)", query)
+        with self._lock:
+            return [
+                copy.deepcopy(doc)
+                for (_, pk), doc in self.items.items()
+                if (partition_key is None or pk == partition_key)
+                and all(doc.get(field) == values[param] for field, param in filters)
+            ]
+
+
+class InMemoryCosmosService(cosmos_client.CosmosService):
+    """CosmosService whose containers live in memory"""
+
+    def __init__(self):
+        super().__init__()
+        self.containers: Dict[str, InMemoryContainer] = {}
+
+    def _get_container(self, container_name: str):
+        return self.containers.setdefault(container_name, InMemoryContainer(container_name))
+
+
+@pytest.fixture
+def cosmos(monkeypatch) -> InMemoryCosmosService:
+    """A fresh in-memory store, installed as the process-wide Cosmos service"""
+    service = InMemoryCosmosService()
+    monkeypatch.setattr(cosmos_client, "_cosmos_service", service)
+    return service
@@ -0,0 +1,59 @@
+from quizzes.quiz_service import compile_rubric
+
+
+def test_explicit_marks_are_kept_and_filler_dropped():
+    rubric = compile_rubric([
+        "Award 2 marks for explaining osmosis.",
+        "(1 mark): water moves from dilute to concentrated",
+        "Mentions diffusion [2]",
+        "[1] Names the gas",
+    ])
+
+    assert rubric.splitlines() == [
+        "[2] Explaining osmosis",
+        "[1] Water moves from dilute to concentrated",
+        "[2] Mentions diffusion",
+        "[1] Names the gas",
+    ]
+
+
+def test_remaining_marks_are_shared_across_unstated_points():
+    rubric = compile_rubric([
+        "Award 2 marks for explaining osmosis",
+        "The student should mention a partially permeable membrane",
+        "Water moves from dilute to concentrated",
+    ], max_marks=4)
+
+    assert rubric.splitlines() == [
+        "[2] Explaining osmosis",
+        "[1] Mention a partially permeable membrane",
+        "[1] Water moves from dilute to concentrated",
+    ]
+
+
+def test_unstated_points_get_one_mark_without_a_total():
+    assert compile_rubric(["a point", "another point"]) == "[1] A point\n[1] Another point"
+
+
+def test_fractional_shares_are_printed_compactly():
+    assert compile_rubric(["first", "second"], max_marks=3) == "[1.5] First\n[1.5] Second"
+
+
+def test_empty_scheme_compiles_to_nothing():
+    assert compile_rubric([], max_marks=3) == ""
+    assert compile_rubric(["  ", "."], max_marks=3) == ""
+    assert compile_rubric(None) == ""
+
+
+def test_unstated_points_get_nothing_once_stated_marks_reach_the_total():
+    rubric = compile_rubric([
+        "Award 2 marks for explaining osmosis",
+        "Mentions diffusion [2]",
+        "Water moves from dilute to concentrated",
+    ], max_marks=4)
+
+    assert rubric.splitlines() == [
+        "[2] Explaining osmosis",
+        "[2] Mentions diffusion",
+        "[0] Water moves from dilute to concentrated",
+    ]
@@ -0,0 +1,67 @@
+from fastapi import Request, Response
+
+from shared.http_responses import (
+    REVALIDATE_CACHE_CONTROL,
+    collection_etag,
+    etag_matches,
+    if_none_match,
+    not_modified,
+    set_etag,
+)
+
+
+def _request(if_none_match_header=None):
+    headers = []
+    if if_none_match_header is not None:
+        headers.append((b"if-none-match", if_none_match_header.encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_collection_etag_ignores_order_and_tracks_versions():
+    versions = [{"id": "p1", "_etag": '"1"'}, {"id": "p2", "_etag": '"7"'}]
+
+    etag = collection_etag(versions)
+
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == collection_etag(list(reversed(versions)))
+    assert etag != collection_etag([{"id": "p1", "_etag": '"2"'}, {"id": "p2", "_etag": '"7"'}])
+    assert etag != collection_etag(versions[:1])
+
+
+def test_collection_etag_of_nothing_is_stable():
+    assert collection_etag([]) == collection_etag([])
+
+
+def test_if_none_match_lists_every_tag():
+    assert if_none_match(_request('"a", W/"b" ,"c"')) == ['"a"', 'W/"b"', '"c"']
+    assert if_none_match(_request()) == []
+
+
+def test_etag_matches_uses_weak_comparison():
+    assert etag_matches(['"a"'], '"a"')
+    assert etag_matches(['W/"a"'], '"a"')
+    assert etag_matches(['"a"'], 'W/"a"')
+    assert etag_matches(["*"], '"a"')
+    assert not etag_matches(['"b"'], '"a"')
+    assert not etag_matches([], '"a"')
+    assert not etag_matches(["*"], None)
+
+
+def test_not_modified_carries_the_etag_and_no_body():
+    response = not_modified('"a"')
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["ETag"] == '"a"'
+    assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+
+
+def test_set_etag_marks_the_response_for_revalidation():
+    response = Response()
+    set_etag(response, '"a"')
+    assert response.headers["ETag"] == '"a"'
+    assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+
+    untouched = Response()
+    set_etag(untouched, None)
+    assert "ETag" not in untouched.headers
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from shared.models import IdempotencyRecord
+from shared.idempotency import (
+    IdempotencyConflict,
+    IdempotencyStore,
+    IdempotencyTimeout,
+    IdempotentReplay,
+)
+
+
+@pytest.fixture
+def store_factory(cosmos, monkeypatch):
+    monkeypatch.setenv("IDEMPOTENCY_LEASE_SECONDS", "60")
+    monkeypatch.setenv("IDEMPOTENCY_WAIT_SECONDS", "0.3")
+    monkeypatch.setenv("IDEMPOTENCY_POLL_SECONDS", "0.05")
+    return IdempotencyStore
+
+
+def _begin(store, body=b'{"n": 1}', key="k1"):
+    return store.begin("u1", "POST", "/api/quizzes", key, body)
+
+
+def _stored(cosmos, record):
+    return cosmos.get_item("Leases", record.id, record.userId, IdempotencyRecord)
+
+
+def test_completed_response_is_replayed(store_factory):
+    store = store_factory()
+
+    async def scenario():
+        record = await _begin(store)
+        await store.complete(record, 201, "application/json", b'{"id": "q1"}')
+        with pytest.raises(IdempotentReplay) as replay:
+            await _begin(store)
+        return replay.value.response()
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 201
+    assert response.body == b'{"id": "q1"}'
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+
+def test_key_reused_for_a_different_body_conflicts(store_factory):
+    store = store_factory()
+
+    async def scenario():
+        await _begin(store)
+        await _begin(store, body=b'{"n": 2}')
+
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(scenario())
+
+
+def test_duplicate_times_out_while_the_original_runs(store_factory):
+    store = store_factory()
+
+    async def scenario():
+        await _begin(store)
+        await _begin(store)
+
+    with pytest.raises(IdempotencyTimeout):
+        asyncio.run(scenario())
+
+
+def test_duplicate_waits_for_the_original_and_replays_it(store_factory):
+    store = store_factory()
+
+    async def scenario():
+        record = await _begin(store)
+
+        async def finish():
+            await asyncio.sleep(0.1)
+            await store.complete(record, 200, "application/json", b'"done"')
+
+        task = asyncio.create_task(finish())
+        with pytest.raises(IdempotentReplay) as replay:
+            await _begin(store)
+        await task
+        return replay.value.record
+
+    assert asyncio.run(scenario()).body == '"done"'
+
+
+@pytest.mark.parametrize("status_code", [500, 503, 429])
+def test_failed_responses_release_the_key(store_factory, cosmos, status_code):
+    store = store_factory()
+
+    async def scenario():
+        record = await _begin(store)
+        await store.complete(record, status_code, "application/json", b'{"detail": "x"}')
+        return record, await _begin(store)
+
+    record, retried = asyncio.run(scenario())
+    assert retried is not None
+    assert _stored(cosmos, record).status == "in_progress"
+
+
+def test_expired_claim_is_taken_over_and_its_late_completion_dropped(store_factory, cosmos, monkeypatch):
+    monkeypatch.setenv("IDEMPOTENCY_LEASE_SECONDS", "0")
+    stale = store_factory()
+    monkeypatch.setenv("IDEMPOTENCY_LEASE_SECONDS", "60")
+    retry = store_factory()
+
+    async def scenario():
+        first = await _begin(stale)
+        second = await _begin(retry)
+        # The first request finishes after its lease lapsed
+        await stale.complete(first, 200, "application/json", b'"first"')
+        await stale.release(first)
+        held = _stored(cosmos, second)
+        await retry.complete(second, 200, "application/json", b'"second"')
+        return held
+
+    held = asyncio.run(scenario())
+    assert held.status == "in_progress"
+    assert held.owner == retry.owner
+    assert _stored(cosmos, held).body == '"second"'
+
+
+def test_disabled_store_claims_nothing(store_factory, monkeypatch):
+    monkeypatch.setenv("IDEMPOTENCY_ENABLED", "false")
+
+    assert asyncio.run(_begin(store_factory())) is None
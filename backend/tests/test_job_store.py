@@ -0,0 +1,64 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from jobs.job_store import CosmosJobStore, JobStore, LocalJobStore
+from shared.models import Job
+
+
+@pytest.fixture(params=["local", "cosmos"])
+def store(request, tmp_path, cosmos):
+    if request.param == "local":
+        return LocalJobStore(str(tmp_path / "jobs.db"))
+    return CosmosJobStore()
+
+
+def _lapsed_claim(store):
+    """A job claimed by worker w1 whose lease has run out"""
+    past = datetime.now(timezone.utc) - timedelta(seconds=5)
+    return store.create(Job(
+        id="job-1",
+        userId="u1",
+        kind="start_lesson",
+        payload={},
+        status="running",
+        attempts=1,
+        workerId="w1",
+        leaseExpiresAt=past,
+        runAfter=past,
+        createdAt=past,
+        updatedAt=past
+    ))
+
+
+def test_finish_stores_the_outcome_of_the_current_claim(store):
+    _lapsed_claim(store)
+    job = store.claim_next("w2", 60)
+    job.status = "succeeded"
+    job.result = {"lessonId": "l1"}
+
+    assert store.finish(job)
+    assert store.get("u1", "job-1").status == "succeeded"
+
+
+def test_a_lapsed_claim_cannot_overwrite_the_takeover(store):
+    stale = _lapsed_claim(store)
+    taken = store.claim_next("w2", 60)
+    assert (taken.workerId, taken.attempts) == ("w2", 2)
+
+    stale.status = "failed"
+    stale.error = "timed out"
+    assert not store.finish(stale)
+    assert not store.renew(stale, 60)
+
+    stored = store.get("u1", "job-1")
+    assert (stored.status, stored.workerId) == ("running", "w2")
+
+
+def test_store_backends_must_implement_the_interface():
+    class Incomplete(JobStore):
+        def create(self, job):
+            return job
+
+    with pytest.raises(TypeError):
+        Incomplete()
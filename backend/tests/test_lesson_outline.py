@@ -0,0 +1,44 @@
+import types
+import threading
+
+import pytest
+
+from lessons.lesson_service import LessonOutlineLLM, LessonService, SectionOutlineLLM
+
+
+class FakeLLM:
+    """Outlines three sections; the first section's body fails and the second waits for `release`"""
+
+    def __init__(self):
+        self.sections_started = []
+        self.release = threading.Event()
+
+    def parse(self, task, prompt, messages):
+        return LessonOutlineLLM(
+            introduction="intro",
+            sections=[SectionOutlineLLM(title=f"Part {i}", keyPoints=["point"]) for i in range(1, 4)],
+            summary="summary",
+            keyTerms=["term"]
+        )
+
+    def complete(self, task, messages):
+        title = next(line for line in messages[-1]["content"].splitlines() if line.startswith("Write section"))
+        self.sections_started.append(title)
+        if title.endswith("Part 1"):
+            raise ValueError("Empty body for section Part 1")
+        self.release.wait(5)
+        message = types.SimpleNamespace(content=f"body of {title}")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def test_a_failed_section_cancels_the_sections_still_queued(cosmos, monkeypatch):
+    monkeypatch.setenv("LESSON_SECTION_CONCURRENCY", "1")
+    service = LessonService()
+    service.llm = FakeLLM()
+
+    with pytest.raises(ValueError, match="Part 1"):
+        service._compose_from_outline("Biology: Osmosis", "beginner")
+
+    service.llm.release.set()
+    service._section_executor.shutdown(wait=True)
+    assert "Write section 3: Part 3" not in service.llm.sections_started
@@ -0,0 +1,179 @@
+import time
+import threading
+
+import pytest
+
+from shared.llm_scheduler import (
+    BACKGROUND,
+    Escalation,
+    INTERACTIVE_GENERATION,
+    INTERACTIVE_GRADING,
+    LLMScheduler,
+    SchedulerTimeoutError,
+    llm_work,
+)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("LLM_TPM_LIMIT", "0")
+    monkeypatch.setenv("LLM_SCHEDULER_MAX_WAIT_SECONDS", "5")
+    monkeypatch.setenv("LLM_SCHEDULER_WEIGHTS", "interactive_grading=8,interactive_generation=4,background=1")
+    return LLMScheduler()
+
+
+def _queued(scheduler):
+    return sum(c["queueDepth"] for c in scheduler.stats()["classes"].values())
+
+
+def _admission_order(scheduler, calls):
+    """
+    Queue `calls` ((label, priority, user, cost), in order) behind a held
+    slot, then release it and return the labels in admission order
+    """
+    order = []
+    threads = []
+
+    def run(label, priority, user, cost):
+        with llm_work(priority, user):
+            with scheduler.admit("lesson", cost):
+                order.append(label)
+
+    with llm_work(INTERACTIVE_GENERATION, "holder"):
+        with scheduler.admit("lesson", 100):
+            for i, call in enumerate(calls):
+                thread = threading.Thread(target=run, args=call)
+                thread.start()
+                threads.append(thread)
+                while _queued(scheduler) < i + 1:
+                    time.sleep(0.005)
+
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_interactive_grading_overtakes_queued_background_work(scheduler):
+    order = _admission_order(scheduler, [
+        ("background", BACKGROUND, "alice", 100),
+        ("grading", INTERACTIVE_GRADING, "bob", 100),
+    ])
+
+    assert order == ["grading", "background"]
+
+
+def test_a_users_backlog_only_delays_their_own_calls(scheduler):
+    order = _admission_order(scheduler, [
+        ("alice-1", BACKGROUND, "alice", 100),
+        ("alice-2", BACKGROUND, "alice", 100),
+        ("alice-3", BACKGROUND, "alice", 100),
+        ("bob-1", BACKGROUND, "bob", 100),
+    ])
+
+    assert order == ["alice-1", "bob-1", "alice-2", "alice-3"]
+
+
+def test_calls_give_up_after_the_max_wait(scheduler):
+    scheduler.max_wait = 0.1
+
+    with scheduler.admit("lesson", 100):
+        with pytest.raises(SchedulerTimeoutError):
+            with scheduler.admit("lesson", 100):
+                pass
+
+    classes = scheduler.stats()["classes"]
+    assert classes[INTERACTIVE_GENERATION]["timedOut"] == 1
+    assert _queued(scheduler) == 0
+
+
+def test_token_bucket_delays_calls_until_it_refills(scheduler):
+    scheduler.max_concurrency = 0
+    scheduler.tpm_limit = 6000  # 100 tokens a second
+    scheduler._tokens = 6000.0
+
+    with scheduler.admit("lesson", 6000):
+        pass
+    started = time.monotonic()
+    with scheduler.admit("lesson", 50):
+        pass
+
+    assert time.monotonic() - started >= 0.4
+
+
+def test_estimates_follow_the_real_output_size(scheduler):
+    assert scheduler.estimate("quiz", 200) == 1200
+    assert scheduler.estimate("quiz", 200, max_output_tokens=300) == 500
+
+    with scheduler.admit("quiz", 1200) as admission:
+        admission.settle(200, 40)
+    assert scheduler.estimate("quiz", 10) == 50
+
+    with scheduler.admit("quiz", 50) as admission:
+        admission.settle(10, 90)
+    assert scheduler.estimate("quiz", 10) == 60
+    assert scheduler.stats()["classes"][INTERACTIVE_GENERATION]["tokens"] == 340
+
+
+def test_grading_tasks_default_to_the_grading_class(scheduler):
+    with scheduler.admit("grade", 10):
+        pass
+
+    assert scheduler.stats()["classes"][INTERACTIVE_GRADING]["admitted"] == 1
+
+
+def test_llm_work_keeps_the_enclosing_class():
+    scheduler = LLMScheduler()
+    with llm_work(BACKGROUND):
+        with llm_work(user_id="alice"):
+            with scheduler.admit("lesson", 10):
+                pass
+
+    assert scheduler.stats()["classes"][BACKGROUND]["admitted"] == 1
+
+    with pytest.raises(ValueError):
+        with llm_work("urgent"):
+            pass
+
+
+def test_escalation_requeues_waiting_calls_in_the_raised_class(scheduler):
+    escalation = Escalation()
+    order = []
+
+    def run(label, escalate_with=None):
+        with llm_work(BACKGROUND, label, escalate_with):
+            with scheduler.admit("lesson", 100):
+                order.append(label)
+
+    with llm_work(INTERACTIVE_GENERATION, "holder"):
+        with scheduler.admit("lesson", 100):
+            threads = [
+                threading.Thread(target=run, args=("bob",)),
+                threading.Thread(target=run, args=("alice", escalation)),
+            ]
+            for i, thread in enumerate(threads):
+                thread.start()
+                while _queued(scheduler) < i + 1:
+                    time.sleep(0.005)
+
+            escalation.raise_to(INTERACTIVE_GENERATION)
+            escalation.raise_to(BACKGROUND)  # never lowered
+            classes = scheduler.stats()["classes"]
+            assert classes[INTERACTIVE_GENERATION]["queueDepth"] == 1
+            assert classes[BACKGROUND]["queueDepth"] == 1
+
+    for thread in threads:
+        thread.join()
+    assert order == ["alice", "bob"]
+    assert escalation.priority == INTERACTIVE_GENERATION
+
+
+def test_calls_made_after_an_escalation_use_the_raised_class(scheduler):
+    escalation = Escalation()
+    escalation.raise_to(INTERACTIVE_GRADING)
+
+    with llm_work(BACKGROUND, "alice", escalation):
+        with scheduler.admit("lesson", 10):
+            pass
+
+    assert scheduler.stats()["classes"][INTERACTIVE_GRADING]["admitted"] == 1
@@ -0,0 +1,97 @@
+import pytest
+
+from shared.llm_telemetry import LLMCall
+from shared.load_shedding import AdaptiveConcurrencyLimiter
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setenv("LOAD_SHED_INITIAL_LIMIT", "10")
+    monkeypatch.setenv("LOAD_SHED_MIN_LIMIT", "4")
+    monkeypatch.setenv("LOAD_SHED_MAX_LIMIT", "20")
+    monkeypatch.setenv("LOAD_SHED_LATENCY_TOLERANCE", "2.0")
+    monkeypatch.setenv("LOAD_SHED_BACKOFF", "0.5")
+    monkeypatch.setenv("LOAD_SHED_DECREASE_INTERVAL_SECONDS", "0")
+    monkeypatch.setenv("LOAD_SHED_MIN_SAMPLES", "3")
+    return AdaptiveConcurrencyLimiter()
+
+
+def _call(wall=1.0, error=None, transient=False, task="lesson"):
+    call = LLMCall(task, "gpt")
+    call.wall = wall
+    call.error = error
+    call.transient = transient
+    return call
+
+
+def _warm_up(limiter, latency=1.0, samples=3):
+    for _ in range(samples):
+        limiter.observe(_call(wall=latency))
+
+
+def test_requests_over_the_limit_are_shed(limiter):
+    admitted = [limiter.try_acquire("/lessons") for _ in range(12)]
+
+    assert admitted.count(True) == 10
+    assert limiter.stats()["shed"] == 2
+    assert limiter.stats()["shedByRoute"] == {"/lessons": 2}
+
+    limiter.release()
+    assert limiter.try_acquire("/lessons")
+
+
+def test_disabled_limiter_admits_everything(limiter):
+    limiter.enabled = False
+
+    assert all(limiter.try_acquire("/lessons") for _ in range(50))
+
+
+def test_slow_call_cuts_the_limit(limiter):
+    _warm_up(limiter)
+    limiter.observe(_call(wall=5.0))
+
+    assert limiter.limit == 5
+    assert limiter.stats()["decreases"] == 1
+
+
+def test_no_decrease_before_the_baseline_has_enough_samples(limiter):
+    limiter.observe(_call(wall=1.0))
+    limiter.observe(_call(wall=10.0))
+
+    assert limiter.limit == 10
+
+
+def test_transient_failure_cuts_the_limit_down_to_the_floor(limiter):
+    for _ in range(5):
+        limiter.observe(_call(error="429", transient=True))
+
+    assert limiter.limit == 4
+
+
+def test_decreases_are_spaced_by_the_interval(limiter):
+    limiter.decrease_interval = 60
+    limiter.observe(_call(error="429", transient=True))
+    limiter.observe(_call(error="429", transient=True))
+
+    assert limiter.limit == 5
+    assert limiter.stats()["decreases"] == 1
+
+
+def test_healthy_calls_grow_the_limit_only_when_it_is_nearly_used(limiter):
+    _warm_up(limiter)
+    limiter.observe(_call(wall=1.0))
+    assert limiter.limit == 10
+
+    for _ in range(8):
+        limiter.try_acquire("/lessons")
+    limiter.observe(_call(wall=1.0))
+
+    assert limiter.limit == pytest.approx(10.1)
+    assert limiter.stats()["increases"] == 1
+
+
+def test_non_transient_errors_leave_the_limit_alone(limiter):
+    _warm_up(limiter)
+    limiter.observe(_call(error="content filter"))
+
+    assert limiter.limit == 10
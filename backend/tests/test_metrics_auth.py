@@ -0,0 +1,33 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import users.auth as auth
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/metrics/loop", dependencies=[Depends(auth.verify_metrics_token)])
+    async def loop_metrics():
+        return {"stalls": 0}
+
+    return TestClient(app)
+
+
+def test_json_views_are_disabled_without_a_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", None)
+
+    assert client.get("/metrics/loop", headers={"Authorization": "Bearer anything"}).status_code == 404
+
+
+def test_json_views_need_the_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "s3cret")
+
+    assert client.get("/metrics/loop").status_code == 401
+    assert client.get("/metrics/loop", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    response = client.get("/metrics/loop", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response.json() == {"stalls": 0}
@@ -0,0 +1,113 @@
+import types
+import threading
+
+import pytest
+
+from lessons.lesson_service import LessonService
+from lessons.pregeneration import PregenerationEngine
+from shared.llm_scheduler import BACKGROUND, INTERACTIVE_GENERATION, LLMScheduler
+from shared.models import Lesson
+
+PLAN = types.SimpleNamespace(id="plan-1", structure=[types.SimpleNamespace(order=1, subtopicId="s1")])
+LESSON_ID = LessonService._deterministic_id("plan-1", "s1")
+
+
+class FakeLessons:
+    """Generates a lesson once `release` is set, making one LLM call through `scheduler`"""
+
+    def __init__(self, cosmos):
+        self.cosmos = cosmos
+        self.scheduler = LLMScheduler()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def get_lesson(self, user_id, lesson_id):
+        return self.cosmos.get_item("Lessons", lesson_id, user_id, Lesson)
+
+    def generate_lesson(self, user_id, lesson_plan_id, subtopic_id, pregenerated=False):
+        self.started.set()
+        self.release.wait(5)
+        with self.scheduler.admit("lesson", 10):
+            pass
+        return self.cosmos.create_item("Lessons", _lesson(pregenerated))
+
+
+class FakeBanks:
+    enabled = True
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.built = threading.Event()
+
+    def build_bank(self, user_id, lesson_id, subtopic_id):
+        self.release.wait(5)
+        self.built.set()
+
+
+def _lesson(pregenerated=True):
+    return Lesson(
+        id=LESSON_ID,
+        userId="u1",
+        lessonPlanId="plan-1",
+        subtopicId="s1",
+        subject="Biology",
+        topic="Cells",
+        subtopic="Osmosis",
+        content={"sections": [{"sectionId": "sec1", "content": "text"}]},
+        pregenerated=pregenerated
+    )
+
+
+@pytest.fixture
+def engine(cosmos, monkeypatch):
+    monkeypatch.setenv("PREGEN_INCLUDE_QUIZ", "true")
+    engine = PregenerationEngine(FakeLessons(cosmos), quizzes=None, question_banks=FakeBanks())
+    yield engine
+    engine.lessons.release.set()
+    engine.question_banks.release.set()
+    engine.shutdown()
+
+
+def _admitted(scheduler, priority):
+    return scheduler.stats()["classes"][priority]["admitted"]
+
+
+def test_joined_job_hands_over_the_lesson_before_its_quiz_and_runs_as_interactive(engine):
+    engine.schedule_next("u1", PLAN)
+    assert engine.lessons.started.wait(5)
+
+    threading.Timer(0.1, engine.lessons.release.set).start()
+    lesson = engine.claim("plan-1", "s1")
+
+    assert lesson is not None and lesson.id == LESSON_ID
+    assert not engine.question_banks.built.is_set()
+    assert _admitted(engine.lessons.scheduler, INTERACTIVE_GENERATION) == 1
+    assert _admitted(engine.lessons.scheduler, BACKGROUND) == 0
+    assert engine.stats()["inflightJoins"] == 1
+
+    engine.question_banks.release.set()
+    assert engine.question_banks.built.wait(5)
+
+
+def test_unclaimed_job_stays_in_the_background_class(engine):
+    engine.lessons.release.set()
+    engine.schedule_next("u1", PLAN)
+    engine.question_banks.release.set()
+
+    assert engine.question_banks.built.wait(5)
+    assert _admitted(engine.lessons.scheduler, BACKGROUND) == 1
+
+
+def test_record_hit_clears_the_flag_without_overwriting_later_writes(engine, cosmos):
+    stale = cosmos.create_item("Lessons", _lesson())
+    expanded = cosmos.get_item("Lessons", LESSON_ID, "u1", Lesson)
+    expanded.content["sections"][0]["expanded"] = "more"
+    cosmos.update_item("Lessons", expanded)
+
+    engine.record_hit(stale)
+    engine.record_hit(_lesson())  # a second, equally stale copy
+
+    stored = cosmos.get_item("Lessons", LESSON_ID, "u1", Lesson)
+    assert stored.pregenerated is False
+    assert stored.content["sections"][0]["expanded"] == "more"
+    assert engine.stats()["hits"] == 1
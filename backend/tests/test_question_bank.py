@@ -0,0 +1,121 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from quizzes.question_bank import QuestionBankService
+from shared.models import Question, QuestionBank
+
+
+def _question(question_id, concept="osmosis", difficulty="medium", type="short_answer", text=None):
+    return Question(
+        questionId=question_id,
+        type=type,
+        question=text or f"Question {question_id}",
+        concept=concept,
+        difficulty=difficulty,
+        maxMarks=2
+    )
+
+
+@pytest.fixture
+def bank_service(cosmos):
+    return QuestionBankService()
+
+
+@pytest.fixture(autouse=True)
+def seeded():
+    random.seed(7)
+
+
+# ==================== _pick ====================
+
+def test_pick_prefers_the_least_served_questions():
+    candidates = [_question(f"b{i}") for i in range(1, 5)]
+    served = {"b1": 2, "b2": 0, "b3": 1}
+
+    picked = QuestionBankService._pick(candidates, served, 2, balance_difficulty=False)
+
+    assert {q.questionId for q in picked} == {"b2", "b4"}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pick_spreads_across_concepts_and_types(seed):
+    random.seed(seed)
+    candidates = (
+        [_question(f"a{i}", concept="osmosis") for i in range(3)]
+        + [_question(f"d{i}", concept="diffusion", type="multiple_choice") for i in range(3)]
+    )
+
+    picked = QuestionBankService._pick(candidates, {}, 2, balance_difficulty=False)
+
+    assert {q.concept for q in picked} == {"osmosis", "diffusion"}
+
+
+def test_pick_balances_difficulty_and_orders_easiest_first():
+    candidates = [
+        _question(f"{level}{i}", difficulty=level)
+        for level in ("hard", "medium", "easy")
+        for i in range(3)
+    ]
+
+    picked = QuestionBankService._pick(candidates, {}, 3, balance_difficulty=True)
+
+    assert [q.difficulty for q in picked] == ["easy", "medium", "hard"]
+
+
+def test_pick_returns_every_candidate_when_short():
+    candidates = [_question("b1", difficulty="hard"), _question("b2", difficulty="easy")]
+
+    picked = QuestionBankService._pick(candidates, {}, 5, balance_difficulty=False)
+
+    assert [q.questionId for q in picked] == ["b2", "b1"]
+
+
+# ==================== _merge ====================
+
+def _bank(*questions):
+    return QuestionBank(
+        id="lesson-1",
+        userId="u1",
+        lessonId="lesson-1",
+        questions=list(questions),
+        createdAt=datetime.now(timezone.utc)
+    )
+
+
+def test_merge_drops_reworded_duplicates_and_numbers_new_questions(bank_service):
+    bank = _bank(_question("b1", text="What is osmosis?"))
+
+    dropped = bank_service._merge(bank, [
+        _question("x1", text="what is OSMOSIS"),
+        _question("x2", text="Explain how diffusion differs from osmosis."),
+    ])
+
+    assert dropped == 1
+    assert [q.questionId for q in bank.questions] == ["b1", "b2"]
+    assert bank.questions[1].question == "Explain how diffusion differs from osmosis."
+
+
+def test_merge_drops_duplicates_within_the_batch_and_blank_questions(bank_service):
+    bank = _bank()
+
+    dropped = bank_service._merge(bank, [
+        _question("x1", text="Name the process that moves water across a membrane"),
+        _question("x2", text="Name the process that moves water across a membrane."),
+        _question("x3", text="?!"),
+    ])
+
+    assert dropped == 2
+    assert [q.questionId for q in bank.questions] == ["b1"]
+
+
+def test_merge_keeps_questions_below_the_overlap_threshold(bank_service):
+    bank = _bank(_question("b1", text="Describe the role of the cell membrane in osmosis"))
+
+    dropped = bank_service._merge(bank, [
+        _question("x1", text="Describe the role of the cell wall in plant cells"),
+    ])
+
+    assert dropped == 0
+    assert len(bank.questions) == 2
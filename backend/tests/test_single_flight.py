@@ -0,0 +1,102 @@
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from shared.models import Lease
+from shared.single_flight import SingleFlight
+
+KEY = "lesson:abc"
+LEASE_ID = hashlib.sha256(KEY.encode()).hexdigest()
+
+
+@pytest.fixture
+def flight(cosmos, monkeypatch):
+    monkeypatch.setenv("SINGLE_FLIGHT_LEASE_SECONDS", "1")
+    monkeypatch.setenv("SINGLE_FLIGHT_POLL_SECONDS", "0.05")
+    return SingleFlight
+
+
+def _lease(owner: str, expires_in: float) -> Lease:
+    return Lease(
+        id=LEASE_ID,
+        userId="u1",
+        key=KEY,
+        owner=owner,
+        expiresAt=datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+        ttl=60
+    )
+
+
+def test_concurrent_callers_share_one_run(flight):
+    sf = flight()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        time.sleep(0.2)
+        return "lesson"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(sf.do(KEY, generate, partition_key="u1")))
+        for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["lesson"] * 3
+
+
+def test_lease_is_released_after_the_run(flight, cosmos):
+    flight().do(KEY, lambda: "lesson", partition_key="u1")
+
+    assert cosmos.get_item("Leases", LEASE_ID, "u1", Lease) is None
+
+
+def test_heartbeat_holds_the_lease_past_its_length(flight):
+    # Two SingleFlight instances stand in for two API workers
+    first, second = flight(), flight()
+    stored = {}
+    calls = []
+
+    def generate():
+        calls.append(1)
+        time.sleep(2.5)  # 2.5 lease lengths
+        stored["lesson"] = "from first"
+        return "from first"
+
+    leader = threading.Thread(target=lambda: first.do(KEY, generate, partition_key="u1"))
+    leader.start()
+    time.sleep(0.2)
+
+    result = second.do(KEY, generate, partition_key="u1", lookup=lambda: stored.get("lesson"))
+    leader.join()
+
+    assert len(calls) == 1
+    assert result == "from first"
+
+
+def test_release_leaves_a_lease_taken_over_by_another_worker(flight, cosmos):
+    def generate():
+        # Our lease lapsed and another worker claimed the key meanwhile
+        cosmos.upsert_item("Leases", _lease("other-worker", 60))
+        return "lesson"
+
+    flight().do(KEY, generate, partition_key="u1")
+
+    lease = cosmos.get_item("Leases", LEASE_ID, "u1", Lease)
+    assert lease is not None
+    assert lease.owner == "other-worker"
+
+
+def test_expired_lease_is_taken_over(flight, cosmos):
+    cosmos.create_item("Leases", _lease("dead-worker", -5))
+
+    assert flight().do(KEY, lambda: "lesson", partition_key="u1") == "lesson"
+    assert cosmos.get_item("Leases", LEASE_ID, "u1", Lease) is None
@@ -0,0 +1,101 @@
+import pytest
+
+from quizzes.quiz_service import TieredGrader
+from shared.models import Question
+
+
+@pytest.fixture
+def grader():
+    return TieredGrader()
+
+
+def _question(**overrides):
+    fields = {
+        "questionId": "q1",
+        "type": "short_answer",
+        "question": "What is photosynthesis?",
+        "correctAnswer": "Light energy to chemical energy",
+        "markScheme": [
+            "Plants convert light energy into chemical energy",
+            "Uses carbon dioxide and water to make glucose",
+        ],
+        "maxMarks": 4,
+    }
+    fields.update(overrides)
+    return Question(**fields)
+
+
+def test_exact_match_ignores_case_and_punctuation(grader):
+    tier, grading = grader.decide(_question(), "light energy, to CHEMICAL energy!", 4)
+
+    assert tier == "exact_match"
+    assert grading.marksAwarded == 4
+
+
+@pytest.mark.parametrize("answer", [None, "", "   ", "ok"])
+def test_blank_answers_score_zero(grader, answer):
+    tier, grading = grader.decide(_question(), answer, 4)
+
+    assert tier == "blank"
+    assert grading.marksAwarded == 0
+
+
+def test_copied_question_scores_zero(grader):
+    tier, grading = grader.decide(_question(), "What is photosynthesis", 4)
+
+    assert tier == "copied_question"
+    assert grading.marksAwarded == 0
+
+
+def test_too_short_gets_one_mark_only_with_a_keyword(grader):
+    tier, grading = grader.decide(_question(), "glucose", 4)
+    assert (tier, grading.marksAwarded) == ("too_short", 1)
+
+    tier, grading = grader.decide(_question(), "bananas", 4)
+    assert (tier, grading.marksAwarded) == ("too_short", 0)
+
+
+def test_short_answers_are_not_too_short_on_low_mark_questions(grader):
+    tier, grading = grader.decide(_question(maxMarks=2), "glucose made", 2)
+
+    assert tier == "llm"
+    assert grading is None
+
+
+def test_no_keywords_is_a_hint_and_goes_to_the_llm(grader):
+    answer = "it is a thing that happens in the garden"
+
+    tier, grading = grader.decide(_question(), answer, 4)
+
+    assert (tier, grading) == ("llm", None)
+    assert TieredGrader.hints(_question(), answer, 4) == ["no_keywords"]
+    assert grader.stats()["hints"] == {"no_keywords": 1}
+
+
+def test_answer_covering_the_scheme_goes_to_the_llm_without_hints(grader):
+    answer = "Plants use light to turn carbon dioxide and water into glucose"
+
+    assert grader.decide(_question(), answer, 4) == ("llm", None)
+    assert TieredGrader.hints(_question(), answer, 4) == []
+    assert grader.stats()["hints"] == {"no_keywords": 0}
+
+
+def test_stats_report_counts_and_rates(grader):
+    for tier in ("blank", "llm", "llm", "exact_match"):
+        grader.record(tier)
+
+    stats = grader.stats()
+    assert stats["total"] == 4
+    assert stats["counts"]["llm"] == 2
+    assert stats["rates"]["llm"] == 0.5
+    assert stats["rates"]["too_short"] == 0.0
+
+
+def test_answers_reusing_the_questions_terms_go_to_the_llm(grader):
+    question = _question(question="What does the mitochondria produce in the cell?", correctAnswer=None)
+
+    assert grader.decide(question, "the mitochondria produce energy in the cell", 4) == ("llm", None)
+    assert grader.decide(question, "in the cell", 4) == ("llm", None)
+
+    tier, _ = grader.decide(question, "What does the mitochondria produce in the cell", 4)
+    assert tier == "copied_question"
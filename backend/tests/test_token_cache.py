@@ -0,0 +1,85 @@
+import types
+
+import pytest
+
+import users.token_cache as token_cache
+from users.token_cache import TokenRejected, VerifiedTokenCache
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=NOW)
+    monkeypatch.setattr(token_cache, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def cache(clock, monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN_CACHE_SIZE", "2")
+    monkeypatch.setenv("AUTH_TOKEN_CACHE_EXPIRY_MARGIN_SECONDS", "30")
+    monkeypatch.setenv("AUTH_TOKEN_NEGATIVE_TTL_SECONDS", "60")
+    return VerifiedTokenCache()
+
+
+def test_claims_are_served_until_the_margin_before_exp(cache, clock):
+    claims = {"oid": "u1", "exp": NOW + 100}
+    cache.put("token", claims)
+
+    clock.now = NOW + 69
+    assert cache.get("token") == claims
+
+    clock.now = NOW + 70
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_tokens_expiring_within_the_margin_are_not_cached(cache):
+    cache.put("token", {"exp": NOW + 30})
+    cache.put("no-exp", {"oid": "u1"})
+
+    assert cache.get("token") is None
+    assert cache.get("no-exp") is None
+
+
+def test_rejections_are_raised_until_the_negative_ttl_ends(cache, clock):
+    cache.reject("bad", 401, "Token expired")
+
+    clock.now = NOW + 59
+    with pytest.raises(TokenRejected) as rejected:
+        cache.get("bad")
+    assert (rejected.value.status_code, rejected.value.detail) == (401, "Token expired")
+
+    clock.now = NOW + 60
+    assert cache.get("bad") is None
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    cache.put("a", {"exp": NOW + 100})
+    cache.put("b", {"exp": NOW + 100})
+    cache.get("a")
+    cache.put("c", {"exp": NOW + 100})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_only_the_token_hash_is_stored(cache):
+    cache.put("secret-token", {"exp": NOW + 100})
+
+    assert "secret-token" not in cache._entries
+
+
+def test_stats_count_hits_and_misses(cache):
+    cache.put("a", {"exp": NOW + 100})
+    cache.reject("bad", 401, "Invalid token")
+    cache.get("a")
+    cache.get("missing")
+    with pytest.raises(TokenRejected):
+        cache.get("bad")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["negativeHits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hitRate"] == pytest.approx(2 / 3)
@@ -0,0 +1,35 @@
+"""
+Tokenizer Cache
+Downloads the tiktoken encoding into TIKTOKEN_CACHE_DIR so token counting
+works without network access at runtime
+
+Usage (from backend/, at build time or once per machine):
+    python -m tools.cache_tokenizer
+    TIKTOKEN_CACHE_DIR=/opt/tiktoken python -m tools.cache_tokenizer --encoding o200k_base
+
+Without TIKTOKEN_CACHE_DIR the file goes to backend/.tiktoken, where the
+API looks for it by default. Set the same TIKTOKEN_CACHE_DIR (and
+TOKENIZER_ENCODING) for the API as for this command.
+"""
+import os
+import argparse
+
+from shared.tokens import DEFAULT_CACHE_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-cache the tiktoken encoding for offline use")
+    parser.add_argument("--encoding", default=os.getenv("TOKENIZER_ENCODING", "o200k_base"))
+    args = parser.parse_args()
+
+    cache_dir = os.getenv("TIKTOKEN_CACHE_DIR") or DEFAULT_CACHE_DIR
+    os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+
+    import tiktoken
+    encoding = tiktoken.get_encoding(args.encoding)
+    print(f"Cached {args.encoding} ({encoding.n_vocab} tokens) in {cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Grading Tier Evaluation
+Compares local TieredGrader decisions with recorded LLM grades
+
+Usage (from backend/):
+    python -m tools.grading_eval --input recorded.jsonl
+    python -m tools.grading_eval --user-id alice123 --export recorded.jsonl
+
+Each JSONL record needs `question`, `markScheme`, `maxMarks`, `userAnswer`
+and `llmMarksAwarded`; `type` and `correctAnswer` are optional. Records can
+be exported from Cosmos with --user-id, which joins LLM-graded responses in
+QuizAttempts with their Quizzes questions; responses the LLM failed to
+grade are skipped, since their 0 marks are not a grade. Hint rules (see
+TieredGrader) are reported against the LLM grades of the answers they
+fire on.
+"""
+import argparse
+import json
+from typing import Any, Dict, List
+
+from quizzes.quiz_service import TieredGrader, GRADING_FALLBACK_FEEDBACK
+from shared.models import Question
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def export_records(user_id: str) -> List[Dict[str, Any]]:
+    """Collect LLM-graded written responses for a user from Cosmos"""
+    from quizzes.quiz_service import QuizService
+
+    quizzes = QuizService()
+    records = []
+    quiz_cache: Dict[str, Any] = {}
+
+    for attempt in quizzes.get_quiz_attempts(user_id):
+        if attempt.quizId not in quiz_cache:
+            quiz_cache[attempt.quizId] = quizzes.get_quiz(user_id, attempt.quizId)
+        quiz = quiz_cache[attempt.quizId]
+        if not quiz:
+            continue
+        questions = {q.questionId: q for q in quiz.questions}
+
+        for resp in attempt.responses:
+            question = questions.get(resp.questionId)
+            if not question or question.type == "multiple_choice":
+                continue
+            if resp.gradingTier not in (None, "llm") or resp.marksAwarded is None:
+                continue
+            if resp.feedback == GRADING_FALLBACK_FEEDBACK:
+                continue
+            records.append({
+                "question": question.question,
+                "type": question.type,
+                "correctAnswer": question.correctAnswer,
+                "markScheme": question.markScheme or [],
+                "maxMarks": resp.maxMarks,
+                "userAnswer": resp.userAnswer,
+                "llmMarksAwarded": resp.marksAwarded,
+            })
+
+    return records
+
+
+def evaluate(records: List[Dict[str, Any]], tolerance: float = 0.5) -> Dict[str, Any]:
+    """Run every record through the tiers and compare with the LLM grade"""
+    grader = TieredGrader()
+    per_tier: Dict[str, Dict[str, float]] = {}
+    per_hint: Dict[str, Dict[str, int]] = {}
+
+    for i, rec in enumerate(records):
+        question = Question(
+            questionId=f"r{i}",
+            type=rec.get("type") or "short_answer",
+            question=rec.get("question", ""),
+            correctAnswer=rec.get("correctAnswer"),
+            markScheme=rec.get("markScheme") or [],
+            maxMarks=rec.get("maxMarks"),
+        )
+        max_marks = float(rec.get("maxMarks") or len(question.markScheme or []) or 1)
+        tier, grading = grader.decide(question, rec.get("userAnswer"), max_marks)
+        grader.record(tier)
+
+        row = per_tier.setdefault(tier, {"decided": 0, "agree": 0, "absError": 0.0, "over": 0, "under": 0})
+        row["decided"] += 1
+        if grading is None:
+            # A hint suggests 0 marks; it agrees when the LLM awarded (nearly) none
+            for hint in grader.hints(question, rec.get("userAnswer"), max_marks):
+                counts = per_hint.setdefault(hint, {"fired": 0, "agree": 0})
+                counts["fired"] += 1
+                counts["agree"] += 1 if float(rec["llmMarksAwarded"]) <= tolerance else 0
+            continue
+
+        diff = grading.marksAwarded - float(rec["llmMarksAwarded"])
+        row["absError"] += abs(diff)
+        if abs(diff) <= tolerance:
+            row["agree"] += 1
+        elif diff > 0:
+            row["over"] += 1
+        else:
+            row["under"] += 1
+
+    total = len(records)
+    local = sum(r["decided"] for t, r in per_tier.items() if t != "llm")
+    return {
+        "records": total,
+        "decidedLocally": local,
+        "localRate": local / total if total else 0.0,
+        "tiers": {
+            tier: {
+                "decided": int(r["decided"]),
+                "share": r["decided"] / total if total else 0.0,
+                "agreement": (r["agree"] / r["decided"]) if tier != "llm" and r["decided"] else None,
+                "meanAbsError": (r["absError"] / r["decided"]) if tier != "llm" and r["decided"] else None,
+                "overAwarded": int(r["over"]),
+                "underAwarded": int(r["under"]),
+            }
+            for tier, r in sorted(per_tier.items())
+        },
+        "hints": {
+            hint: {
+                "fired": r["fired"],
+                "agreement": r["agree"] / r["fired"],
+            }
+            for hint, r in sorted(per_hint.items())
+        },
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Records: {report['records']}  decided locally: {report['decidedLocally']} "
+          f"({report['localRate']:.1%})")
+    print(f"{'tier':<16}{'decided':>8}{'share':>8}{'agree':>8}{'MAE':>8}{'over':>6}{'under':>7}")
+    for tier, r in report["tiers"].items():
+        agree = f"{r['agreement']:.1%}" if r["agreement"] is not None else "-"
+        mae = f"{r['meanAbsError']:.2f}" if r["meanAbsError"] is not None else "-"
+        print(f"{tier:<16}{r['decided']:>8}{r['share']:>8.1%}{agree:>8}{mae:>8}"
+              f"{r['overAwarded']:>6}{r['underAwarded']:>7}")
+    for hint, r in report["hints"].items():
+        print(f"hint {hint}: fired on {r['fired']} LLM-graded answers, "
+              f"LLM also awarded 0 on {r['agreement']:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare local grading tiers with recorded LLM grades")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="JSONL file of recorded gradings")
+    source.add_argument("--user-id", help="Pull LLM-graded responses for this user from Cosmos")
+    parser.add_argument("--export", help="Write the evaluated records to this JSONL file")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Max mark difference counted as agreement (default 0.5)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    records = load_records(args.input) if args.input else export_records(args.user_id)
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec) + "\n")
+
+    report = evaluate(records, tolerance=args.tolerance)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
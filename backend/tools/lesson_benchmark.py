@@ -0,0 +1,121 @@
+"""
+Lesson Generation Benchmark
+Compares end-to-end latency and token usage of single-call and
+outline-then-sections lesson generation
+
+Usage (from backend/):
+    python -m tools.lesson_benchmark --runs 5
+    python -m tools.lesson_benchmark --subject Biology --topic "Cell Biology" \
+        --subtopic "Osmosis" --concepts "diffusion,partially permeable membranes" --runs 3
+
+Lessons are generated with the configured LLM gateway (set LLM_BASE_URL to
+benchmark against tools/llm_standin.py) and are not stored. Runs alternate
+between modes so drifting endpoint latency affects both equally.
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+from lessons.lesson_service import LessonService
+from shared.llm_telemetry import get_llm_telemetry
+from shared.models import LessonPlanItem
+
+MODES = ("single", "outline")
+
+
+def token_totals() -> Tuple[int, int, int]:
+    """Prompt, completion and LLM call totals recorded so far"""
+    tasks = get_llm_telemetry().snapshot()["tasks"]
+    return (
+        sum(t["promptTokens"] for t in tasks),
+        sum(t["completionTokens"] for t in tasks),
+        sum(t["calls"] for t in tasks),
+    )
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def run(service: LessonService, item: LessonPlanItem, args: argparse.Namespace) -> Dict[str, Any]:
+    samples: Dict[str, List[Dict[str, Any]]] = {mode: [] for mode in MODES}
+
+    for i in range(args.runs):
+        for mode in MODES if i % 2 == 0 else reversed(MODES):
+            before = token_totals()
+            started = time.perf_counter()
+            content, prompt_tag = service.compose_lesson_content(
+                args.subject, args.topic, item, level=args.level, mode=mode
+            )
+            wall = time.perf_counter() - started
+            after = token_totals()
+            samples[mode].append({
+                "seconds": wall,
+                "promptTokens": after[0] - before[0],
+                "completionTokens": after[1] - before[1],
+                "calls": after[2] - before[2],
+                "sections": len(content.sections),
+                # A failed outline falls back to a single call
+                "fellBack": mode == "outline" and "+" not in prompt_tag,
+            })
+
+    report = {}
+    for mode, rows in samples.items():
+        seconds = [r["seconds"] for r in rows]
+        report[mode] = {
+            "runs": len(rows),
+            "meanSeconds": sum(seconds) / len(rows),
+            "p50Seconds": percentile(seconds, 0.5),
+            "p95Seconds": percentile(seconds, 0.95),
+            "meanPromptTokens": sum(r["promptTokens"] for r in rows) / len(rows),
+            "meanCompletionTokens": sum(r["completionTokens"] for r in rows) / len(rows),
+            "meanCalls": sum(r["calls"] for r in rows) / len(rows),
+            "meanSections": sum(r["sections"] for r in rows) / len(rows),
+            "fallbacks": sum(r["fellBack"] for r in rows),
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'mode':<10}{'runs':>5}{'mean s':>9}{'p50 s':>8}{'p95 s':>8}"
+          f"{'prompt tok':>12}{'output tok':>12}{'calls':>7}{'sections':>10}{'fallbacks':>11}")
+    for mode, r in report.items():
+        print(f"{mode:<10}{r['runs']:>5}{r['meanSeconds']:>9.2f}{r['p50Seconds']:>8.2f}{r['p95Seconds']:>8.2f}"
+              f"{r['meanPromptTokens']:>12.0f}{r['meanCompletionTokens']:>12.0f}{r['meanCalls']:>7.1f}"
+              f"{r['meanSections']:>10.1f}{r['fallbacks']:>11}")
+    single, outline = report.get("single"), report.get("outline")
+    if single and outline and single["meanSeconds"]:
+        print(f"Outline mode latency: {outline['meanSeconds'] / single['meanSeconds']:.0%} of single-call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-call vs outline-then-sections lesson generation")
+    parser.add_argument("--subject", default="Mathematics")
+    parser.add_argument("--topic", default="Algebra")
+    parser.add_argument("--subtopic", default="Expanding and factorising brackets")
+    parser.add_argument("--concepts", default="expanding single brackets,expanding double brackets,common factors",
+                        help="Comma-separated key concepts")
+    parser.add_argument("--duration", type=int, default=30, help="Lesson length in minutes")
+    parser.add_argument("--level", default="GCSE")
+    parser.add_argument("--runs", type=int, default=3, help="Lessons generated per mode")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    item = LessonPlanItem(
+        subtopicId="benchmark",
+        title=args.subtopic,
+        order=1,
+        estimatedDuration=args.duration,
+        concepts=[c.strip() for c in args.concepts.split(",") if c.strip()]
+    )
+    report = run(LessonService(), item, args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+LLM Stand-in Server
+OpenAI-compatible chat completions endpoint that replays recorded responses
+or synthesizes schema-valid ones, for load tests without real tokens
+
+Usage (from backend/):
+    python -m tools.llm_standin --mode synth --port 8100
+    python -m tools.llm_standin --mode replay --cassette cassettes/llm.jsonl
+    python -m tools.llm_standin --mode record --cassette cassettes/llm.jsonl
+
+Then point the API at it:
+    LLM_BASE_URL=http://localhost:8100/openai/v1/ uvicorn api:app
+
+Modes:
+    synth   Generate responses from the request's JSON schema (structured
+            calls) or filler Markdown (plain and streamed calls)
+    replay  Serve responses recorded in the cassette, keyed by deployment,
+            messages and schema; misses fall back to synth
+    record  Forward to AZURE_OPENAI_ENDPOINT and append each exchange to
+            the cassette
+
+Latency is modelled as a log-normal time to first token (--ttft-p50,
+--ttft-p99) plus completion tokens at --tokens-per-second; with --latency
+recorded, replay uses the upstream timings captured in the cassette.
+--error-rate and --throttle-rate inject 500s and 429s. --tpm and --rpm
+enforce a per-minute quota like an Azure deployment's: responses carry
+x-ratelimit-remaining-tokens/-requests headers, and requests over quota get
+429 with retry-after-ms. Prompt caching is approximated: a system message
+seen before counts as cached prefix tokens.
+
+To try the gateway's endpoint pool locally, run several stand-ins on
+different ports with different quotas and list them in LLM_ENDPOINTS:
+    python -m tools.llm_standin --port 8101 --tpm 20000
+    python -m tools.llm_standin --port 8102 --tpm 60000
+    LLM_ENDPOINTS='[{"name": "a", "baseUrl": "http://localhost:8101/openai/v1/"},
+                    {"name": "b", "baseUrl": "http://localhost:8102/openai/v1/"}]' uvicorn api:app
+"""
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from shared.tokens import count_message_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+_WORDS = (
+    "energy particle force reaction cell equation graph variable function evidence "
+    "pressure structure process model system value change rate pattern example "
+    "concept theory result method analysis measure factor element compound surface"
+).split()
+
+
+class Profile:
+    """Latency, token-rate and fault-injection settings"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.ttft_p50 = args.ttft_p50
+        self.ttft_p99 = args.ttft_p99
+        self.tokens_per_second = args.tokens_per_second
+        self.error_rate = args.error_rate
+        self.throttle_rate = args.throttle_rate
+        self.completion_tokens = args.completion_tokens
+        self.use_recorded = args.latency == "recorded"
+        self.rng = random.Random(args.seed)
+
+    def ttft(self) -> float:
+        # Log-normal with the given median and 99th percentile (z = 2.326)
+        if self.ttft_p99 <= self.ttft_p50 or self.ttft_p50 <= 0:
+            return max(self.ttft_p50, 0.0)
+        sigma = math.log(self.ttft_p99 / self.ttft_p50) / 2.326
+        return self.rng.lognormvariate(math.log(self.ttft_p50), sigma)
+
+    def fault(self) -> Optional[int]:
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+
+class Quota:
+    """Per-minute token and request buckets, refilled continuously"""
+
+    def __init__(self, tpm: int, rpm: int):
+        self.limits = {"tokens": tpm, "requests": rpm}
+        self.available = {"tokens": float(tpm), "requests": float(rpm)}
+        self.refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        for kind, limit in self.limits.items():
+            self.available[kind] = min(float(limit), self.available[kind] + (now - self.refilled_at) * limit / 60)
+        self.refilled_at = now
+
+    def take(self, tokens: int) -> Optional[float]:
+        """Charge a request; returns seconds to wait instead if the quota is short"""
+        with self._lock:
+            self._refill()
+            wait = 0.0
+            for kind, cost in (("tokens", tokens), ("requests", 1)):
+                limit = self.limits[kind]
+                if limit > 0 and self.available[kind] < min(cost, limit):
+                    wait = max(wait, (min(cost, limit) - self.available[kind]) * 60 / limit)
+            if wait:
+                return wait
+            self.available["tokens"] -= tokens
+            self.available["requests"] -= 1
+            return None
+
+    def refund(self, tokens: int) -> None:
+        with self._lock:
+            self.available["tokens"] += tokens
+
+    def headers(self) -> Dict[str, str]:
+        with self._lock:
+            self._refill()
+            return {
+                f"x-ratelimit-remaining-{kind}": str(max(int(self.available[kind]), 0))
+                for kind, limit in self.limits.items() if limit > 0
+            }
+
+
+class Cassette:
+    """Append-only JSONL store of recorded exchanges"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+            logger.info(f"Loaded {len(self.entries)} recorded responses from {path}")
+
+    @staticmethod
+    def key(body: Dict[str, Any]) -> str:
+        schema = ((body.get("response_format") or {}).get("json_schema") or {}).get("name")
+        raw = json.dumps(
+            {"model": body.get("model"), "messages": body.get("messages"), "schema": schema},
+            sort_keys=True
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self.entries.get(self.key(body))
+
+    def add(self, body: Dict[str, Any], response: Dict[str, Any], latency: float) -> None:
+        entry = {
+            "key": self.key(body),
+            "request": {k: body.get(k) for k in ("model", "messages", "response_format")},
+            "response": response,
+            "latencySeconds": latency,
+        }
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+
+# ==================== SYNTHESIS ====================
+
+class Synthesizer:
+    """Builds plausible, schema-valid content for a request"""
+
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.rng = profile.rng
+
+    def words(self, n: int) -> str:
+        return " ".join(self.rng.choice(_WORDS) for _ in range(max(n, 1)))
+
+    def markdown(self, tokens: int) -> str:
+        paragraphs = []
+        remaining = tokens
+        while remaining > 0:
+            n = min(remaining, 60)
+            paragraphs.append(f"## {self.words(3).title()}\n\n{self.words(n).capitalize()}.")
+            remaining -= n + 5
+        return "\n\n".join(paragraphs)
+
+    def structured(self, schema: Dict[str, Any], prompt: str) -> Dict[str, Any]:
+        context = {
+            "question_count": _find_int(r"Create (\d+) questions", prompt, 5),
+            "question_ids": re.findall(r"^### (\S+)", prompt, re.MULTILINE),
+            "max_marks": _find_float(r"Mark Scheme \((\d+(?:\.\d+)?) marks total\)", prompt, 3.0),
+        }
+        return self._value(schema, schema.get("$defs", {}), context, None)
+
+    def _value(self, schema: Dict[str, Any], defs: Dict[str, Any], ctx: Dict[str, Any], name: Optional[str]) -> Any:
+        if "$ref" in schema:
+            return self._value(defs[schema["$ref"].split("/")[-1]], defs, ctx, name)
+        if "anyOf" in schema:
+            options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+            return self._value(options[0], defs, ctx, name) if options else None
+
+        kind = schema.get("type")
+        if kind == "object":
+            obj = {
+                prop: self._value(sub, defs, ctx, prop)
+                for prop, sub in schema.get("properties", {}).items()
+            }
+            return self._fixup(schema.get("title"), obj, ctx)
+        if kind == "array":
+            if name == "questions":
+                count = ctx["question_count"]
+            elif name == "grades":
+                count = len(ctx["question_ids"])
+            else:
+                count = self.rng.randint(2, 4)
+            return [self._value(schema.get("items", {}), defs, ctx, name) for _ in range(count)]
+        if kind == "string":
+            long_fields = {"content", "introduction", "summary", "feedback", "description", "overview"}
+            return self.words(120 if name in long_fields else 6).capitalize()
+        if kind == "integer":
+            return self.rng.choice([20, 30, 40])
+        if kind == "number":
+            return float(self.rng.randint(1, 3))
+        if kind == "boolean":
+            return self.rng.random() < 0.5
+        return None
+
+    def _fixup(self, title: Optional[str], obj: Dict[str, Any], ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """Make fields that depend on each other consistent"""
+        if title == "QuestionLLM":
+            obj["type"] = self.rng.choice(["multiple_choice", "short_answer", "long_answer"])
+            obj["difficulty"] = self.rng.choice(["easy", "medium", "hard"])
+            if obj["type"] == "multiple_choice":
+                obj["options"] = [self.words(3) for _ in range(4)]
+                obj["correctAnswer"] = self.rng.choice(obj["options"])
+                obj["markScheme"] = None
+                obj["maxMarks"] = 1.0
+            else:
+                points = 2 if obj["type"] == "short_answer" else 4
+                obj["options"] = None
+                obj["correctAnswer"] = None
+                obj["markScheme"] = [f"Award 1 mark for {self.words(5)}" for _ in range(points)]
+                obj["maxMarks"] = float(points)
+        elif title == "QuestionGradeLLM" and ctx["question_ids"]:
+            obj["questionId"] = ctx["question_ids"].pop(0)
+            obj["marksAwarded"] = float(self.rng.randint(0, 2))
+        elif title == "QuizGradingLLM":
+            obj["maxMarks"] = ctx["max_marks"]
+            obj["marksAwarded"] = float(self.rng.randint(0, int(ctx["max_marks"])))
+            obj["generatedAnswer"] = None
+        return obj
+
+
+def _find_int(pattern: str, text: str, default: int) -> int:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+
+def _find_float(pattern: str, text: str, default: float) -> float:
+    match = re.search(pattern, text)
+    return float(match.group(1)) if match else default
+
+
+# ==================== SERVER ====================
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    profile = Profile(args)
+    cassette = Cassette(args.cassette)
+    synth = Synthesizer(profile)
+    quota = Quota(args.tpm, args.rpm)
+    seen_prefixes: set = set()
+    upstream = os.getenv("AZURE_OPENAI_ENDPOINT", "").rstrip("/")
+    api_key = os.getenv("AZURE_OPENAI_KEY", "")
+    stats = {"requests": 0, "replayed": 0, "synthesized": 0, "recorded": 0, "faults": 0, "throttled": 0}
+
+    app = FastAPI(title="LLM Stand-in")
+
+    def usage(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+        messages = body.get("messages") or []
+        prompt_tokens = count_message_tokens(messages)
+        cached = 0
+        system = next((m.get("content") for m in messages if m.get("role") == "system"), None)
+        if system:
+            prefix = hashlib.sha256(system.encode()).hexdigest()
+            if prefix in seen_prefixes:
+                cached = count_tokens(system)
+            seen_prefixes.add(prefix)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": count_tokens(content),
+            "total_tokens": prompt_tokens + count_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def completion_body(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop",
+            }],
+            "usage": usage(body, content),
+        }
+
+    async def record(body: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+        upstream_body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=300) as client:
+            resp = await client.post(
+                f"{upstream}/openai/v1/chat/completions",
+                json=upstream_body,
+                headers={"api-key": api_key, "Authorization": f"Bearer {api_key}"},
+            )
+        latency = time.perf_counter() - started
+        resp.raise_for_status()
+        data = resp.json()
+        cassette.add(body, data, latency)
+        stats["recorded"] += 1
+        return data, latency
+
+    def synthesize(body: Dict[str, Any]) -> str:
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages") or [])
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            return json.dumps(synth.structured(response_format["json_schema"]["schema"], prompt))
+        return synth.markdown(profile.completion_tokens)
+
+    async def stream_chunks(body: Dict[str, Any], content: str, ttft: float, per_token: float) -> AsyncIterator[bytes]:
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        base = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model")}
+        await asyncio.sleep(ttft)
+        pieces = re.findall(r"\S+\s*|\s+", content)
+        for piece in pieces:
+            delta = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(delta)}\n\n".encode()
+            await asyncio.sleep(per_token)
+        done = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n".encode()
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage(body, content)})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    @app.post("/openai/v1/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+
+        fault = profile.fault()
+        if fault:
+            stats["faults"] += 1
+            await asyncio.sleep(profile.ttft() / 4)
+            message = "Rate limit exceeded" if fault == 429 else "Injected server error"
+            headers = {"retry-after": "1"} if fault == 429 else {}
+            return JSONResponse({"error": {"message": message, "code": str(fault)}}, status_code=fault, headers=headers)
+
+        # Charged up front like Azure: the prompt plus the most it may generate
+        max_output = body.get("max_completion_tokens") or body.get("max_tokens") or profile.completion_tokens
+        charged = count_message_tokens(body.get("messages") or []) + max_output
+        wait = quota.take(charged)
+        if wait is not None:
+            stats["throttled"] += 1
+            return JSONResponse(
+                {"error": {"message": "Requests to this deployment have exceeded the token rate limit", "code": "429"}},
+                status_code=429,
+                headers={**quota.headers(), "retry-after-ms": str(int(wait * 1000) + 1), "retry-after": str(math.ceil(wait))}
+            )
+
+        recorded_latency = None
+        if args.mode == "record":
+            data, _ = await record(body)
+            if not body.get("stream"):
+                return JSONResponse(data, headers=quota.headers())
+            content = data["choices"][0]["message"]["content"] or ""
+            ttft, per_token = 0.0, 0.0
+        else:
+            entry = cassette.get(body) if args.mode == "replay" else None
+            if entry:
+                stats["replayed"] += 1
+                content = entry["response"]["choices"][0]["message"]["content"] or ""
+                recorded_latency = entry.get("latencySeconds")
+            else:
+                stats["synthesized"] += 1
+                content = synthesize(body)
+
+            completion_tokens = count_tokens(content)
+            if profile.use_recorded and recorded_latency is not None:
+                ttft = recorded_latency * 0.2
+                per_token = recorded_latency * 0.8 / max(completion_tokens, 1)
+            else:
+                ttft = profile.ttft()
+                per_token = 1.0 / profile.tokens_per_second if profile.tokens_per_second > 0 else 0.0
+
+        # Settle the charge against what was actually generated
+        quota.refund(max_output - count_tokens(content))
+        if body.get("stream"):
+            # Chunks are roughly one word each; scale the delay to the word count
+            words = max(len(content.split()), 1)
+            per_chunk = per_token * count_tokens(content) / words
+            return StreamingResponse(
+                stream_chunks(body, content, ttft, per_chunk), media_type="text/event-stream", headers=quota.headers()
+            )
+
+        await asyncio.sleep(ttft + per_token * count_tokens(content))
+        return JSONResponse(completion_body(body, content), headers=quota.headers())
+
+    @app.get("/stats")
+    async def standin_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in for offline benchmarking")
+    parser.add_argument("--mode", choices=["synth", "replay", "record"], default="synth")
+    parser.add_argument("--cassette", help="JSONL cassette to replay from or record into")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft-p50", type=float, default=0.8, help="Median time to first token (s)")
+    parser.add_argument("--ttft-p99", type=float, default=6.0, help="99th percentile time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="Completion token rate")
+    parser.add_argument("--completion-tokens", type=int, default=400,
+                        help="Length of synthesized plain-text completions")
+    parser.add_argument("--latency", choices=["profile", "recorded"], default="profile",
+                        help="Use the profile, or upstream timings stored in the cassette when replaying")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens-per-minute quota (0: unlimited)")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests-per-minute quota (0: unlimited)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.mode != "synth" and not args.cassette:
+        parser.error(f"--cassette is required in {args.mode} mode")
+
+    import uvicorn
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(args), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
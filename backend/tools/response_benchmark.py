@@ -0,0 +1,161 @@
+"""
+Response Serialization Benchmark
+Compares serialization CPU and bytes on the wire for a lesson response with
+the stdlib JSON encoder and with orjson, uncompressed, gzip and brotli
+
+Usage (from backend/):
+    python -m tools.response_benchmark
+    python -m tools.response_benchmark --sections 8 --expanded-words 1200 --runs 500
+    python -m tools.response_benchmark --lesson lesson.json
+
+--lesson takes a lesson document as stored in Cosmos (e.g. exported from the
+Data Explorer); otherwise a lesson with the given shape is synthesized.
+Timings cover what happens per request after the handler returns: response
+model validation and serialization by FastAPI, then rendering the body.
+"""
+import json
+import time
+import random
+import argparse
+from typing import Any, Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_model_field
+
+from shared.http_responses import CompressionMiddleware, FastJSONResponse, brotli
+from shared.models import LessonResponse
+
+_WORDS = (
+    "energy particle force reaction cell equation graph variable function evidence "
+    "pressure structure process model system value change rate pattern example"
+).split()
+
+
+def synthetic_lesson(sections: int, content_words: int, expanded_words: int) -> Dict[str, Any]:
+    rng = random.Random(7)
+
+    def text(n: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+    return {
+        "id": "benchmark",
+        "subject": "Physics",
+        "topic": "Forces",
+        "subtopic": "Newton's laws",
+        "status": "active",
+        "content": {
+            "introduction": text(150),
+            "sections": [
+                {
+                    "sectionId": f"section-{i + 1}",
+                    "title": text(4),
+                    "content": f"## {text(3)}\n\n{text(content_words)}",
+                    "keyPoints": [text(10) for _ in range(4)],
+                    "examples": [text(40) for _ in range(2)],
+                    "expanded": f"## {text(3)}\n\n{text(expanded_words)}" if expanded_words else None,
+                }
+                for i in range(sections)
+            ],
+            "summary": text(100),
+            "keyTerms": [rng.choice(_WORDS) for _ in range(12)],
+        },
+    }
+
+
+def lesson_response(lesson: Dict[str, Any]) -> LessonResponse:
+    content = lesson.get("content") or {}
+    return LessonResponse(
+        lesson_id=lesson["id"],
+        subject=lesson["subject"],
+        topic=lesson["topic"],
+        subtopic=lesson["subtopic"],
+        introduction=content.get("introduction") or "",
+        sections=content.get("sections") or [],
+        summary=content.get("summary") or "",
+        key_terms=content.get("keyTerms") or [],
+        status=lesson.get("status", "active"),
+    )
+
+
+def time_per_call(fn: Callable[[], Any], runs: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started) / runs
+
+
+def run(response: LessonResponse, runs: int) -> Dict[str, Any]:
+    field = create_model_field(name="LessonResponse", type_=LessonResponse, mode="serialization")
+
+    def serialize() -> Any:
+        # What fastapi.routing.serialize_response does for an async endpoint
+        value, _ = field.validate(response, {}, loc=("response",))
+        return field.serialize(value)
+
+    content = serialize()
+    serialize_seconds = time_per_call(serialize, runs)
+
+    renderers = {"stdlib": JSONResponse, "orjson": FastJSONResponse}
+    report: Dict[str, Any] = {"validateAndSerializeUs": serialize_seconds * 1e6, "renderers": {}}
+    for name, cls in renderers.items():
+        body = cls(content).body
+        report["renderers"][name] = {
+            "renderUs": time_per_call(lambda cls=cls: cls(content).body, runs) * 1e6,
+            "bytes": len(body),
+        }
+
+    body = FastJSONResponse(content).body
+    middleware = CompressionMiddleware(app=None)
+    encodings: List[str] = ["gzip"] + (["br"] if brotli is not None else [])
+    report["wire"] = {"identity": {"bytes": len(body), "compressUs": 0.0}}
+    for encoding in encodings:
+        report["wire"][encoding] = {
+            "bytes": len(middleware.compress(body, encoding)),
+            "compressUs": time_per_call(lambda e=encoding: middleware.compress(body, e), runs) * 1e6,
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Response model validation + serialization: {report['validateAndSerializeUs']:.0f} us")
+    print(f"{'renderer':<10}{'render us':>11}{'bytes':>10}")
+    for name, r in report["renderers"].items():
+        print(f"{name:<10}{r['renderUs']:>11.0f}{r['bytes']:>10}")
+    stdlib, fast = report["renderers"]["stdlib"], report["renderers"]["orjson"]
+    base = report["validateAndSerializeUs"]
+    print(f"Per-response CPU: {base + stdlib['renderUs']:.0f} us before, {base + fast['renderUs']:.0f} us with orjson")
+
+    print(f"{'encoding':<10}{'bytes':>10}{'ratio':>8}{'compress us':>13}")
+    identity = report["wire"]["identity"]["bytes"]
+    for name, w in report["wire"].items():
+        print(f"{name:<10}{w['bytes']:>10}{w['bytes'] / identity:>8.0%}{w['compressUs']:>13.0f}")
+    if brotli is None:
+        print("(brotli not installed; pip install Brotli to include it)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lesson response serialization and compression")
+    parser.add_argument("--lesson", help="Path to a stored lesson document (JSON)")
+    parser.add_argument("--sections", type=int, default=6)
+    parser.add_argument("--content-words", type=int, default=300, help="Words per section body")
+    parser.add_argument("--expanded-words", type=int, default=900, help="Words per section expansion (0: none)")
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.lesson:
+        with open(args.lesson, encoding="utf-8") as f:
+            lesson = json.load(f)
+    else:
+        lesson = synthetic_lesson(args.sections, args.content_words, args.expanded_words)
+
+    report = run(lesson_response(lesson), args.runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
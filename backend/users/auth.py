@@ -1,10 +1,14 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
-import requests
 from dotenv import load_dotenv
+from typing import Optional
+import hmac
 import os
 
+from users.jwks import JWKSManager, JWKSUnavailableError
+from users.token_cache import VerifiedTokenCache, TokenRejected
+
 load_dotenv()
 
 # Configuration for Microsoft Entra External ID App Registration
@@ -16,19 +20,38 @@ JWKS_URL = f"https://{TENANT_ID}.ciamlogin.com/{TENANT_ID}/discovery/v2.0/keys"
 
 security = HTTPBearer()
 
-# Cache keys on startup (fine for dev)
-jwks = requests.get(JWKS_URL).json()
+# Operator token for the JSON metrics views; they are disabled when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+metrics_security = HTTPBearer(auto_error=False)
+
+# Signing keys are fetched on the first request and refreshed in the background
+jwks = JWKSManager(JWKS_URL)
+
+# The frontend sends the same token on every request until it expires
+token_cache = VerifiedTokenCache()
 
-def verify_access_token(
+async def verify_access_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
     token = credentials.credentials
 
+    try:
+        cached = token_cache.get(token)
+    except TokenRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if cached is not None:
+        return cached
+
     try:
         header = jwt.get_unverified_header(token)
         kid = header["kid"]
 
-        key = next(k for k in jwks["keys"] if k["kid"] == kid)
+        key = await jwks.get_key(kid)
+        if key is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid signing key",
+            )
 
         payload = jwt.decode(
             token,
@@ -38,15 +61,35 @@ def verify_access_token(
             issuer=ISSUER,
         )
 
+        token_cache.put(token, payload)
         return payload
 
-    except StopIteration:
+    except JWKSUnavailableError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Signing keys are unavailable; try again shortly",
+        )
+    except (JWTError, KeyError) as e:
+        detail = f"Token validation failed: {str(e)}"
+        token_cache.reject(token, status.HTTP_401_UNAUTHORIZED, detail)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid signing key",
+            detail=detail,
         )
-    except JWTError as e:
+
+
+async def verify_metrics_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(metrics_security),
+):
+    """Guard the JSON metrics views, which expose stacks and endpoint details"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+    if credentials is None or not hmac.compare_digest(
+        credentials.credentials.encode(), METRICS_TOKEN.encode()
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Token validation failed: {str(e)}",
+            detail="A valid metrics token is required",
+            headers={"WWW-Authenticate": "Bearer"},
         )
@@ -0,0 +1,119 @@
+"""
+JWKS Manager
+Signing keys of the identity provider, fetched on first use, indexed by kid
+and refreshed in the background
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+from jose import jwk
+from jose.backends.base import Key
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSUnavailableError(Exception):
+    """Raised when no key set has ever been fetched and the provider cannot be reached"""
+
+
+class JWKSManager:
+    """
+    Caches the provider's JSON Web Key Set as parsed keys by kid
+
+    Nothing is fetched until the first token arrives, so startup never
+    waits on (or fails with) the identity provider. Once the set is older
+    than JWKS_REFRESH_SECONDS a refresh starts in the background while the
+    current keys keep serving. A token signed with an unknown kid (the
+    provider rotated its keys) triggers an immediate refresh, at most once
+    per JWKS_MIN_REFRESH_INTERVAL_SECONDS so garbage tokens cannot hammer
+    the provider. A failed refresh keeps the last good set; until a first
+    set has been fetched, requests fail fast between attempts.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.refresh_seconds = float(os.getenv("JWKS_REFRESH_SECONDS", "3600"))
+        self.min_refresh_interval = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL_SECONDS", "30"))
+        self.timeout = float(os.getenv("JWKS_TIMEOUT_SECONDS", "5"))
+
+        self.keys: Dict[str, Key] = {}
+        self.fetched_at: Optional[float] = None
+        self._attempted_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+        self._stats = {"refreshes": 0, "failures": 0, "unknownKid": 0}
+
+    async def get_key(self, kid: str) -> Optional[Key]:
+        """
+        Key for `kid`, or None if the provider does not publish it
+
+        Raises:
+            JWKSUnavailableError: if no key set could ever be fetched
+        """
+        if self.fetched_at is None:
+            await self._refreshed()
+            if self.fetched_at is None:
+                raise JWKSUnavailableError(f"Cannot fetch signing keys from {self.url}")
+        elif time.monotonic() - self.fetched_at > self.refresh_seconds:
+            self._start_refresh()
+
+        key = self.keys.get(kid)
+        if key is None:
+            self._stats["unknownKid"] += 1
+            await self._refreshed()
+            key = self.keys.get(kid)
+        return key
+
+    async def _refreshed(self) -> None:
+        """Wait for a refresh, joining one already running"""
+        task = self._start_refresh()
+        if task is not None:
+            await asyncio.shield(task)
+
+    def _start_refresh(self) -> Optional[asyncio.Task]:
+        """Start a refresh unless one is running or the last attempt was too recent"""
+        loop = asyncio.get_running_loop()
+        if self._refresh is not None and not self._refresh.done() and self._refresh.get_loop() is loop:
+            return self._refresh
+        if time.monotonic() - self._attempted_at < self.min_refresh_interval:
+            return None
+        self._attempted_at = time.monotonic()
+        self._refresh = loop.create_task(self._fetch())
+        return self._refresh
+
+    async def _fetch(self) -> None:
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(self.url)
+                response.raise_for_status()
+                jwks = response.json()
+
+            keys: Dict[str, Key] = {}
+            for entry in jwks.get("keys", []):
+                if "kid" not in entry or entry.get("use", "sig") != "sig":
+                    continue
+                try:
+                    keys[entry["kid"]] = jwk.construct(entry, entry.get("alg", "RS256"))
+                except Exception as e:
+                    logger.warning(f"Skipping unusable JWKS key {entry['kid']}: {e}")
+            if not keys:
+                raise ValueError("key set has no usable signing keys")
+
+            self.keys = keys
+            self.fetched_at = time.monotonic()
+            self._stats["refreshes"] += 1
+            logger.info(f"Loaded {len(keys)} signing key(s) from {self.url}")
+        except Exception as e:
+            # Keep serving the last good set
+            self._stats["failures"] += 1
+            logger.error(f"JWKS refresh from {self.url} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self.keys),
+            "ageSeconds": round(time.monotonic() - self.fetched_at, 1) if self.fetched_at is not None else None,
+            **self._stats,
+        }
@@ -0,0 +1,112 @@
+"""
+Verified Token Cache
+Claims of recently verified bearer tokens, so repeat requests skip signature
+verification
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class TokenRejected(Exception):
+    """A cached rejection; carries the original status and detail"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of verified claims keyed by the token's SHA-256
+
+    A verified token is served from the cache until
+    AUTH_TOKEN_CACHE_EXPIRY_MARGIN_SECONDS before its `exp`, so an expired
+    token is never accepted. A rejected token is remembered for
+    AUTH_TOKEN_NEGATIVE_TTL_SECONDS so a client retrying a bad token does
+    not cost a verification each time. Only the hash is stored, never the
+    token itself.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+        self.expiry_margin = float(os.getenv("AUTH_TOKEN_CACHE_EXPIRY_MARGIN_SECONDS", "30"))
+        self.negative_ttl = float(os.getenv("AUTH_TOKEN_NEGATIVE_TTL_SECONDS", "60"))
+
+        # hash → (valid until as epoch seconds, claims or the rejection)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negativeHits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Cached claims for `token`, or None if it must be verified
+
+        Raises:
+            TokenRejected: if the token was rejected recently
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            if isinstance(entry[1], TokenRejected):
+                self._stats["negativeHits"] += 1
+                raise entry[1]
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        expires = claims.get("exp")
+        if not isinstance(expires, (int, float)):
+            return
+        self._store(token, expires - self.expiry_margin, claims)
+
+    def reject(self, token: str, status_code: int, detail: str) -> None:
+        self._store(token, time.time() + self.negative_ttl, TokenRejected(status_code, detail))
+
+    def _store(self, token: str, until: float, value: Any) -> None:
+        if self.max_entries <= 0 or until <= time.time():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (until, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    # ==================== METRICS ====================
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["negativeHits"] + self._stats["misses"]
+            hit_rate = (self._stats["hits"] + self._stats["negativeHits"]) / lookups if lookups else 0.0
+            return {"size": len(self._entries), **self._stats, "hitRate": hit_rate}
+
+    def prometheus(self) -> str:
+        """Cache counters in Prometheus text format"""
+        stats = self.stats()
+        lines: List[str] = [
+            "# HELP auth_token_cache_lookups_total Bearer token cache lookups by result",
+            "# TYPE auth_token_cache_lookups_total counter",
+            f'auth_token_cache_lookups_total{{result="hit"}} {stats["hits"]}',
+            f'auth_token_cache_lookups_total{{result="negative_hit"}} {stats["negativeHits"]}',
+            f'auth_token_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+            "# HELP auth_token_cache_entries Verified and rejected tokens cached",
+            "# TYPE auth_token_cache_entries gauge",
+            f"auth_token_cache_entries {stats['size']}",
+        ]
+        return "\n".join(lines) + "\n"